@@ -1,6 +1,6 @@
 from .client import EventClient
-from .session import EventSession
+from .session import BulkPublishError, BulkPublishResult, EventSession
 
-__all__ = ["EventClient", "EventSession"]
+__all__ = ["BulkPublishError", "BulkPublishResult", "EventClient", "EventSession"]
 
 __version__ = "0.4.0"
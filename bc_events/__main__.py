@@ -0,0 +1,78 @@
+import argparse
+import logging
+import sys
+
+from .client import EventClient
+from .replay import ReplayCheckpoint, replay
+from .topic_cache import build_topic_cache
+
+
+def build_cache(args):
+    with open(args.topic_definitions, "rb") as topic_file:
+        content = topic_file.read()
+
+    cache_path, _, topic_table = build_topic_cache(content, args.cache_dir)
+    print("Cached {0} topics in {1}".format(len(topic_table), cache_path))
+
+
+def replay_events(args):
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    client = EventClient(args.api_url, args.service_name, args.topic_definitions, pool_size=max(args.concurrency, 10))
+    checkpoint = ReplayCheckpoint(args.checkpoint)
+
+    try:
+        replay(
+            client,
+            args.topic_definitions,
+            args.inputs,
+            checkpoint=checkpoint,
+            workers=args.workers,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            use_mmap=not args.no_mmap,
+        )
+    except Exception as e:
+        print("Replay stopped after {0} events: {1}".format(checkpoint.published, e), file=sys.stderr)
+        if args.checkpoint:
+            print("Run the same command again to resume from {0}".format(args.checkpoint), file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+
+    print(
+        "Replayed {0} events, skipped {1} invalid lines and {2} duplicate events, {3} events were rejected".format(
+            checkpoint.published, checkpoint.invalid, checkpoint.duplicates, checkpoint.rejected
+        )
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bc_events", description="bc-events command line tools")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    build_cache_parser = commands.add_parser(
+        "build-cache", help="Pre-build the compiled topic table cache, e.g. at deploy time"
+    )
+    build_cache_parser.add_argument("topic_definitions", help="Path to the topic definitions yaml")
+    build_cache_parser.add_argument("--cache-dir", required=True, help="Directory to write the cache to")
+    build_cache_parser.set_defaults(func=build_cache)
+
+    replay_parser = commands.add_parser("replay", help="Re-publish events from JSONL or NDJSON.gz files")
+    replay_parser.add_argument("topic_definitions", help="Path to the topic definitions yaml")
+    replay_parser.add_argument("inputs", nargs="+", help="JSONL or NDJSON.gz files of events, replayed in order")
+    replay_parser.add_argument("--api-url", required=True, help="Base url of the Events API")
+    replay_parser.add_argument("--service-name", default="bc-events-replay", help="Service name to publish as")
+    replay_parser.add_argument("--checkpoint", help="File to save progress to, and resume from")
+    replay_parser.add_argument("--workers", type=int, help="Processes validating events (default: one per CPU)")
+    replay_parser.add_argument("--concurrency", type=int, default=4, help="Bulk requests sent at once")
+    replay_parser.add_argument("--batch-size", type=int, default=5000, help="Lines per batch and checkpoint")
+    replay_parser.add_argument("--no-mmap", action="store_true", help="Stream plain files instead of mapping them")
+    replay_parser.set_defaults(func=replay_events)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
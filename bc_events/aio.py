@@ -0,0 +1,431 @@
+"""asyncio counterparts of the client, session, event and retrying wrapper.
+
+Requires the optional ``aiohttp`` dependency (``pip install bc-events[async]``).
+"""
+import asyncio
+import itertools
+import time
+from collections import deque
+
+import aiohttp
+from tenacity import AsyncRetrying, retry_if_exception_type, retry_if_result
+
+from .client import EventClient
+from .event import Event
+from .session import (
+    MAX_BULK_BYTES,
+    MAX_BULK_EVENTS,
+    BulkPublishError,
+    BulkPublishResult,
+    EventSession,
+)
+from .utils import EventsApiRetryingWrapper
+
+
+class ApiResponse(object):
+    def __init__(self, status_code, body):
+        """A fully read API response
+
+        Mirrors the parts of `requests.Response` used by `EventsApiRetryingWrapper`,
+        so the same retry logic can inspect it after the connection has been released.
+
+        Parameters
+        ----------
+        status_code : int
+            HTTP status code of the response
+        body : object
+            The decoded json body of the response
+        """
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def __repr__(self):
+        return "ApiResponse(status_code=%r, body=%r)" % (self.status_code, self.body)
+
+
+class AsyncEventsApiRetryingWrapper(EventsApiRetryingWrapper):
+    async def post(self):
+        data, headers = self.request()
+        self._decoded = None
+
+        if self.limiter is not None:
+            delay = self.limiter.try_acquire()
+            while delay:
+                await asyncio.sleep(delay)
+                delay = self.limiter.try_acquire()
+
+        start = time.perf_counter()
+        api_response = None
+        try:
+            async with self.session.post(self.url, data=data, headers=headers) as response:
+                body = await response.json(content_type=None)
+                api_response = ApiResponse(response.status, body)
+                return api_response
+        finally:
+            self.record_request(start, api_response)
+
+    async def invoke(self):
+        retryer = AsyncRetrying(
+            **self.retrying_options(
+                retry_if_exception_type(asyncio.TimeoutError)
+                | retry_if_exception_type(aiohttp.ClientConnectionError)
+                | retry_if_result(self.retry_if_we_need_to)
+            )
+        )
+        if self.metrics is None and self.stats is None:
+            return self.check_budget(await retryer(self.post))
+
+        total = self.event_count()
+        start = time.perf_counter()
+        try:
+            response = await retryer(self.post)
+        except Exception:
+            self.record_outcome(total, start)
+            raise
+        self.record_outcome(total, start, response)
+        return self.check_budget(response)
+
+
+class AsyncEvent(Event):
+    __slots__ = ()
+
+    async def publish(self):
+        """Publishes this event to the API if it is valid
+
+        If no url has been set on the client, we assume local development, and only log the event.
+        We validate the event before sending it to catch schema mismatch in development.
+        """
+
+        self.validate()
+
+        client = self.session.client
+        client.event_logger.publishing_event(self)
+
+        if client.publish_url and client._unacknowledged([self]):
+            headers = {"x-britecore-job-id": self.session.job_id}
+            events_api = client._events_api(client.publish_url, self.encoded, headers=headers)
+            try:
+                await events_api.invoke()
+            finally:
+                client._acknowledge([self], events_api)
+
+
+class AsyncEventSession(EventSession):
+    """An EventSession whose publishing methods are coroutines
+
+    `publish` and the shortcut methods must be awaited, since they may publish immediately.
+    """
+
+    __slots__ = ()
+
+    event_class = AsyncEvent
+
+    async def flush(self):
+        """Flushes events from the queue to the API
+
+        This allows us to build up events over a session and only send them
+        if the session's context is successful.
+        """
+
+        if self.client.publish_policy.use_bulk(len(self.events), self.client):
+            await self.publish_bulk(self.events)
+        else:
+            await self.publish_each(self.events)
+
+    async def _publish(self, topic, data):
+        """Internal method for publishing data to a topic
+
+        Parameters
+        ----------
+        topic : Topic
+            The Topic object to which we will publish this event
+        data : dict
+            The data payload for the event
+        """
+
+        if self.publish_immediately:
+            await self.event_class(topic=topic, data=data, session=self).publish()
+        elif self.columnar:
+            self.events.add(topic, data)
+        else:
+            self.events.append(self.event_class(topic=topic, data=data, session=self))
+
+    async def publish_each(self, events, concurrency=None):
+        """Publish events one at a time, with up to `concurrency` in flight
+
+        Parameters
+        ----------
+        events : list
+            A list of events to publish
+        concurrency : int, optional
+            Maximum number of events in flight at once
+            (the default is None, which uses the client's `single_concurrency`)
+        """
+
+        semaphore = asyncio.Semaphore(max(concurrency or self.client.single_concurrency, 1))
+
+        async def publish_event(event):
+            async with semaphore:
+                await event.publish()
+
+        outcomes = await asyncio.gather(*[publish_event(event) for event in events], return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                raise outcome
+
+    async def publish_bulk(self, events, concurrency=None):
+        """Publish all events
+
+        Events are packed into chunks by count and encoded size, with up to `concurrency` chunks in flight.
+
+        Parameters
+        ----------
+        events : list
+            A list of events to publish
+        concurrency : int, optional
+            Maximum number of chunks in flight at once
+            (the default is None, which uses the client's `bulk_concurrency`)
+
+        Raises
+        ------
+        BulkPublishError
+            If any chunk fails to publish
+
+        Returns
+        -------
+        BulkPublishResult
+            The aggregate outcome of every chunk
+        """
+
+        concurrency = concurrency or self.client.bulk_concurrency
+        chunks = list(self.client._chunk_events(events))
+
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def publish_chunk(chunk):
+            async with semaphore:
+                return await self.client._send_bulk_chunk(chunk)
+
+        outcomes = await asyncio.gather(*[publish_chunk(chunk) for chunk in chunks], return_exceptions=True)
+
+        result = BulkPublishResult()
+        for index, (chunk, outcome) in enumerate(zip(chunks, outcomes)):
+            if isinstance(outcome, Exception):
+                result.failures.append((index, chunk, outcome))
+            else:
+                result.add_chunk(chunk, outcome)
+
+        if result.failures:
+            raise BulkPublishError(result)
+
+        return result
+
+    async def publish_stream(self, items, concurrency=None, max_in_flight=None):
+        """Validate and publish events in bulk as they are read from an iterable
+
+        Accepts async iterables as well as regular ones. See `EventSession.publish_stream`.
+
+        Parameters
+        ----------
+        items : {iterable, async iterable}
+            `Event` objects, or (topic, data) pairs where topic is a `Topic` or a topic name
+        concurrency : int, optional
+            Maximum number of chunks sent at once
+            (the default is None, which uses the client's `bulk_concurrency`)
+        max_in_flight : int, optional
+            Maximum number of chunks sent or waiting to be sent before reading more events
+            (the default is None, which uses `concurrency`)
+
+        Raises
+        ------
+        BulkPublishError
+            If any chunk fails, or reading stops early, e.g. because a topic name doesn't match a topic
+            or an event doesn't validate. Chunks read before that are still sent. Its `result` holds the
+            outcome of every chunk that was attempted, and a failure with no events for the read error.
+
+        Returns
+        -------
+        BulkPublishResult
+            The number of events published, and any chunk failures
+        """
+
+        concurrency = concurrency or self.client.bulk_concurrency
+        max_in_flight = max(max_in_flight or concurrency, 1)
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        result = BulkPublishResult()
+        in_flight = deque()
+        indexes = itertools.count()
+
+        async def publish_chunk(chunk):
+            async with semaphore:
+                return await self.client._send_bulk_chunk(chunk)
+
+        async def collect(index, chunk, task):
+            try:
+                outcome = await task
+            except Exception as e:
+                result.failures.append((index, chunk, e))
+            else:
+                result.add_chunk(chunk, outcome, keep_response=False)
+
+        async def send(chunk):
+            if len(in_flight) >= max_in_flight:
+                await collect(*in_flight.popleft())
+            in_flight.append((next(indexes), chunk, asyncio.ensure_future(publish_chunk(chunk))))
+
+        read_error = None
+        try:
+            if hasattr(items, "__aiter__"):
+                async for batch in iterate_batches(items, self.client.max_bulk_events):
+                    for chunk in self.client._chunk_events(self._stream_events(batch)):
+                        await send(chunk)
+            else:
+                for chunk in self.client._chunk_events(self._stream_events(items)):
+                    await send(chunk)
+        except Exception as e:
+            read_error = e
+        finally:
+            while in_flight:
+                await collect(*in_flight.popleft())
+
+        if read_error is not None:
+            result.failures.append((next(indexes), [], read_error))
+        if result.failures:
+            raise BulkPublishError(result) from result.failures[0][2]
+
+        return result
+
+
+async def iterate_batches(items, size):
+    """Reads an async iterable in lists of up to `size` items
+
+    Parameters
+    ----------
+    items : async iterable
+        The items to read
+    size : int
+        Most items in a batch
+
+    Yields
+    ------
+    list
+        The next batch of items
+    """
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class AsyncEventClient(EventClient):
+    """An EventClient for asyncio applications
+
+    Spawns `AsyncEventSession` objects and sends events over a pooled `aiohttp` session,
+    which is created on first use inside the running event loop. Use `await client.close()`,
+    or `async with`, to release its connections.
+    """
+
+    def __init__(
+        self,
+        api_url,
+        service_name,
+        topic_definitions,
+        pool_size=10,
+        bulk_concurrency=1,
+        max_bulk_events=MAX_BULK_EVENTS,
+        max_bulk_bytes=MAX_BULK_BYTES,
+        metrics=None,
+        limiter=None,
+        compression=None,
+        compression_threshold=1024,
+        compression_level=None,
+        publish_policy=None,
+        single_concurrency=1,
+        events_path="/events",
+        bulk_events_path="/events/bulk/",
+        deduplicate=True,
+        ack_cache_size=100000,
+        ack_cache_ttl=600.0,
+    ):
+        super().__init__(
+            api_url,
+            service_name,
+            topic_definitions,
+            pool_size=pool_size,
+            bulk_concurrency=bulk_concurrency,
+            max_bulk_events=max_bulk_events,
+            max_bulk_bytes=max_bulk_bytes,
+            metrics=metrics,
+            limiter=limiter,
+            compression=compression,
+            compression_threshold=compression_threshold,
+            compression_level=compression_level,
+            publish_policy=publish_policy,
+            single_concurrency=single_concurrency,
+            events_path=events_path,
+            bulk_events_path=bulk_events_path,
+            deduplicate=deduplicate,
+            ack_cache_size=ack_cache_size,
+            ack_cache_ttl=ack_cache_ttl,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _build_http_session(self):
+        # aiohttp sessions must be created inside a running event loop, see _events_api
+        return None
+
+    async def close(self):
+        """Closes any pooled connections held by this client."""
+        if self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
+
+    def _session(self, actor_id, actor_type, job_id, outbox=None):
+        self._check_fork()
+        return AsyncEventSession(actor_id=actor_id, actor_type=actor_type, job_id=job_id, client=self, outbox=outbox)
+
+    def _events_api(self, url, payload, headers={}):
+        if self.http_session is None or self.http_session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.http_session = aiohttp.ClientSession(connector=connector)
+
+        return AsyncEventsApiRetryingWrapper(
+            url,
+            payload,
+            headers=headers,
+            session=self.http_session,
+            metrics=self.metrics,
+            limiter=self.limiter,
+            compressor=self.compressor,
+            stats=self._endpoint_stats(url),
+        )
+
+    async def _publish_bulk_chunk(self, events):
+        return (await self._send_bulk_chunk(events))[0]
+
+    async def _send_bulk_chunk(self, events, headers={}):
+        self.event_logger.publishing_events(events)
+
+        events = self._unacknowledged(events)
+        if not self.publish_bulk_url or not events:
+            return None, 0, 0
+
+        bulk_api = self._events_api(self.publish_bulk_url, [event.encoded for event in events], headers=headers)
+        try:
+            response = await bulk_api.invoke()
+        finally:
+            self._acknowledge(events, bulk_api)
+        undelivered = len(bulk_api.undelivered())
+        return response, len(events) - undelivered, undelivered
@@ -0,0 +1,122 @@
+import uuid
+from array import array
+
+EVENT_ID_BYTES = 16
+
+
+class EventBuffer(object):
+    __slots__ = (
+        "session",
+        "_topics",
+        "_topic_indexes",
+        "_topic_ids",
+        "_data",
+        "_event_ids",
+        "_other_event_ids",
+        "_events",
+    )
+
+    def __init__(self, session):
+        """Creates a new EventBuffer
+
+        A compact, columnar queue of a session's events. Instead of one `Event` object per event,
+        it keeps each event's topic as a small integer index in an array, with the payloads in a
+        parallel list. Event IDs are kept as 16 raw bytes each and only hex encoded when read back,
+        and `Event` objects are only built when events are first read back. Later reads hand back the
+        same objects, so each event's request json and encoding are still only built once.
+
+        Parameters
+        ----------
+        session : EventSession
+            The session the queued events belong to
+        """
+        self.session = session
+        self._topics = []
+        self._topic_indexes = {}
+        self._topic_ids = array("I")
+        self._data = []
+        self._event_ids = bytearray()
+        # IDs that aren't 32 hex digits, like ones read back from elsewhere, keyed by index
+        self._other_event_ids = {}
+        # Events built by reads, keyed by index
+        self._events = {}
+
+    def __repr__(self):
+        return "EventBuffer(session=%r, events=%r)" % (self.session, len(self))
+
+    def __len__(self):
+        return len(self._data)
+
+    def _event(self, index):
+        event = self._events.get(index)
+        if event is None:
+            event = self._events[index] = self.session.event_class(
+                topic=self._topics[self._topic_ids[index]],
+                data=self._data[index],
+                session=self.session,
+                event_id=self._event_id(index),
+            )
+        return event
+
+    def _event_id(self, index):
+        event_id = self._other_event_ids.get(index)
+        if event_id is None:
+            start = index * EVENT_ID_BYTES
+            event_id = self._event_ids[start : start + EVENT_ID_BYTES].hex()
+        return event_id
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._event(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("event index out of range")
+        return self._event(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._event(index)
+
+    def add(self, topic, data, event_id=None):
+        """Queues an event without building an `Event` object
+
+        Parameters
+        ----------
+        topic : Topic
+            The Topic object to which this event will publish
+        data : dict
+            The data payload for the event
+        event_id : str, optional
+            The event's ID (the default is None, which generates a new ID)
+        """
+        topic_index = self._topic_indexes.get(topic.name)
+        if topic_index is None:
+            topic_index = self._topic_indexes[topic.name] = len(self._topics)
+            self._topics.append(topic)
+
+        self._topic_ids.append(topic_index)
+        self._data.append(data)
+        if event_id is None:
+            self._event_ids += uuid.uuid4().bytes
+            return
+
+        try:
+            raw_id = bytes.fromhex(event_id)
+        except ValueError:
+            raw_id = b""
+        if len(raw_id) != EVENT_ID_BYTES or raw_id.hex() != event_id:
+            self._other_event_ids[len(self._data) - 1] = event_id
+            raw_id = bytes(EVENT_ID_BYTES)
+        self._event_ids += raw_id
+
+    def append(self, event):
+        """Queues an existing event
+
+        Parameters
+        ----------
+        event : Event
+            The event to queue
+        """
+        self.add(event.topic, event.data, event.event_id)
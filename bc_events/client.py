@@ -1,18 +1,83 @@
-import yaml
+import logging
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
-from .constants import ACTOR_TYPE_SERVICE, ACTOR_TYPE_THIRD_PARTY, ACTOR_TYPE_USER
-from .session import EventSession
-from .topic import Topic
-from .utils import build_topic_name
+import requests
+from tenacity import RetryError
+
+from .coalescer import FlushCoalescer
+from .compression import BodyCompressor
+from .constants import ACTOR_TYPE_SERVICE, ACTOR_TYPE_THIRD_PARTY, ACTOR_TYPE_USER, BACKPRESSURE_BLOCK
+from .dedup import AckCache
+from .dispatcher import BackgroundDispatcher
+from .logs import EventLogger
+from .policy import EndpointStats, ThresholdPublishPolicy
+from .session import MAX_BULK_BYTES, MAX_BULK_EVENTS, EventSession
+from .spool import SpoolReplayer
+from .topic_cache import build_topic_table, load_topic_table
+from .utils import EventsApiRetryingWrapper, build_http_session, build_topic_name, chunk_events
+
+logger = logging.getLogger("bc.events")
+
+# Clients to reset in forked children, see EventClient._after_fork
+_clients = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for client in list(_clients):
+        client._check_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
 
 
 class EventClient(object):
-    def __init__(self, api_url, service_name, topic_definitions):
+    def __init__(
+        self,
+        api_url,
+        service_name,
+        topic_definitions,
+        pool_size=10,
+        bulk_concurrency=1,
+        max_bulk_events=MAX_BULK_EVENTS,
+        max_bulk_bytes=MAX_BULK_BYTES,
+        background_dispatch=False,
+        max_queue_size=10000,
+        max_batch_size=MAX_BULK_EVENTS,
+        linger=0.05,
+        backpressure=BACKPRESSURE_BLOCK,
+        spool=None,
+        spool_replay_interval=30.0,
+        topic_cache_dir=None,
+        log_payloads=True,
+        log_sample_rate=1.0,
+        metrics=None,
+        limiter=None,
+        compression=None,
+        compression_threshold=1024,
+        compression_level=None,
+        coalesce=False,
+        coalesce_linger=0.005,
+        publish_policy=None,
+        single_concurrency=1,
+        events_path="/events",
+        bulk_events_path="/events/bulk/",
+        deduplicate=True,
+        ack_cache_size=100000,
+        ack_cache_ttl=600.0,
+    ):
         """Top-level Client class to configure service events and spawn sessions.
 
         Holds service-level configuration, including all topics generated by the service.
         This configuration is then passed on to sessions that are spawned from this client.
 
+        Clients are safe to create before forking, as prefork servers like gunicorn and Celery do.
+        A forked child rebuilds the client's connection pool and restarts its background workers,
+        but keeps the parsed topic table and compiled validators it shares with the parent.
+
         Parameters
         ----------
         api_url : str, optional
@@ -23,20 +88,240 @@ class EventClient(object):
         topic_definitions : {str, file, dict}
             Topic definitions for the service. This can be a file path, a file object, or a dict.
             This file should be the same file you use to create your topics in CloudFormation.
+        pool_size : int, optional
+            Maximum number of keep-alive connections to the API shared by all sessions
+            (the default is 10)
+        bulk_concurrency : int, optional
+            Maximum number of bulk chunks sessions send in parallel (the default is 1)
+        max_bulk_events : int, optional
+            Maximum number of events in one bulk request (the default is MAX_BULK_EVENTS)
+        max_bulk_bytes : int, optional
+            Maximum size in bytes of one bulk request's json body (the default is MAX_BULK_BYTES)
+        background_dispatch : bool, optional
+            Send flushed events from a worker thread instead of the calling thread.
+            Call `close` on shutdown to drain queued events. (the default is False)
+        max_queue_size : int, optional
+            Maximum number of events waiting for the background worker (the default is 10000)
+        max_batch_size : int, optional
+            Maximum number of events the background worker sends per bulk request
+            (the default is MAX_BULK_EVENTS)
+        linger : float, optional
+            Seconds the background worker waits for a batch to fill up (the default is 0.05)
+        backpressure : {'block', 'drop-oldest', 'raise'}, optional
+            What flushing does when the background queue is full (the default is 'block')
+        spool : EventSpool, optional
+            A durable spool for events that still fail after retrying. Spooled events are replayed
+            in bulk from a worker thread. (the default is None, which raises undeliverable events)
+        spool_replay_interval : float, optional
+            Seconds between attempts to replay the spool (the default is 30.0)
+        topic_cache_dir : str, optional
+            Directory of compiled topic tables, keyed by a hash of the topic definitions.
+            Build it at deploy time with ``python -m bc_events build-cache``. A missing cache
+            is built and written on first load. (the default is None, which always parses the yaml)
+        log_payloads : bool, optional
+            Include full event payloads in publish log records. When False, bulk publishes log
+            a summary instead. (the default is True)
+        log_sample_rate : float, optional
+            Fraction of publish log records to emit (the default is 1.0)
+        metrics : InProcessMetrics, optional
+            Recorder for publish counters and latency histograms, see `bc_events.metrics`
+            (the default is None, which records nothing)
+        limiter : AdaptiveRateLimiter, optional
+            Paces requests from every session and thread sharing this client, backing off when the API
+            throttles, and limits retries to a budget (the default is None, which sends requests unpaced)
+        compression : {'gzip', 'zstd'}, optional
+            Compress request bodies, sending them with a Content-Encoding header. zstd requires the
+            optional ``zstandard`` dependency. (the default is None, which sends bodies uncompressed)
+        compression_threshold : int, optional
+            Smallest request body in bytes that is compressed (the default is 1024)
+        compression_level : int, optional
+            Compression level (the default is None, which uses 6 for gzip and 3 for zstd)
+        coalesce : bool, optional
+            Merge events flushed by concurrent sessions into shared bulk requests. Flushing still waits
+            for the session's events to be sent. (the default is False)
+        coalesce_linger : float, optional
+            Seconds a flush waits for others to share its bulk request. Every flush waits this long,
+            even when no other session joins it. (the default is 0.005)
+        publish_policy : {AdaptivePublishPolicy, ThresholdPublishPolicy}, optional
+            Decides whether flushing publishes events one at a time or in bulk. The client measures each
+            endpoint's latency and success rate for an `AdaptivePublishPolicy` to use. (the default is None,
+            which uses a `ThresholdPublishPolicy`)
+        single_concurrency : int, optional
+            Maximum number of events a flush publishes one at a time in parallel. Above 1, events may
+            reach the API out of order. (the default is 1, which sends them in order)
+        events_path : str, optional
+            Path of the endpoint for single events, relative to the api url (the default is '/events')
+        bulk_events_path : str, optional
+            Path of the bulk endpoint, relative to the api url (the default is '/events/bulk/')
+        deduplicate : bool, optional
+            Remember the IDs of events the API has acknowledged, and skip them if they are sent again,
+            e.g. by flushing a session twice or replaying a spool (the default is True)
+        ack_cache_size : int, optional
+            Most acknowledged event IDs remembered at once (the default is 100000)
+        ack_cache_ttl : float, optional
+            Seconds an acknowledged event ID is remembered for (the default is 600.0)
         """
 
         self.api_url = api_url
-        self.publish_url = api_url + "/events" if api_url else None
-        self.publish_bulk_url = self.publish_url + "/bulk/" if api_url else None
+        self.publish_url = api_url + events_path if api_url else None
+        self.publish_bulk_url = api_url + bulk_events_path if api_url else None
+
+        self.publish_policy = publish_policy if publish_policy is not None else ThresholdPublishPolicy()
+        self.single_concurrency = single_concurrency
+        self.publish_stats = EndpointStats()
+        self.publish_bulk_stats = EndpointStats()
+        self.ack_cache = AckCache(max_size=ack_cache_size, ttl=ack_cache_ttl) if deduplicate else None
 
         self.service_name = service_name
+        self.event_logger = EventLogger(log_payloads=log_payloads, sample_rate=log_sample_rate)
+        self.metrics = metrics
+        self.limiter = limiter
+        self.compressor = None
+        if compression is not None:
+            self.compressor = BodyCompressor(compression, threshold=compression_threshold, level=compression_level)
+
+        self.pool_size = pool_size
+        self.http_session = self._build_http_session()
+        self.topic_cache_dir = topic_cache_dir
+        self.bulk_concurrency = bulk_concurrency
+        self._executor = None
+        self._executor_workers = 0
+        self._executor_lock = threading.Lock()
+        self.max_bulk_events = max_bulk_events
+        self.max_bulk_bytes = max_bulk_bytes
 
         self._load_topic_definitions(topic_definitions)
 
+        self.dispatcher = None
+        if background_dispatch:
+            self.dispatcher = BackgroundDispatcher(
+                self,
+                max_queue_size=max_queue_size,
+                max_batch_size=max_batch_size,
+                linger=linger,
+                backpressure=backpressure,
+            )
+            self.dispatcher.start()
+
+        self.coalescer = None
+        if coalesce:
+            self.coalescer = FlushCoalescer(self, linger=coalesce_linger, max_batch_size=max_bulk_events)
+
+        self.spool = spool
+        self.spool_replayer = None
+        if spool is not None and self.publish_bulk_url:
+            self.spool_replayer = SpoolReplayer(self, spool, interval=spool_replay_interval)
+            self.spool_replayer.start()
+
+        self._pid = os.getpid()
+        _clients.add(self)
+
+    def _build_http_session(self):
+        """Builds the pooled HTTP session shared by all sessions spawned from this client
+
+        Returns
+        -------
+        requests.Session
+            A keep-alive session with up to `pool_size` connections per host
+        """
+        return build_http_session(self.pool_size)
+
+    def _check_fork(self):
+        """Resets this client if the process has forked since it was created
+
+        Called in the child right after a fork, and as a fallback where `os.register_at_fork`
+        isn't available, whenever a session is created.
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._after_fork()
+
+    def _after_fork(self):
+        """Rebuilds the state a forked child can't share with its parent
+
+        Pooled connections are replaced, without closing the parent's sockets. Background workers
+        are restarted, and locks are replaced since they may have been held by a thread that didn't
+        survive the fork. The topic table and validators are kept.
+        """
+        self.http_session = self._build_http_session()
+        # The parent's worker threads don't exist here
+        self._executor = None
+        self._executor_workers = 0
+        self._executor_lock = threading.Lock()
+
+        for component in (
+            self.metrics,
+            self.limiter,
+            self.spool,
+            self.dispatcher,
+            self.spool_replayer,
+            self.coalescer,
+            self.publish_stats,
+            self.publish_bulk_stats,
+            self.ack_cache,
+        ):
+            after_fork = getattr(component, "_after_fork", None)
+            if after_fork is not None:
+                after_fork()
+
+    def close(self, timeout=5.0):
+        """Drains any background dispatcher, seals any spool and closes pooled connections held by this client.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for queued events to be sent (the default is 5.0)
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.shutdown(timeout)
+        if self.spool_replayer is not None:
+            self.spool_replayer.stop(timeout)
+        if self.spool is not None:
+            self.spool.close()
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+        # A worker still sending past the deadline would have its connections closed under it
+        if self.dispatcher is not None and self.dispatcher.is_alive():
+            logger.warning("Dispatcher is still sending, leaving its connections open")
+            return
+        self.http_session.close()
+
+    def _publish_executor(self, concurrency):
+        """The thread pool sessions publish in parallel with, created on first use
+
+        Each call bounds its own requests in flight, so the pool has at least a thread per pooled
+        connection, and grows when a call asks for more than it has. Threads are only started as needed.
+
+        Parameters
+        ----------
+        concurrency : int
+            Number of requests the caller will have in flight at once
+
+        Returns
+        -------
+        ThreadPoolExecutor
+            A pool with at least `concurrency` threads
+        """
+        workers = max(concurrency, self.pool_size, 1)
+        with self._executor_lock:
+            if self._executor is None or self._executor_workers < workers:
+                if self._executor is not None:
+                    # Work already submitted to the smaller pool still finishes
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bc-events-publish")
+                self._executor_workers = workers
+            return self._executor
+
     def _load_topic_definitions(self, topic_definitions):
         """Loads a topic definitions file into a lookup table.
 
         Loads and/or parses yaml files, or uses an already-loaded dict.
+        Yaml is parsed with libyaml when it is available, or read from the compiled
+        topic cache if the client has a `topic_cache_dir`.
 
         Parameters
         ----------
@@ -82,33 +367,26 @@ class EventClient(object):
                       description: Name of the test
         """
 
-        loaded_definitions = topic_definitions
-
         if isinstance(topic_definitions, str):
             # We need to open the file and parse yaml
-            with open(topic_definitions) as topic_file:
-                loaded_definitions = yaml.load(topic_file)
+            with open(topic_definitions, "rb") as topic_file:
+                content = topic_file.read()
+            self.default_category, self.topic_table = load_topic_table(content, self.topic_cache_dir)
 
         elif hasattr(topic_definitions, "read"):
             # Already an open file, just load it
-            loaded_definitions = yaml.load(topic_definitions)
-
-        topics = loaded_definitions["Topics"]
+            self.default_category, self.topic_table = load_topic_table(topic_definitions.read(), self.topic_cache_dir)
 
-        self.default_category = loaded_definitions.get("DefaultCategory")
+        else:
+            self.default_category, self.topic_table = build_topic_table(topic_definitions)
 
-        self.topic_table = {}
+        # Topics keyed by (category, entity, action), so lookups don't need to format a name
+        self.topic_index = {(topic.category, topic.entity, topic.action): topic for topic in self.topic_table.values()}
 
-        for topic_definition in topics:
-            topic = Topic(
-                category=topic_definition.get("Category", self.default_category),
-                entity=topic_definition["Entity"],
-                action=topic_definition["Action"],
-                schema=topic_definition["Schema"],
-            )
-            self.topic_table[topic.name] = topic
+        # Session shortcut names resolved to a topic so far, see resolve_shortcut
+        self._shortcuts = {}
 
-    def _session(self, actor_id, actor_type, job_id):
+    def _session(self, actor_id, actor_type, job_id, outbox=None):
         """Internal factory method for generating an EventSession
 
         Creates an EventSession with self as the client
@@ -121,45 +399,244 @@ class EventClient(object):
             The type of actor.
         job_id : str
             A correlation ID to link requests from different services.
+        outbox : EventOutbox, optional
+            Transactional outbox the session writes its events to on flush (the default is None)
 
         Returns
         -------
         EventSession
             An event session with self as the client
         """
-        return EventSession(actor_id=actor_id, actor_type=actor_type, job_id=job_id, client=self)
+        self._check_fork()
+        return EventSession(actor_id=actor_id, actor_type=actor_type, job_id=job_id, client=self, outbox=outbox)
+
+    def _events_api(self, url, payload, headers={}):
+        """Internal factory method for generating an EventsApiRetryingWrapper
+
+        Requests made through the wrapper are sent over this client's pooled HTTP session.
+
+        Parameters
+        ----------
+        url : str
+            The API url to post to
+        payload : {dict, list, bytes}
+            The json payload to post. Either a json serializable object,
+            pre-encoded json bytes, or a list of pre-encoded events to send as a json array
+        headers : dict, optional
+            Extra headers to send with the request
+
+        Returns
+        -------
+        EventsApiRetryingWrapper
+            A retrying wrapper that sends through this client's connection pool
+        """
+        return EventsApiRetryingWrapper(
+            url,
+            payload,
+            headers=headers,
+            session=self.http_session,
+            metrics=self.metrics,
+            limiter=self.limiter,
+            compressor=self.compressor,
+            stats=self._endpoint_stats(url),
+        )
+
+    def _endpoint_stats(self, url):
+        """Gets the measurements kept for an endpoint
 
-    def service_session(self, job_id):
+        Parameters
+        ----------
+        url : str
+            The endpoint's url
+
+        Returns
+        -------
+        EndpointStats
+            The endpoint's measurements, or None if the url isn't one of the client's endpoints
+        """
+        if url == self.publish_url:
+            return self.publish_stats
+        if url == self.publish_bulk_url:
+            return self.publish_bulk_stats
+        return None
+
+    def _invoke(self, events_api):
+        """Invokes an EventsApiRetryingWrapper, spooling whatever is left if it fails
+
+        Parameters
+        ----------
+        events_api : EventsApiRetryingWrapper
+            The wrapper to invoke. Its payload must be pre-encoded.
+
+        Raises
+        ------
+        requests.exceptions.RequestException
+            If the request failed and this client has no spool
+        tenacity.RetryError
+            If retrying gave up and this client has no spool
+        Exception
+            Anything else the wrapper raised, which is never spooled
+
+        Returns
+        -------
+        requests.Response
+            The API response, or None if the payload was spooled
+        """
+        try:
+            return events_api.invoke()
+        except (requests.exceptions.RequestException, RetryError):
+            if self.spool is None:
+                raise
+
+            # After partial failures the payload only holds the records that still need sending
+            payload = events_api.payload
+            encoded_events = payload if isinstance(payload, list) else [payload]
+            logger.warning("Unable to publish {0} Events, spooling them".format(len(encoded_events)), exc_info=True)
+            dropped = self.spool.dropped
+            self.spool.append(encoded_events)
+
+            if self.metrics is not None:
+                self.metrics.increment("events_spooled", len(encoded_events))
+                if self.spool.dropped > dropped:
+                    self.metrics.increment("events_dropped", self.spool.dropped - dropped, reason="spool")
+
+    def _unacknowledged(self, events):
+        """Filters out events the API has already acknowledged
+
+        Parameters
+        ----------
+        events : list
+            Events about to be sent
+
+        Returns
+        -------
+        list
+            The events that still need to be sent
+        """
+        if self.ack_cache is None:
+            return events
+
+        unacknowledged = self.ack_cache.unacknowledged(events)
+        if len(unacknowledged) < len(events):
+            logger.info("Skipping {0} already published Events".format(len(events) - len(unacknowledged)))
+        return unacknowledged
+
+    def _acknowledge(self, events, events_api):
+        """Remembers the events a wrapper published
+
+        Parameters
+        ----------
+        events : list
+            Events in the wrapper's original payload
+        events_api : EventsApiRetryingWrapper
+            The invoked wrapper
+        """
+        if self.ack_cache is None:
+            return
+
+        undelivered = set(map(id, events_api.undelivered()))
+        self.ack_cache.add(event.event_id for event in events if id(event.encoded) not in undelivered)
+
+    def _chunk_events(self, events):
+        """Splits events into chunks within this client's bulk request limits
+
+        Parameters
+        ----------
+        events : iterable
+            Events to chunk
+
+        Returns
+        -------
+        generator
+            Lists of events, each of which fits in a single bulk request
+        """
+        return chunk_events(events, self.max_bulk_events, self.max_bulk_bytes)
+
+    def _publish_bulk_chunk(self, events):
+        """Publishes a single chunk of events
+
+        The request body is assembled from each event's cached encoding.
+
+        Parameters
+        ----------
+        events : list
+            Events in the chunk
+
+        Returns
+        -------
+        requests.Response
+            The API response, or None if no bulk url has been set or every event was already published
+        """
+        return self._send_bulk_chunk(events)[0]
+
+    def _send_bulk_chunk(self, events, headers={}):
+        """Publishes a single chunk of events, counting how many the API accepted
+
+        Parameters
+        ----------
+        events : list
+            Events in the chunk
+        headers : dict, optional
+            Extra headers to send with the request
+
+        Returns
+        -------
+        tuple
+            The API response, or None if nothing was sent or what was left got spooled,
+            the number of events the API accepted, and the number sent that it didn't accept.
+            Events already acknowledged aren't sent, so they are in neither count.
+        """
+        self.event_logger.publishing_events(events)
+
+        events = self._unacknowledged(events)
+        if not self.publish_bulk_url or not events:
+            return None, 0, 0
+
+        bulk_api = self._events_api(self.publish_bulk_url, [event.encoded for event in events], headers=headers)
+        try:
+            response = self._invoke(bulk_api)
+        finally:
+            self._acknowledge(events, bulk_api)
+        undelivered = len(bulk_api.undelivered())
+        return response, len(events) - undelivered, undelivered
+
+    def service_session(self, job_id, outbox=None):
         """Creates a new session where the actor is the service.
 
         Parameters
         ----------
         job_id : str
             A corellation ID to link requests from different services.
+        outbox : EventOutbox, optional
+            Transactional outbox the session writes its events to on flush, instead of sending them.
+            Pending events are delivered by an `OutboxRelay`. (the default is None)
 
         Returns
         -------
         EventSession
             An event session with the service set as the actor.
         """
-        return self._session(self.service_name, ACTOR_TYPE_SERVICE, job_id)
+        return self._session(self.service_name, ACTOR_TYPE_SERVICE, job_id, outbox=outbox)
 
-    def third_party_session(self, job_id):
+    def third_party_session(self, job_id, outbox=None):
         """Creates a new session where the actor is the service (as a third party).
 
         Parameters
         ----------
         job_id : str
             A corellation ID to link requests from different services.
+        outbox : EventOutbox, optional
+            Transactional outbox the session writes its events to on flush, instead of sending them.
+            Pending events are delivered by an `OutboxRelay`. (the default is None)
 
         Returns
         -------
         EventSession
             An event session with the third-party service set as the actor.
         """
-        return self._session(self.service_name, ACTOR_TYPE_THIRD_PARTY, job_id)
+        return self._session(self.service_name, ACTOR_TYPE_THIRD_PARTY, job_id, outbox=outbox)
 
-    def user_session(self, user_id, job_id):
+    def user_session(self, user_id, job_id, outbox=None):
         """Creates a new session where the actor is the service.
 
         Parameters
@@ -168,13 +645,16 @@ class EventClient(object):
             A unique ID for the user. This should come from Cognito.
         job_id : str
             A corellation ID to link requests from different services.
+        outbox : EventOutbox, optional
+            Transactional outbox the session writes its events to on flush, instead of sending them.
+            Pending events are delivered by an `OutboxRelay`. (the default is None)
 
         Returns
         -------
         EventSession
             An event session with the user_id set as the actor.
         """
-        return self._session(user_id, ACTOR_TYPE_USER, job_id)
+        return self._session(user_id, ACTOR_TYPE_USER, job_id, outbox=outbox)
 
     def get_topic(self, category, entity, action):
         """Gets a topic object by it's identifiers.
@@ -199,10 +679,49 @@ class EventClient(object):
             The topic matching the identifiers
         """
 
-        topic_name = build_topic_name(category, entity, action)
         try:
-            topic = self.topic_table[topic_name]
+            return self.topic_index[category, entity, action]
         except KeyError:
-            raise ValueError("Topic not found: " + topic_name)
+            raise ValueError("Topic not found: " + build_topic_name(category, entity, action))
+
+    def resolve_shortcut(self, attr_name):
+        """Resolves a session shortcut name, like `created_test` or `test_created`, to a topic
+
+        Only topics in the default category can be resolved. Names that resolve are memoized, so each is
+        only parsed once per client. Names that don't aren't, so probing arbitrary attributes, e.g. with
+        `hasattr`, can't grow the memo without bound.
+
+        Parameters
+        ----------
+        attr_name : str
+            The shortcut name, either action_entity or entity_action in snake case
+
+        Returns
+        -------
+        Topic
+            The matching topic, or None if there is no match
+        """
+
+        try:
+            return self._shortcuts[attr_name]
+        except KeyError:
+            pass
+
+        def build_entity_action_pair(entity_parts, action):
+            entity = "".join([part.capitalize() for part in entity_parts])
+            return entity, action.capitalize()
+
+        attr_parts = attr_name.split("_")
+
+        topic = None
+        for entity, action in (
+            build_entity_action_pair(attr_parts[:-1], attr_parts[-1]),
+            build_entity_action_pair(attr_parts[1:], attr_parts[0]),
+        ):
+            topic = self.topic_index.get((self.default_category, entity, action))
+            if topic is not None:
+                break
 
+        if topic is not None:
+            self._shortcuts[attr_name] = topic
         return topic
@@ -0,0 +1,165 @@
+import threading
+from concurrent.futures import Future
+
+from .session import MAX_BULK_EVENTS
+from .utils import json_dumps
+
+
+class CoalescedEvent(object):
+    __slots__ = ("event", "request_json", "encoded")
+
+    def __init__(self, event):
+        """An event sent in a bulk request shared with other sessions
+
+        A shared request can't have one x-britecore-job-id header, so each record carries its session's
+        `jobId` instead. Quacks enough like an `Event` to be chunked and sent in bulk by the client.
+
+        Parameters
+        ----------
+        event : Event
+            The validated event
+        """
+        self.event = event
+        self.request_json = event.request_json
+        if event.session.job_id is not None:
+            self.request_json = dict(self.request_json, jobId=event.session.job_id)
+        self.encoded = json_dumps(self.request_json)
+
+    @property
+    def event_id(self):
+        return self.event.event_id
+
+    def __str__(self):
+        return str(self.event)
+
+    def __repr__(self):
+        return "CoalescedEvent(event=%r)" % (self.event,)
+
+
+class CoalescedBatch(object):
+    __slots__ = ("events", "waiters", "full")
+
+    def __init__(self):
+        """Events from one or more flushes, to be sent together
+
+        Attributes
+        ----------
+        events : list
+            Every flushed event, in the order they were flushed
+        waiters : list
+            (start, end, future) for each flush, where start and end index its events
+        full : threading.Event
+            Set when the batch has stopped accepting events
+        """
+        self.events = []
+        self.waiters = []
+        self.full = threading.Event()
+
+
+class FlushCoalescer(object):
+    def __init__(self, client, linger=0.005, max_batch_size=MAX_BULK_EVENTS):
+        """Creates a new FlushCoalescer
+
+        Merges events flushed by concurrent sessions into shared bulk requests. The first flush to arrive
+        waits up to `linger` seconds for others to join it, then sends every event in the batch from its
+        own thread. Each flush blocks until its events are sent, and raises if any of them failed,
+        so sessions keep the same guarantees as publishing on their own.
+
+        A flush that no other flush joins still waits out the linger, so coalescing adds up to `linger`
+        seconds to every flush in exchange for fewer requests.
+
+        Parameters
+        ----------
+        client : EventClient
+            Client to send events with. Batches are packed into the client's bulk request limits.
+        linger : float, optional
+            Seconds to wait for other flushes to join a batch (the default is 0.005)
+        max_batch_size : int, optional
+            Number of events that sends a batch without waiting out the linger (the default is MAX_BULK_EVENTS)
+        """
+        self.client = client
+        self.linger = linger
+        self.max_batch_size = max_batch_size
+
+        self._lock = threading.Lock()
+        self._batch = None
+
+    def __repr__(self):
+        return "FlushCoalescer(client=%r, linger=%r, max_batch_size=%r)" % (
+            self.client,
+            self.linger,
+            self.max_batch_size,
+        )
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._batch = None
+
+    def publish(self, events):
+        """Publishes events in a shared batch, waiting until they have been sent
+
+        Parameters
+        ----------
+        events : list
+            Validated events to publish
+
+        Raises
+        ------
+        Exception
+            Whatever sending the bulk chunk holding any of these events raised
+        """
+        if not len(events):
+            return
+
+        events = [CoalescedEvent(event) for event in events]
+        future = Future()
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = CoalescedBatch()
+
+            start = len(batch.events)
+            batch.events.extend(events)
+            batch.waiters.append((start, len(batch.events), future))
+
+            if len(batch.events) >= self.max_batch_size:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.linger)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            self._send(batch)
+
+        future.result()
+
+    def _send(self, batch):
+        """Sends a closed batch and resolves the future of every flush in it
+
+        Parameters
+        ----------
+        batch : CoalescedBatch
+            The batch to send
+        """
+        failures = []
+        try:
+            offset = 0
+            for chunk in self.client._chunk_events(batch.events):
+                try:
+                    self.client._publish_bulk_chunk(chunk)
+                except Exception as e:
+                    failures.append((offset, offset + len(chunk), e))
+                offset += len(chunk)
+        except Exception as e:
+            failures.append((0, len(batch.events), e))
+
+        for start, end, future in batch.waiters:
+            for failed_start, failed_end, exception in failures:
+                if start < failed_end and failed_start < end:
+                    future.set_exception(exception)
+                    break
+            else:
+                future.set_result(None)
@@ -0,0 +1,103 @@
+import gzip
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+
+DEFAULT_LEVELS = {COMPRESSION_GZIP: 6, COMPRESSION_ZSTD: 3}
+
+
+class BodyCompressor(object):
+    def __init__(self, encoding=COMPRESSION_GZIP, threshold=1024, level=None):
+        """Creates a new BodyCompressor
+
+        Compresses request bodies, sending them with a matching Content-Encoding header.
+        Bodies smaller than `threshold` are sent as-is, since compressing them costs more than it saves.
+
+        Parameters
+        ----------
+        encoding : {'gzip', 'zstd'}, optional
+            The compression to use. zstd requires the optional ``zstandard`` dependency
+            (``pip install bc-events[zstd]``). (the default is 'gzip')
+        threshold : int, optional
+            Smallest body in bytes that is compressed (the default is 1024)
+        level : int, optional
+            Compression level (the default is None, which uses 6 for gzip and 3 for zstd)
+
+        Raises
+        ------
+        ValueError
+            If the encoding is not supported
+        ImportError
+            If zstd is requested and ``zstandard`` isn't installed
+        """
+        if encoding not in DEFAULT_LEVELS:
+            raise ValueError("Unsupported compression: " + str(encoding))
+        if encoding == COMPRESSION_ZSTD and zstandard is None:
+            raise ImportError("zstd compression requires the zstandard package (pip install bc-events[zstd])")
+
+        self.encoding = encoding
+        self.threshold = threshold
+        self.level = level if level is not None else DEFAULT_LEVELS[encoding]
+
+        if encoding == COMPRESSION_ZSTD:
+            self._zstd_params = zstandard.ZstdCompressionParameters.from_level(self.level)
+
+    def __repr__(self):
+        return "BodyCompressor(encoding=%r, threshold=%r, level=%r)" % (self.encoding, self.threshold, self.level)
+
+    def compress(self, body):
+        """Compresses a request body, if it is large enough
+
+        Parameters
+        ----------
+        body : bytes
+            The request body
+
+        Returns
+        -------
+        tuple
+            The body to send, and its Content-Encoding, or None if it wasn't compressed
+        """
+        if len(body) < self.threshold:
+            return body, None
+
+        if self.encoding == COMPRESSION_GZIP:
+            return gzip.compress(body, compresslevel=self.level, mtime=0), COMPRESSION_GZIP
+
+        # Compressor objects aren't thread-safe, so every body gets its own
+        compressor = zstandard.ZstdCompressor(compression_params=self._zstd_params)
+        return compressor.compress(body), COMPRESSION_ZSTD
+
+
+def decompress(body, encoding):
+    """Decompresses a request body by its Content-Encoding
+
+    Parameters
+    ----------
+    body : bytes
+        The request body
+    encoding : str
+        The Content-Encoding header, or None
+
+    Raises
+    ------
+    ValueError
+        If the encoding is not supported
+
+    Returns
+    -------
+    bytes
+        The decompressed body
+    """
+    if not encoding or encoding == "identity":
+        return body
+    if encoding == COMPRESSION_GZIP:
+        return gzip.decompress(body)
+    if encoding == COMPRESSION_ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    raise ValueError("Unsupported Content-Encoding: " + str(encoding))
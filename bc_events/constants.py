@@ -11,6 +11,8 @@ EVENT_SCHEMA = {
         "category": {"$ref": "#/definitions/EventCategoryName"},
         "data": {"additionalProperties": True, "minProperties": 1, "properties": {}, "type": "object"},
         "entity": {"$ref": "#/definitions/EventEntityName"},
+        "eventId": {"type": "string", "minLength": 1},
+        "jobId": {"type": "string"},
     },
     "required": ["category", "action", "entity", "data", "actor"],
     "definitions": {
@@ -28,3 +30,11 @@ EVENT_SCHEMA = {
         "EventEntityName": {"minLength": 1, "pattern": "^([A-Z][a-z]+)+$", "type": "string"},
     },
 }
+
+BACKPRESSURE_BLOCK = "block"
+BACKPRESSURE_DROP_OLDEST = "drop-oldest"
+BACKPRESSURE_RAISE = "raise"
+
+SPOOL_FSYNC_ALWAYS = "always"
+SPOOL_FSYNC_SEGMENT = "segment"
+SPOOL_FSYNC_NEVER = "never"
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class AckCache(object):
+    def __init__(self, max_size=100000, ttl=600.0):
+        """Creates a new AckCache
+
+        Remembers the IDs of events the API has acknowledged, so an event that is flushed, dispatched
+        or replayed again is skipped instead of being published twice. IDs expire after `ttl` seconds,
+        and the oldest are forgotten first once `max_size` are held.
+
+        Parameters
+        ----------
+        max_size : int, optional
+            Most event IDs remembered at once (the default is 100000)
+        ttl : float, optional
+            Seconds an event ID is remembered for (the default is 600.0)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._expires = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "AckCache(max_size=%r, ttl=%r, size=%r)" % (self.max_size, self.ttl, len(self._expires))
+
+    def __len__(self):
+        return len(self._expires)
+
+    def __contains__(self, event_id):
+        expires = self._expires.get(event_id)
+        return expires is not None and expires > time.monotonic()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def add(self, event_ids):
+        """Remembers acknowledged events
+
+        Parameters
+        ----------
+        event_ids : iterable
+            IDs of the acknowledged events. None is ignored.
+        """
+        with self._lock:
+            now = time.monotonic()
+            expires = now + self.ttl
+            for event_id in event_ids:
+                if event_id is None:
+                    continue
+                self._expires[event_id] = expires
+                self._expires.move_to_end(event_id)
+
+            # Every ID lives for the same ttl, so the oldest are also the first to expire
+            while self._expires:
+                oldest, oldest_expires = next(iter(self._expires.items()))
+                if len(self._expires) <= self.max_size and oldest_expires > now:
+                    break
+                del self._expires[oldest]
+
+    def unacknowledged(self, events):
+        """Filters out events that have already been acknowledged
+
+        Parameters
+        ----------
+        events : list
+            Events about to be sent
+
+        Returns
+        -------
+        list
+            The events that haven't been acknowledged, in order
+        """
+        return [event for event in events if event.event_id not in self]
@@ -0,0 +1,230 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from .constants import BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_RAISE
+from .session import MAX_BULK_EVENTS
+
+logger = logging.getLogger("bc.events")
+
+
+class BackgroundDispatcher(object):
+    def __init__(
+        self, client, max_queue_size=10000, max_batch_size=MAX_BULK_EVENTS, linger=0.05, backpressure=BACKPRESSURE_BLOCK
+    ):
+        """Creates a new BackgroundDispatcher
+
+        Sends events from a bounded in-memory queue to the bulk API on a worker thread,
+        so flushing a session does not wait on the API.
+
+        Parameters
+        ----------
+        client : EventClient
+            EventClient that knows about the bulk publish url and connection pool
+        max_queue_size : int, optional
+            Maximum number of events waiting to be sent (the default is 10000)
+        max_batch_size : int, optional
+            Maximum number of events collected into one batch before it is sent.
+            Batches are split further to fit the client's bulk limits. (the default is MAX_BULK_EVENTS)
+        linger : float, optional
+            Seconds to wait for a batch to fill up before sending it anyway (the default is 0.05)
+        backpressure : {'block', 'drop-oldest', 'raise'}, optional
+            What to do when the queue is full. Block the caller until there is room,
+            drop the oldest queued event, or raise `queue.Full`. (the default is 'block')
+        """
+        if backpressure not in (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_RAISE):
+            raise ValueError("Unknown backpressure policy: " + str(backpressure))
+
+        self.client = client
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self.backpressure = backpressure
+
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._closing = False
+        self._deadline = None
+        self._thread = None
+
+    def __repr__(self):
+        return "BackgroundDispatcher(client=%r, max_queue_size=%r, max_batch_size=%r, linger=%r, backpressure=%r)" % (
+            self.client,
+            self.max_queue_size,
+            self.max_batch_size,
+            self.linger,
+            self.backpressure,
+        )
+
+    def __len__(self):
+        return len(self._queue)
+
+    def is_alive(self):
+        """Whether the worker thread is still running, e.g. sending a batch past the shutdown deadline
+
+        Returns
+        -------
+        bool
+            True if the worker thread hasn't exited
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Starts the worker thread if it is not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._closing = False
+        self._deadline = None
+        self._thread = threading.Thread(target=self._run, name="bc-events-dispatcher", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _after_fork(self):
+        """Resets the dispatcher in a forked child, restarting its worker if it was running
+
+        Events queued before the fork belong to the parent, which still sends them.
+        """
+        running = self._thread is not None and not self._closing
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        if running:
+            self.start()
+
+    def submit(self, events):
+        """Queues events to be sent by the worker thread
+
+        Parameters
+        ----------
+        events : list
+            Validated events to send
+
+        Raises
+        ------
+        queue.Full
+            If the queue is full and the backpressure policy is 'raise'
+        RuntimeError
+            If the dispatcher has been shut down
+        """
+        with self._condition:
+            for event in events:
+                while True:
+                    if self._closing:
+                        raise RuntimeError("Cannot submit events to a dispatcher that has been shut down")
+                    if len(self._queue) < self.max_queue_size:
+                        break
+
+                    if self.backpressure == BACKPRESSURE_RAISE:
+                        raise queue.Full("Event queue is full ({0} events)".format(self.max_queue_size))
+                    elif self.backpressure == BACKPRESSURE_DROP_OLDEST:
+                        dropped_event = self._queue.popleft()
+                        self.dropped += 1
+                        if self.client.metrics is not None:
+                            self.client.metrics.increment("events_dropped", reason="queue")
+                        logger.warning("Event queue is full, dropping event {}".format(dropped_event))
+                    else:
+                        self._condition.wait()
+
+                self._queue.append(event)
+
+            self._condition.notify_all()
+
+    def shutdown(self, timeout=5.0):
+        """Stops accepting events and drains the queue
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for queued events to be sent (the default is 5.0)
+
+        Returns
+        -------
+        int
+            The number of events that could not be sent before the deadline
+        """
+        atexit.unregister(self.shutdown)
+
+        with self._condition:
+            self._closing = True
+            self._deadline = time.monotonic() + timeout
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        with self._condition:
+            remaining = len(self._queue)
+            self._queue.clear()
+            self._condition.notify_all()
+
+        if remaining:
+            logger.warning("Dispatcher shut down with {0} unsent events".format(remaining))
+
+        return remaining
+
+    def _next_batch(self):
+        """Waits for the next batch of events to send
+
+        Returns
+        -------
+        list
+            Up to `max_batch_size` events, or None when the worker should stop
+        """
+        with self._condition:
+            while not self._queue:
+                if self._closing:
+                    return None
+                self._condition.wait()
+
+            linger_until = time.monotonic() + self.linger
+            while len(self._queue) < self.max_batch_size and not self._closing:
+                remaining = linger_until - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                return None
+
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+            self._condition.notify_all()
+            return batch
+
+    def _send(self, batch):
+        """Sends a batch of events to the bulk API
+
+        Events are sent together with others from the same job, with the job ID in the x-britecore-job-id header.
+
+        Parameters
+        ----------
+        batch : list
+            Events to send, in as few requests as the client's bulk limits allow
+        """
+        jobs = {}
+        for event in batch:
+            jobs.setdefault(event.session.job_id, []).append(event)
+
+        for job_id, events in jobs.items():
+            headers = {"x-britecore-job-id": job_id} if job_id is not None else {}
+            for chunk in self.client._chunk_events(events):
+                self.client._send_bulk_chunk(chunk, headers=headers)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                self._send(batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception("Failed to publish {0} Events".format(len(batch)))
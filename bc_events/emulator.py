@@ -0,0 +1,399 @@
+"""A local emulator of the BriteEvents API for load and retry testing.
+
+Serves ``/events`` and ``/events/bulk/`` with configurable latency, throughput caps, request failures,
+per-record partial failures and dropped connections. Request bodies may be gzip or zstd compressed.
+Events that carry an ``eventId`` the emulator has already accepted are acknowledged without being counted again.
+Run it with::
+
+    python -m bc_events.emulator --port 8080 --max-events-per-second 1000 --partial-failure-rate 0.01
+
+and point an EventClient at ``http://127.0.0.1:8080``. ``GET /stats`` returns what it has seen so far.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .compression import decompress
+
+THROUGHPUT_EXCEEDED = "ProvisionedThroughputExceededException"
+INTERNAL_FAILURE = "InternalFailureException"
+
+LATENCY_CONSTANT = "constant"
+LATENCY_UNIFORM = "uniform"
+LATENCY_EXPONENTIAL = "exponential"
+LATENCY_LOGNORMAL = "lognormal"
+LATENCY_DISTRIBUTIONS = (LATENCY_CONSTANT, LATENCY_UNIFORM, LATENCY_EXPONENTIAL, LATENCY_LOGNORMAL)
+
+
+class EventsApiEmulator(object):
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        latency_distribution=LATENCY_CONSTANT,
+        max_events_per_second=None,
+        failure_rate=0.0,
+        partial_failure_rate=0.0,
+        drop_rate=0.0,
+        lost_response_rate=0.0,
+        dedup_window=100000,
+        seed=None,
+    ):
+        """Creates a new EventsApiEmulator
+
+        Parameters
+        ----------
+        host : str, optional
+            Address to listen on (the default is '127.0.0.1')
+        port : int, optional
+            Port to listen on (the default is 0, which picks a free port)
+        latency : float, optional
+            Mean seconds to wait before answering each request (the default is 0.0)
+        latency_distribution : {'constant', 'uniform', 'exponential', 'lognormal'}, optional
+            Distribution of each request's latency around the mean (the default is 'constant')
+        max_events_per_second : float, optional
+            Events accepted per second, with up to a second's worth of burst. Single requests over the cap
+            are rejected, and bulk records over it fail, with ProvisionedThroughputExceededException.
+            (the default is None, which doesn't cap throughput)
+        failure_rate : float, optional
+            Fraction of requests rejected with a 500 InternalFailureException (the default is 0.0)
+        partial_failure_rate : float, optional
+            Fraction of bulk records that fail with InternalFailureException (the default is 0.0)
+        drop_rate : float, optional
+            Fraction of requests whose connection is closed without a response (the default is 0.0)
+        lost_response_rate : float, optional
+            Fraction of requests that are accepted, but whose connection is closed before the response is sent,
+            so the client retries events that were already published (the default is 0.0)
+        dedup_window : int, optional
+            Most accepted event IDs remembered to detect duplicates (the default is 100000)
+        seed : int, optional
+            Seed for the random latencies and failures (the default is None)
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError("Unknown latency distribution: " + str(latency_distribution))
+
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.max_events_per_second = max_events_per_second
+        self.failure_rate = failure_rate
+        self.partial_failure_rate = partial_failure_rate
+        self.drop_rate = drop_rate
+        self.lost_response_rate = lost_response_rate
+        self.dedup_window = dedup_window
+        self.random = random.Random(seed)
+
+        self.stats = {
+            "requests": 0,
+            "events": 0,
+            "failed_records": 0,
+            "throttled": 0,
+            "failed": 0,
+            "dropped": 0,
+            "lost_responses": 0,
+            "duplicates": 0,
+            "compressed": 0,
+            "bytes_received": 0,
+        }
+        self._lock = threading.Lock()
+        self._tokens = max_events_per_second
+        self._accepted_ids = OrderedDict()
+        self._refilled_at = time.monotonic()
+        self._server = None
+
+    def __repr__(self):
+        return (
+            "EventsApiEmulator(host=%r, port=%r, latency=%r, latency_distribution=%r, max_events_per_second=%r, "
+            "failure_rate=%r, partial_failure_rate=%r, drop_rate=%r, lost_response_rate=%r)"
+            % (
+                self.host,
+                self.port,
+                self.latency,
+                self.latency_distribution,
+                self.max_events_per_second,
+                self.failure_rate,
+                self.partial_failure_rate,
+                self.drop_rate,
+                self.lost_response_rate,
+            )
+        )
+
+    @property
+    def url(self):
+        """Base url to give an EventClient as its api_url"""
+        host, port = self._server.server_address[:2]
+        return "http://{0}:{1}".format(host, port)
+
+    def bind(self):
+        """Binds the server socket, without serving requests yet"""
+        self._server = ThreadingHTTPServer((self.host, self.port), build_handler(self))
+        self._server.daemon_threads = True
+        return self
+
+    def serve_forever(self):
+        if self._server is None:
+            self.bind()
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves requests from a daemon thread
+
+        Returns
+        -------
+        EventsApiEmulator
+            This emulator, now accepting requests at `url`
+        """
+        self.bind()
+        threading.Thread(target=self._server.serve_forever, name="bc-events-emulator", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def sample_latency(self):
+        """Draws a latency for one request
+
+        Returns
+        -------
+        float
+            Seconds to wait before answering
+        """
+        if self.latency <= 0:
+            return 0.0
+
+        with self._lock:
+            if self.latency_distribution == LATENCY_UNIFORM:
+                return self.random.uniform(0, 2 * self.latency)
+            if self.latency_distribution == LATENCY_EXPONENTIAL:
+                return self.random.expovariate(1 / self.latency)
+            if self.latency_distribution == LATENCY_LOGNORMAL:
+                # A long tail with the configured mean
+                sigma = 1.0
+                return self.random.lognormvariate(math.log(self.latency) - sigma * sigma / 2, sigma)
+        return self.latency
+
+    def should_drop(self):
+        with self._lock:
+            if self.random.random() < self.drop_rate:
+                self.stats["requests"] += 1
+                self.stats["dropped"] += 1
+                return True
+        return False
+
+    def should_lose_response(self):
+        with self._lock:
+            if self.random.random() < self.lost_response_rate:
+                self.stats["lost_responses"] += 1
+                return True
+        return False
+
+    def _is_duplicate(self, record):
+        # Callers hold the lock
+        event_id = record.get("eventId") if isinstance(record, dict) else None
+        if event_id is None or event_id not in self._accepted_ids:
+            return False
+        self.stats["duplicates"] += 1
+        return True
+
+    def _accept(self, record):
+        # Callers hold the lock
+        event_id = record.get("eventId") if isinstance(record, dict) else None
+        if event_id is not None:
+            self._accepted_ids[event_id] = None
+            if len(self._accepted_ids) > self.dedup_window:
+                self._accepted_ids.popitem(last=False)
+        self.stats["events"] += 1
+
+    def _take_token(self):
+        # Callers hold the lock
+        if self.max_events_per_second is None:
+            return True
+
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_events_per_second, self._tokens + (now - self._refilled_at) * self.max_events_per_second
+        )
+        self._refilled_at = now
+
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def respond(self, path, payload):
+        """Builds the status and json body for a request, as the Events API would
+
+        Parameters
+        ----------
+        path : str
+            The request path
+        payload : {dict, list}
+            The decoded request body
+
+        Returns
+        -------
+        tuple
+            The status code and json response
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+
+            if self.random.random() < self.failure_rate:
+                self.stats["failed"] += 1
+                return 500, {"errorType": INTERNAL_FAILURE, "errorMessage": "Injected failure"}
+
+            if not path.rstrip("/").endswith("/bulk"):
+                if self._is_duplicate(payload):
+                    return 201, {}
+                if not self._take_token():
+                    self.stats["throttled"] += 1
+                    return 400, {"errorType": THROUGHPUT_EXCEEDED, "errorMessage": "Rate exceeded"}
+                self._accept(payload)
+                return 201, {}
+
+            records = []
+            for record in payload:
+                if self._is_duplicate(record):
+                    records.append("Success")
+                elif not self._take_token():
+                    records.append(THROUGHPUT_EXCEEDED)
+                elif self.random.random() < self.partial_failure_rate:
+                    records.append(INTERNAL_FAILURE)
+                else:
+                    self._accept(record)
+                    records.append("Success")
+
+            failed = len(records) - records.count("Success")
+            self.stats["failed_records"] += failed
+            self.stats["throttled"] += records.count(THROUGHPUT_EXCEEDED)
+            return 200, {"failedRecords": failed, "records": records}
+
+
+def build_handler(emulator):
+    """Builds a request handler class bound to an emulator
+
+    Parameters
+    ----------
+    emulator : EventsApiEmulator
+        The emulator answering requests
+
+    Returns
+    -------
+    type
+        A BaseHTTPRequestHandler subclass
+    """
+
+    class EmulatorRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Send each response in one write, without waiting on delayed acks
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def send_json(self, status, response):
+            encoded = json.dumps(response).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(encoded)))
+            self.end_headers()
+            self.wfile.write(encoded)
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/stats":
+                self.send_json(404, {"errorType": "NotFound"})
+                return
+            with emulator._lock:
+                self.send_json(200, dict(emulator.stats))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            encoding = self.headers.get("Content-Encoding")
+            with emulator._lock:
+                emulator.stats["bytes_received"] += len(body)
+                emulator.stats["compressed"] += 1 if encoding else 0
+
+            try:
+                body = decompress(body, encoding)
+            except ValueError:
+                self.send_json(415, {"errorType": "UnsupportedMediaType"})
+                return
+            except Exception:
+                self.send_json(400, {"errorType": "InvalidRequestBody"})
+                return
+
+            latency = emulator.sample_latency()
+            if latency:
+                time.sleep(latency)
+
+            if emulator.should_drop():
+                self.close_connection = True
+                return
+
+            status, response = emulator.respond(self.path, json.loads(body))
+            if emulator.should_lose_response():
+                self.close_connection = True
+                return
+            self.send_json(status, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmulatorRequestHandler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bc_events.emulator", description="Emulate the BriteEvents API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean seconds to wait before each response")
+    parser.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default=LATENCY_CONSTANT, help="Shape of the latency"
+    )
+    parser.add_argument("--max-events-per-second", type=float, help="Throttle events over this rate")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--partial-failure-rate", type=float, default=0.0, help="Fraction of bulk records that fail")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of connections closed without a reply")
+    parser.add_argument(
+        "--lost-response-rate", type=float, default=0.0, help="Fraction of accepted requests closed without a reply"
+    )
+    parser.add_argument("--seed", type=int, help="Seed for random latencies and failures")
+    args = parser.parse_args(argv)
+
+    emulator = EventsApiEmulator(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        max_events_per_second=args.max_events_per_second,
+        failure_rate=args.failure_rate,
+        partial_failure_rate=args.partial_failure_rate,
+        drop_rate=args.drop_rate,
+        lost_response_rate=args.lost_response_rate,
+        seed=args.seed,
+    ).bind()
+
+    print("Emulating the Events API at {0}".format(emulator.url), flush=True)
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator._server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,16 @@
-import logging
-
-import jsonschema
+import json
+import time
 
 from .constants import EVENT_SCHEMA
-from .utils import EventsApiRetryingWrapper
+from .utils import build_validator, json_dumps, new_event_id
 
-logger = logging.getLogger("bc.events")
+EVENT_VALIDATOR = build_validator(EVENT_SCHEMA)
 
 
 class Event(object):
-    def __init__(self, topic, data, session):
+    __slots__ = ("topic", "data", "session", "event_id", "_request_json", "_encoded")
+
+    def __init__(self, topic, data, session, event_id=None):
         """Creates a new Event
 
         Parameters
@@ -20,28 +21,62 @@ class Event(object):
             The data specific to this event. Should match topic's schema
         session : EventSession
             The event session that knows about the actor and job for this event
+        event_id : str, optional
+            Unique ID of this event, sent with every attempt to publish it so the API can
+            skip duplicates (the default is None, which generates a new ID)
         """
         self.topic = topic
         self.data = data
         self.session = session
+        self.event_id = event_id if event_id is not None else new_event_id()
+        self._request_json = None
+        self._encoded = None
 
     @property
     def request_json(self):
         """Computed property that returns the JSON for use on the API
 
+        Built once on first access and cached.
+
         Returns
         -------
         dict
             The json dict to be published to the API
         """
 
-        return {
-            "action": self.topic.action,
-            "category": self.topic.category,
-            "entity": self.topic.entity,
-            "data": self.data,
-            "actor": {"id": self.session.actor_id, "type": self.session.actor_type},
-        }
+        if self._request_json is None:
+            self._request_json = {
+                "action": self.topic.action,
+                "category": self.topic.category,
+                "entity": self.topic.entity,
+                "data": self.data,
+                "actor": {"id": self.session.actor_id, "type": self.session.actor_type},
+                "eventId": self.event_id,
+            }
+        return self._request_json
+
+    @property
+    def encoded(self):
+        """This event's request json encoded as utf-8 bytes
+
+        Encoded once on first access and cached, so sizing, sending and retrying an event
+        doesn't serialize it again.
+
+        Returns
+        -------
+        bytes
+            The compact json encoding of `request_json`
+        """
+
+        if self._encoded is None:
+            metrics = self.session.client.metrics
+            if metrics is None:
+                self._encoded = json_dumps(self.request_json)
+            else:
+                start = time.perf_counter()
+                self._encoded = json_dumps(self.request_json)
+                metrics.observe("serialization_seconds", time.perf_counter() - start, topic=self.topic.name)
+        return self._encoded
 
     def __str__(self):
         return str(self.topic)
@@ -58,8 +93,18 @@ class Event(object):
             If the request json or event data do not validate against their schemas
         """
 
-        jsonschema.validate(self.request_json, EVENT_SCHEMA)
-        jsonschema.validate(self.data, self.topic.schema)
+        metrics = self.session.client.metrics
+        if metrics is None:
+            EVENT_VALIDATOR.validate(self.request_json)
+            self.topic.validator.validate(self.data)
+            return
+
+        start = time.perf_counter()
+        try:
+            EVENT_VALIDATOR.validate(self.request_json)
+            self.topic.validator.validate(self.data)
+        finally:
+            metrics.observe("validation_seconds", time.perf_counter() - start, topic=self.topic.name)
 
     def publish(self):
         """Publishes this event to the API if it is valid
@@ -70,11 +115,45 @@ class Event(object):
 
         self.validate()
 
-        request_json = self.request_json
-        logger.info("Publishing event {}".format(self), extra={"context": request_json})
+        client = self.session.client
+        client.event_logger.publishing_event(self)
 
         # TODO this is going to need authentication when BriteAuth is hooked up to the API
-        if self.session.client.publish_url:
+        if client.publish_url and client._unacknowledged([self]):
             headers = {"x-britecore-job-id": self.session.job_id}
-            events_api = EventsApiRetryingWrapper(self.session.client.publish_url, request_json, headers=headers)
-            events_api.invoke()
+            events_api = client._events_api(client.publish_url, self.encoded, headers=headers)
+            try:
+                client._invoke(events_api)
+            finally:
+                client._acknowledge([self], events_api)
+
+
+class EncodedEvent(object):
+    __slots__ = ("encoded", "_event_id")
+
+    def __init__(self, encoded):
+        """An already validated and encoded event, read back from storage
+
+        Quacks enough like an `Event` to be chunked and sent in bulk by the client.
+
+        Parameters
+        ----------
+        encoded : bytes
+            The event's json encoding, exactly as it was stored
+        """
+        self.encoded = encoded
+        self._event_id = None
+
+    @property
+    def request_json(self):
+        return json.loads(self.encoded.decode("utf-8"))
+
+    @property
+    def event_id(self):
+        """The stored event's ID, or None if it was stored without one"""
+        if self._event_id is None:
+            self._event_id = self.request_json.get("eventId")
+        return self._event_id
+
+    def __repr__(self):
+        return "EncodedEvent(encoded=%r)" % (self.encoded,)
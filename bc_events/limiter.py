@@ -0,0 +1,228 @@
+import threading
+import time
+
+from tenacity import RetryError
+
+THROTTLING_ERROR = "ProvisionedThroughputExceededException"
+
+
+class RetryBudgetExhausted(RetryError):
+    """Raised when a request still needed retrying, but the retry budget denied it
+
+    `last_attempt` holds the final failed attempt, like any other `RetryError`.
+    """
+
+
+class RetryBudget(object):
+    def __init__(self, ratio=0.2, min_retries_per_second=10.0, max_balance=100.0):
+        """Creates a new RetryBudget
+
+        Limits retries to a fraction of the requests being sent, so a struggling API sees at most
+        about ``1 + ratio`` times the base traffic instead of every caller retrying in lockstep.
+
+        Parameters
+        ----------
+        ratio : float, optional
+            Retries allowed per request sent (the default is 0.2)
+        min_retries_per_second : float, optional
+            Retries always allowed, so low traffic can still retry (the default is 10.0)
+        max_balance : float, optional
+            Most retries that can be saved up (the default is 100.0)
+        """
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_balance = max_balance
+        self.balance = min_retries_per_second
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "RetryBudget(ratio=%r, min_retries_per_second=%r, max_balance=%r)" % (
+            self.ratio,
+            self.min_retries_per_second,
+            self.max_balance,
+        )
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Records a request, earning `ratio` retries"""
+        with self._lock:
+            self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def withdraw(self):
+        """Spends a retry, if the budget allows it
+
+        Returns
+        -------
+        bool
+            True if the retry may be sent
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.balance = min(self.max_balance, self.balance + (now - self._refilled_at) * self.min_retries_per_second)
+            self._refilled_at = now
+
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class AdaptiveRateLimiter(object):
+    def __init__(
+        self,
+        rate=50.0,
+        min_rate=1.0,
+        max_rate=1000.0,
+        concurrency=10,
+        max_concurrency=64,
+        rate_increase=5.0,
+        decrease=0.5,
+        cooldown=0.5,
+        retry_budget=None,
+    ):
+        """Creates a new AdaptiveRateLimiter
+
+        Paces every request a client sends, from every session and thread, with a token bucket
+        and a limit on requests in flight. Both adapt with AIMD: each success grows them a little,
+        and throttling (or a failed connection) cuts them by `decrease`.
+        Cuts are applied at most once per `cooldown`, so a burst of throttled responses from requests
+        that were already in flight only counts once.
+
+        Parameters
+        ----------
+        rate : float, optional
+            Starting requests per second (the default is 50.0)
+        min_rate : float, optional
+            Requests per second the rate is never cut below (the default is 1.0)
+        max_rate : float, optional
+            Requests per second the rate never grows past (the default is 1000.0)
+        concurrency : int, optional
+            Starting limit of requests in flight (the default is 10)
+        max_concurrency : int, optional
+            Largest the in-flight limit grows to (the default is 64)
+        rate_increase : float, optional
+            Requests per second added to the rate for each second of successes (the default is 5.0)
+        decrease : float, optional
+            Factor the rate and in-flight limit are multiplied by when throttled (the default is 0.5)
+        cooldown : float, optional
+            Seconds after a cut before throttling can cut again (the default is 0.5)
+        retry_budget : RetryBudget, optional
+            Budget that retries are drawn from (the default is None, which uses a default `RetryBudget`)
+        """
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.rate_increase = rate_increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.retry_budget = retry_budget if retry_budget is not None else RetryBudget()
+
+        self.in_flight = 0
+        self.throttled = 0
+        self._tokens = 1.0
+        self._refilled_at = time.monotonic()
+        self._decreased_at = None
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return "AdaptiveRateLimiter(rate=%r, concurrency=%r, in_flight=%r)" % (
+            self.rate,
+            self.concurrency,
+            self.in_flight,
+        )
+
+    def _after_fork(self):
+        """Resets the limiter in a forked child, where the parent's requests aren't in flight"""
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self.retry_budget._after_fork()
+
+    def try_acquire(self):
+        """Takes a slot for one request, if one is free now
+
+        Returns
+        -------
+        float
+            0 if a slot was taken, otherwise seconds to wait before trying again
+        """
+        with self._condition:
+            now = time.monotonic()
+            # Up to a second's worth of requests can be sent in a burst
+            self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+
+            if self.in_flight >= int(self.concurrency):
+                return min(0.05, 1 / self.rate)
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+
+            self._tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        """Blocks until a request may be sent"""
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            with self._condition:
+                self._condition.wait(delay)
+
+    def release(self, throttled=False):
+        """Returns a request's slot and adapts to its outcome
+
+        Parameters
+        ----------
+        throttled : bool, optional
+            Whether the API throttled the request, or it could not connect (the default is False)
+        """
+        with self._condition:
+            self.in_flight -= 1
+
+            if throttled:
+                self.throttled += 1
+                now = time.monotonic()
+                if self._decreased_at is None or now - self._decreased_at >= self.cooldown:
+                    self._decreased_at = now
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self.concurrency = max(1.0, self.concurrency * self.decrease)
+            else:
+                # About `rate_increase` more per second, and one more in flight per round trip
+                self.rate = min(self.max_rate, self.rate + self.rate_increase / self.rate)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+            self._condition.notify_all()
+
+
+def is_throttled(response, response_json=None):
+    """Checks whether the API throttled a request, or any record in it
+
+    Parameters
+    ----------
+    response : requests.Response
+        An API response
+    response_json : object, optional
+        The response's already decoded json body (the default is None, which decodes it)
+
+    Returns
+    -------
+    bool
+        True if the response has a ProvisionedThroughputExceededException
+    """
+    if response_json is None:
+        try:
+            response_json = response.json()
+        except ValueError:
+            return False
+
+    if not isinstance(response_json, dict):
+        return False
+    if response.status_code in [400, 500]:
+        return response_json.get("errorType") == THROTTLING_ERROR
+    return THROTTLING_ERROR in response_json.get("records", ())
@@ -0,0 +1,171 @@
+import logging
+import random
+from collections import Counter
+
+logger = logging.getLogger("bc.events")
+
+
+class LazyContext(object):
+    __slots__ = ("_build", "_value", "_built")
+
+    def __init__(self, build):
+        """Log record context that is only built when a handler asks for it
+
+        Attach to a record as ``extra={"context": LazyContext(...)}``. Formatters that render
+        ``%(context)s`` build it on demand, and `ResolveContextFilter` replaces it with the
+        built value for handlers that serialize the context themselves.
+
+        Parameters
+        ----------
+        build : callable
+            Called with no arguments, at most once, to build the context
+        """
+        self._build = build
+        self._value = None
+        self._built = False
+
+    def resolve(self):
+        """Builds the context, if it hasn't been already
+
+        Returns
+        -------
+        object
+            The built context
+        """
+        if not self._built:
+            self._value = self._build()
+            self._built = True
+        return self._value
+
+    def __str__(self):
+        return str(self.resolve())
+
+    def __repr__(self):
+        return repr(self.resolve())
+
+
+class ResolveContextFilter(logging.Filter):
+    """Handler filter that replaces a record's `LazyContext` with the built context
+
+    Add it to handlers that serialize `record.context` directly, for example as json.
+    Since handler filters only run for records the handler emits, context is never built
+    for records that are dropped.
+    """
+
+    def filter(self, record):
+        context = getattr(record, "context", None)
+        if isinstance(context, LazyContext):
+            record.context = context.resolve()
+        return True
+
+
+class EventLogger(object):
+    def __init__(self, log_payloads=True, sample_rate=1.0, logger=logger, lazy_context=False):
+        """Creates a new EventLogger
+
+        Logs the publish path cheaply. Nothing is formatted or built unless the level is enabled
+        and the message is sampled, and messages are formatted by the handler.
+
+        Parameters
+        ----------
+        log_payloads : bool, optional
+            Include every event's request json in the context. When False, bulk publishes only log
+            a summary of event counts per topic. (the default is True)
+        sample_rate : float, optional
+            Fraction of publish messages to log, between 0 and 1 (the default is 1.0)
+        logger : logging.Logger, optional
+            Logger to write to (the default is the 'bc.events' logger)
+        lazy_context : bool, optional
+            Attach the context to records as a `LazyContext`, so it is only built for handlers that use it.
+            Handlers that read `record.context` as a dict or list then need a `ResolveContextFilter`.
+            (the default is False, which attaches the built context)
+        """
+        self.log_payloads = log_payloads
+        self.sample_rate = sample_rate
+        self.logger = logger
+        self.lazy_context = lazy_context
+
+    def __repr__(self):
+        return "EventLogger(log_payloads=%r, sample_rate=%r, logger=%r, lazy_context=%r)" % (
+            self.log_payloads,
+            self.sample_rate,
+            self.logger,
+            self.lazy_context,
+        )
+
+    def _should_log(self, level):
+        if not self.logger.isEnabledFor(level):
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def _context(self, build):
+        context = LazyContext(build)
+        return context if self.lazy_context else context.resolve()
+
+    def publishing_event(self, event):
+        """Logs that a single event is being published
+
+        Parameters
+        ----------
+        event : Event
+            The event being published
+        """
+        if not self._should_log(logging.INFO):
+            return
+
+        if self.log_payloads:
+            context = self._context(lambda: event.request_json)
+        else:
+            context = self._context(lambda: {"topic": event.topic.name})
+        self.logger.info("Publishing event %s", event, extra={"context": context})
+
+    def publishing_events(self, events):
+        """Logs that a chunk of events is being published in bulk
+
+        Parameters
+        ----------
+        events : list
+            The events being published
+        """
+        if not self._should_log(logging.INFO):
+            return
+
+        if self.log_payloads:
+            context = self._context(lambda: [event.request_json for event in events])
+        else:
+            context = self._context(lambda: summarize(events))
+        self.logger.info("Publishing %d Events", len(events), extra={"context": context})
+
+    def rolling_back(self, events):
+        """Logs that a session's queued events are being rolled back
+
+        Parameters
+        ----------
+        events : list
+            The events being rolled back
+        """
+        if not self.logger.isEnabledFor(logging.WARNING):
+            return
+
+        if self.log_payloads:
+            context = self._context(lambda: {"events": list(events)})
+        else:
+            context = self._context(lambda: summarize(events))
+        self.logger.warning("Rolling Back Session Events", extra={"context": context})
+
+
+def summarize(events):
+    """Summarizes events for logging without their payloads
+
+    Parameters
+    ----------
+    events : iterable
+        Events to summarize
+
+    Returns
+    -------
+    dict
+        The number of events, and the number of events per topic
+    """
+    topics = Counter(str(event) for event in events)
+    return {"count": sum(topics.values()), "topics": dict(topics)}
@@ -0,0 +1,259 @@
+import threading
+from bisect import bisect_left
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        """Counts of observed values by bucket
+
+        Parameters
+        ----------
+        buckets : tuple
+            Sorted upper bounds of each bucket. Values above the last bound are counted in an extra bucket.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """Counts of values less than or equal to each bucket's bound, ending with the total
+
+        Returns
+        -------
+        list
+            (upper bound, cumulative count) for every bucket, with float('inf') as the last bound
+        """
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def __repr__(self):
+        return "Histogram(count=%r, sum=%r)" % (self.count, self.sum)
+
+
+class InProcessMetrics(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Creates a new InProcessMetrics
+
+        The default metrics recorder. Keeps counters and latency histograms in memory, to be read
+        with `counter`, `histogram` or `snapshot`, or exported with `PrometheusTextExporter`.
+        Pass one to `EventClient` as `metrics` to start recording.
+
+        Any object with the same `increment` and `observe` methods can be used instead,
+        to forward metrics to another system.
+
+        Parameters
+        ----------
+        buckets : tuple, optional
+            Upper bounds of the latency histogram buckets in seconds (the default is DEFAULT_BUCKETS)
+
+        Notes
+        -----
+        Counters:
+
+        - ``events_published``, ``events_failed``, ``events_retried`` by endpoint: events the API accepted,
+          events that could not be delivered, and events sent again by a retry
+        - ``events_dropped`` by reason: events discarded by a full background queue or spool
+        - ``events_spooled``: events written to the spool after failing to publish
+        - ``retry_attempts``, ``partial_failures`` by endpoint: requests retried,
+          and responses where only some records failed
+        - ``retries_denied`` by endpoint: retries the limiter's retry budget did not allow
+
+        Histograms:
+
+        - ``validation_seconds``, ``serialization_seconds`` by topic: time to validate and encode each event
+        - ``http_seconds`` by endpoint: time for each request to the API
+        - ``flush_seconds``: time to flush a session
+        """
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "InProcessMetrics(buckets=%r)" % (self.buckets,)
+
+    def _after_fork(self):
+        """Starts a forked child from empty metrics, so the parent's aren't reported twice"""
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        """Adds to a counter
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter
+        value : int, optional
+            Amount to add (the default is 1)
+        **labels
+            Labels identifying the counter's series
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records a value in a histogram
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram
+        value : float
+            The observed value, in seconds for latencies
+        **labels
+            Labels identifying the histogram's series
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def counter(self, name, **labels):
+        """Gets the current value of a counter
+
+        Returns
+        -------
+        int
+            The counter's value, or 0 if it has never been incremented
+        """
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name, **labels):
+        """Gets a histogram
+
+        Returns
+        -------
+        Histogram
+            The histogram, or None if nothing has been observed in it
+        """
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+    def snapshot(self):
+        """Copies every counter and histogram into plain data
+
+        Returns
+        -------
+        dict
+            'counters' and 'histograms', each a list of dicts with the metric's name, labels, and
+            its value, or its count, sum and cumulative bucket counts
+        """
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "buckets": histogram.cumulative_counts(),
+                }
+                for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def reset(self):
+        """Clears every counter and histogram"""
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+
+class PrometheusTextExporter(object):
+    def __init__(self, metrics, namespace="bc_events"):
+        """Creates a new PrometheusTextExporter
+
+        Renders `InProcessMetrics` in the Prometheus text exposition format, to be served from
+        a service's existing metrics endpoint.
+
+        Parameters
+        ----------
+        metrics : InProcessMetrics
+            The metrics to export
+        namespace : str, optional
+            Prefix for every metric name (the default is 'bc_events')
+        """
+        self.metrics = metrics
+        self.namespace = namespace
+
+    def __repr__(self):
+        return "PrometheusTextExporter(metrics=%r, namespace=%r)" % (self.metrics, self.namespace)
+
+    def render(self):
+        """Renders every metric
+
+        Returns
+        -------
+        str
+            The metrics in the Prometheus text format
+        """
+        snapshot = self.metrics.snapshot()
+        lines = []
+
+        last_name = None
+        for counter in snapshot["counters"]:
+            name = "{0}_{1}_total".format(self.namespace, counter["name"])
+            if name != last_name:
+                lines.append("# TYPE {0} counter".format(name))
+                last_name = name
+            lines.append("{0}{1} {2}".format(name, format_labels(counter["labels"]), counter["value"]))
+
+        last_name = None
+        for histogram in snapshot["histograms"]:
+            name = "{0}_{1}".format(self.namespace, histogram["name"])
+            if name != last_name:
+                lines.append("# TYPE {0} histogram".format(name))
+                last_name = name
+
+            labels = histogram["labels"]
+            for bound, count in histogram["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append("{0}_bucket{1} {2}".format(name, format_labels(dict(labels, le=le)), count))
+            lines.append("{0}_sum{1} {2!r}".format(name, format_labels(labels), histogram["sum"]))
+            lines.append("{0}_count{1} {2}".format(name, format_labels(labels), histogram["count"]))
+
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    """Formats labels for the Prometheus text format
+
+    Parameters
+    ----------
+    labels : dict
+        Label names and values
+
+    Returns
+    -------
+    str
+        The labels in braces, or an empty string if there are none
+    """
+    if not labels:
+        return ""
+
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join('{0}="{1}"'.format(name, escape(value)) for name, value in sorted(labels.items())) + "}"
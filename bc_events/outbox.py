@@ -0,0 +1,271 @@
+import itertools
+import logging
+import threading
+import time
+
+from .event import EncodedEvent
+
+logger = logging.getLogger("bc.events")
+
+STATUS_PENDING = 0
+STATUS_SENT = 1
+STATUS_FAILED = 2
+
+PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+
+class EventOutbox(object):
+    def __init__(self, connection, table="bc_events_outbox", paramstyle="qmark"):
+        """Creates a new EventOutbox
+
+        A transactional outbox table. Sessions insert their events through the same DB-API connection
+        as the rest of the unit of work, so events are committed (or rolled back) together with it.
+        An `OutboxRelay` later delivers pending rows through the bulk API.
+
+        Parameters
+        ----------
+        connection : DB-API connection
+            Connection to write events with. Defaults to SQLite's paramstyle; see `paramstyle`.
+        table : str, optional
+            Name of the outbox table (the default is 'bc_events_outbox')
+        paramstyle : {'qmark', 'format', 'pyformat'}, optional
+            The paramstyle of the connection's driver (the default is 'qmark', as used by sqlite3)
+        """
+        if paramstyle not in PLACEHOLDERS:
+            raise ValueError("Unsupported paramstyle: " + str(paramstyle))
+
+        self.connection = connection
+        self.table = table
+        self.paramstyle = paramstyle
+
+        placeholder = PLACEHOLDERS[paramstyle]
+        self._insert_sql = "INSERT INTO {0} (status, created_at, job_id, payload) VALUES ({1}, {1}, {1}, {1})".format(
+            table, placeholder
+        )
+        self._select_sql = (
+            "SELECT id, job_id, payload FROM {0} WHERE status = {1} ORDER BY created_at, id LIMIT {1}".format(
+                table, placeholder
+            )
+        )
+        self._delete_sql = "DELETE FROM {0} WHERE id = {1}".format(table, placeholder)
+        self._mark_status_sql = "UPDATE {0} SET status = {1} WHERE id = {1}".format(table, placeholder)
+
+    def __repr__(self):
+        return "EventOutbox(connection=%r, table=%r, paramstyle=%r)" % (self.connection, self.table, self.paramstyle)
+
+    def create_table(self):
+        """Creates the outbox table and its index if they don't exist
+
+        The statements are written for SQLite. For other databases, create the equivalent table:
+        an auto-incrementing integer `id`, integer `status`, float `created_at`, text `job_id`,
+        binary `payload`, and an index on (status, created_at).
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS {0} ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "status INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "job_id TEXT, "
+            "payload BLOB NOT NULL)".format(self.table)
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS {0}_status_created_at ON {0} (status, created_at)".format(self.table)
+        )
+        self.connection.commit()
+
+    def add(self, events, job_id):
+        """Inserts events as pending rows without committing
+
+        The caller commits (or rolls back) the connection as part of its own transaction.
+
+        Parameters
+        ----------
+        events : list
+            Validated events to insert
+        job_id : str
+            Correlation ID of the session the events were published from
+        """
+        created_at = time.time()
+        rows = [(STATUS_PENDING, created_at, job_id, event.encoded) for event in events]
+        self.connection.cursor().executemany(self._insert_sql, rows)
+
+    def fetch_pending(self, limit):
+        """Fetches the oldest pending rows
+
+        Parameters
+        ----------
+        limit : int
+            Maximum number of rows to fetch
+
+        Returns
+        -------
+        list
+            (id, job_id, payload) for each row, oldest first
+        """
+        cursor = self.connection.cursor()
+        cursor.execute(self._select_sql, (STATUS_PENDING, limit))
+        return cursor.fetchall()
+
+    def mark_sent(self, ids, delete=True):
+        """Deletes, or marks as sent, delivered rows and commits
+
+        Parameters
+        ----------
+        ids : list
+            IDs of the delivered rows
+        delete : bool, optional
+            Delete the rows instead of updating their status (the default is True)
+        """
+        cursor = self.connection.cursor()
+        if delete:
+            cursor.executemany(self._delete_sql, [(row_id,) for row_id in ids])
+        else:
+            cursor.executemany(self._mark_status_sql, [(STATUS_SENT, row_id) for row_id in ids])
+        self.connection.commit()
+
+    def mark_failed(self, ids):
+        """Marks rows the API rejected for good as failed and commits
+
+        Failed rows are kept for inspection, but aren't fetched again.
+
+        Parameters
+        ----------
+        ids : list
+            IDs of the rejected rows
+        """
+        cursor = self.connection.cursor()
+        cursor.executemany(self._mark_status_sql, [(STATUS_FAILED, row_id) for row_id in ids])
+        self.connection.commit()
+
+
+class OutboxRelay(object):
+    def __init__(self, client, outbox, batch_size=5000, interval=1.0, delete_sent=True):
+        """Creates a new OutboxRelay
+
+        Delivers pending outbox rows through the bulk API. Meant to run in its own process
+        (or thread) with its own connection to the outbox database.
+
+        Parameters
+        ----------
+        client : EventClient
+            Client to send events with. Rows are packed into the client's bulk request limits.
+        outbox : EventOutbox
+            The outbox to deliver from
+        batch_size : int, optional
+            Maximum number of rows fetched from the outbox at once (the default is 5000)
+        interval : float, optional
+            Seconds to wait after finding the outbox empty, or after a failure (the default is 1.0)
+        delete_sent : bool, optional
+            Delete delivered rows instead of marking them sent (the default is True)
+        """
+        self.client = client
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.interval = interval
+        self.delete_sent = delete_sent
+
+    def __repr__(self):
+        return "OutboxRelay(client=%r, outbox=%r, batch_size=%r, interval=%r, delete_sent=%r)" % (
+            self.client,
+            self.outbox,
+            self.batch_size,
+            self.interval,
+            self.delete_sent,
+        )
+
+    def relay_once(self):
+        """Delivers one batch of pending rows
+
+        Consecutive rows from the same job are sent together, with the job ID in the x-britecore-job-id
+        header. After each bulk request, rows the API acknowledged are marked sent, and rows it rejected for
+        good are marked failed. If a request fails, or leaves records to retry, those rows and any after them
+        stay pending to be retried by the next call.
+
+        Returns
+        -------
+        int
+            The number of rows delivered
+        """
+        rows = self.outbox.fetch_pending(self.batch_size)
+        if not rows:
+            return 0
+
+        sent = 0
+        for job_id, job_rows in itertools.groupby(rows, key=lambda row: row[1]):
+            job_rows = list(job_rows)
+            events = [EncodedEvent(bytes(payload)) for _, _, payload in job_rows]
+            row_ids = {id(event): row[0] for event, row in zip(events, job_rows)}
+            headers = {"x-britecore-job-id": job_id} if job_id is not None else {}
+
+            for chunk in self.client._chunk_events(events):
+                try:
+                    rejected, undelivered = self._send(chunk, headers)
+                except Exception:
+                    logger.warning("Unable to relay {0} outbox Events, will try again later".format(len(chunk)))
+                    return sent
+
+                delivered = [row_ids[id(event)] for event in chunk if id(event.encoded) not in undelivered]
+                self.outbox.mark_sent(delivered, delete=self.delete_sent)
+                sent += len(delivered)
+
+                if rejected:
+                    logger.warning("The API rejected {0} outbox Events, marking them failed".format(len(rejected)))
+                    self.outbox.mark_failed([row_ids[id(event)] for event in chunk if id(event.encoded) in rejected])
+
+                if len(undelivered) > len(rejected):
+                    logger.warning(
+                        "Unable to relay {0} outbox Events, will try again later".format(
+                            len(undelivered) - len(rejected)
+                        )
+                    )
+                    return sent
+
+        return sent
+
+    def _send(self, chunk, headers):
+        """Sends a chunk of events in bulk, skipping ones already acknowledged
+
+        Parameters
+        ----------
+        chunk : list
+            Events to send
+        headers : dict
+            Extra request headers
+
+        Returns
+        -------
+        tuple
+            The ids of the encodings the API rejected for good, and of every encoding it didn't publish
+        """
+        pending = self.client._unacknowledged(chunk)
+        if not self.client.publish_bulk_url or not pending:
+            return set(), set()
+
+        bulk_api = self.client._events_api(
+            self.client.publish_bulk_url, [event.encoded for event in pending], headers=headers
+        )
+        try:
+            bulk_api.invoke()
+        finally:
+            self.client._acknowledge(pending, bulk_api)
+        return set(map(id, bulk_api.failed_records)), set(map(id, bulk_api.undelivered()))
+
+    def run(self, stopped=None):
+        """Relays batches until stopped
+
+        Parameters
+        ----------
+        stopped : threading.Event, optional
+            Set to stop relaying (the default is None, which relays forever)
+        """
+        stopped = stopped or threading.Event()
+        while not stopped.is_set():
+            try:
+                sent = self.relay_once()
+            except Exception:
+                logger.exception("Failed to relay outbox events")
+                sent = 0
+
+            if sent < self.batch_size:
+                stopped.wait(self.interval)
@@ -0,0 +1,168 @@
+import itertools
+import math
+import threading
+
+from .session import BULK_EVENT_SINGLE_PUBLISH_THRESHOLD
+
+
+class EndpointStats(object):
+    def __init__(self, alpha=0.2):
+        """Creates a new EndpointStats
+
+        Exponentially weighted moving averages of how long requests to one endpoint take,
+        including retries, and how often they succeed.
+
+        Parameters
+        ----------
+        alpha : float, optional
+            Weight of each new sample, between 0 and 1 (the default is 0.2)
+        """
+        self.alpha = alpha
+        self.latency = None
+        self.success_rate = None
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "EndpointStats(latency=%r, success_rate=%r, samples=%r)" % (
+            self.latency,
+            self.success_rate,
+            self.samples,
+        )
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def record(self, seconds, success):
+        """Records one request
+
+        Parameters
+        ----------
+        seconds : float
+            How long the request took, including retries
+        success : bool
+            Whether every event in the request was published
+        """
+        with self._lock:
+            if self.samples == 0:
+                self.latency = seconds
+                self.success_rate = 1.0 if success else 0.0
+            else:
+                self.latency += self.alpha * (seconds - self.latency)
+                self.success_rate += self.alpha * ((1.0 if success else 0.0) - self.success_rate)
+            self.samples += 1
+
+
+class ThresholdPublishPolicy(object):
+    def __init__(self, threshold=BULK_EVENT_SINGLE_PUBLISH_THRESHOLD):
+        """Creates a new ThresholdPublishPolicy
+
+        Flushes more than `threshold` events in bulk, and fewer one at a time.
+
+        Parameters
+        ----------
+        threshold : int, optional
+            Most events flushed one at a time (the default is BULK_EVENT_SINGLE_PUBLISH_THRESHOLD)
+        """
+        self.threshold = threshold
+
+    def __repr__(self):
+        return "ThresholdPublishPolicy(threshold=%r)" % (self.threshold,)
+
+    def use_bulk(self, count, client):
+        """Decides how to flush events
+
+        Parameters
+        ----------
+        count : int
+            Number of events being flushed
+        client : EventClient
+            The client the events are published with
+
+        Returns
+        -------
+        bool
+            True to publish the events in bulk, False to publish them one at a time
+        """
+        return count > self.threshold
+
+
+class AdaptivePublishPolicy(ThresholdPublishPolicy):
+    def __init__(
+        self, threshold=BULK_EVENT_SINGLE_PUBLISH_THRESHOLD, min_samples=10, explore_rate=0.05, max_explore_count=20
+    ):
+        """Creates a new AdaptivePublishPolicy
+
+        Flushes events whichever way is expected to finish sooner, from the latency and success rate
+        the client has measured for each endpoint. Single publishes are sent `single_concurrency` at a time,
+        bulk chunks one after another, and each request is expected to be repeated until it succeeds.
+
+        Until both endpoints have `min_samples` measurements it falls back to the threshold. An `explore_rate`
+        of flushes, spread evenly, use the other endpoint instead, so both measurements get started and
+        stay current: the one with fewer measurements while falling back, otherwise the one expected to be slower.
+        Only flushes of up to `max_explore_count` events explore, so a large flush is never sent one event at a time
+        just to take a measurement.
+
+        Single publishes carry the session's job ID in the x-britecore-job-id header and bulk requests don't,
+        so which endpoint a small flush uses can change how its events are correlated.
+
+        Parameters
+        ----------
+        threshold : int, optional
+            Most events flushed one at a time when falling back (the default is BULK_EVENT_SINGLE_PUBLISH_THRESHOLD)
+        min_samples : int, optional
+            Measurements needed from each endpoint before adapting (the default is 10)
+        explore_rate : float, optional
+            Fraction of flushes that use the other endpoint (the default is 0.05)
+        max_explore_count : int, optional
+            Most events in a flush that uses the other endpoint (the default is 20)
+        """
+        super().__init__(threshold)
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self.max_explore_count = max_explore_count
+        self._flushes = itertools.count(1)
+
+    def __repr__(self):
+        return "AdaptivePublishPolicy(threshold=%r, min_samples=%r, explore_rate=%r, max_explore_count=%r)" % (
+            self.threshold,
+            self.min_samples,
+            self.explore_rate,
+            self.max_explore_count,
+        )
+
+    def use_bulk(self, count, client):
+        single = client.publish_stats
+        bulk = client.publish_bulk_stats
+
+        # next() on a count is atomic, so concurrent flushes each get their own number
+        exploring = (
+            bool(self.explore_rate)
+            and count <= self.max_explore_count
+            and next(self._flushes) % max(round(1 / self.explore_rate), 1) == 0
+        )
+
+        if single.samples < self.min_samples or bulk.samples < self.min_samples:
+            if exploring:
+                return bulk.samples < single.samples
+            return super().use_bulk(count, client)
+
+        single_cost = math.ceil(count / max(client.single_concurrency, 1)) * expected_latency(single)
+        bulk_cost = math.ceil(count / client.max_bulk_events) * expected_latency(bulk)
+        return (bulk_cost <= single_cost) != exploring
+
+
+def expected_latency(stats):
+    """Expected seconds until a request to an endpoint succeeds
+
+    Parameters
+    ----------
+    stats : EndpointStats
+        Measurements of the endpoint
+
+    Returns
+    -------
+    float
+        The average latency, scaled up by the expected number of attempts
+    """
+    return stats.latency / max(stats.success_rate, 0.01)
@@ -0,0 +1,455 @@
+"""Re-publish historical events from JSONL exports or the client's own logs.
+
+Each input line holds an event as the client publishes it, or a json log line whose ``context`` holds one
+or a list of them, as logged with ``log_payloads``. Inputs may be plain JSONL, which is memory-mapped,
+or gzip-compressed NDJSON, which is streamed. Lines are validated in worker processes and sent in bulk
+chunks, and progress is checkpointed after every batch so an interrupted replay resumes where it stopped::
+
+    python -m bc_events replay path/to/topic_defitions.yaml events.jsonl older-events.ndjson.gz \\
+        --api-url https://api.mysite.britecore.com --checkpoint replay-checkpoint.json
+
+Events keep their ``eventId``, and events logged without one get an ID derived from the input's absolute path
+and the line's offset in it, so batches sent again after resuming are recognized as duplicates by the API.
+"""
+import gzip
+import json
+import logging
+import mmap
+import os
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .client import EventClient
+from .event import EncodedEvent, Event
+from .session import EventSession
+
+logger = logging.getLogger("bc.events")
+
+REPLAY_NAMESPACE = uuid.UUID("0f3c9e4e-5a5e-4d87-9a41-3c8f6f1d2b7a")
+
+# The worker process' client, used to resolve topics and validate events
+_worker_client = None
+
+
+class ReplayBatch(object):
+    __slots__ = ("path", "first_line", "first_offset", "end_line", "end_offset", "lines")
+
+    def __init__(self, path, first_line, first_offset, end_line, end_offset, lines):
+        """Consecutive lines read from one input
+
+        Parameters
+        ----------
+        path : str
+            The input the lines were read from
+        first_line : int
+            Number of lines in the input before this batch
+        first_offset : int
+            Offset of this batch's first line, in the input's uncompressed bytes
+        end_line : int
+            Number of lines in the input up to the end of this batch
+        end_offset : int
+            Offset just past this batch, in the input's uncompressed bytes
+        lines : list
+            The lines, as bytes
+        """
+        self.path = path
+        self.first_line = first_line
+        self.first_offset = first_offset
+        self.end_line = end_line
+        self.end_offset = end_offset
+        self.lines = lines
+
+    def __repr__(self):
+        return "ReplayBatch(path=%r, first_line=%r, end_line=%r)" % (self.path, self.first_line, self.end_line)
+
+
+class ReplayCheckpoint(object):
+    def __init__(self, path=None):
+        """Creates a new ReplayCheckpoint, loading any progress already saved at `path`
+
+        Parameters
+        ----------
+        path : str, optional
+            File to save progress to (the default is None, which keeps progress in memory)
+
+        Attributes
+        ----------
+        positions : dict
+            The offset and line number replayed up to, keyed by each input's absolute path
+        published : int
+            Events the API accepted so far
+        invalid : int
+            Lines skipped so far because they didn't hold valid events
+        duplicates : int
+            Events skipped so far because they were already published during the replay
+        rejected : int
+            Events the API rejected so far with errors that can't be retried
+        """
+        self.path = path
+        self.positions = {}
+        self.published = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+        if path is not None and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                saved = json.load(checkpoint_file)
+            self.positions = {input_path: tuple(position) for input_path, position in saved["positions"].items()}
+            self.published = saved["published"]
+            self.invalid = saved["invalid"]
+            self.duplicates = saved.get("duplicates", 0)
+            self.rejected = saved.get("rejected", 0)
+
+    def __repr__(self):
+        return "ReplayCheckpoint(path=%r, published=%r, invalid=%r)" % (self.path, self.published, self.invalid)
+
+    def position(self, input_path):
+        """Gets how far an input has been replayed
+
+        Parameters
+        ----------
+        input_path : str
+            Path of the input
+
+        Returns
+        -------
+        tuple
+            The offset and line number to resume from
+        """
+        return self.positions.get(os.path.abspath(input_path), (0, 0))
+
+    def advance(self, batch, published, invalid, duplicates=0, rejected=0):
+        """Records a replayed batch and saves the checkpoint
+
+        The checkpoint is written to a temporary file and renamed over the old one,
+        so a crash never leaves it half written.
+
+        Parameters
+        ----------
+        batch : ReplayBatch
+            The batch that was replayed
+        published : int
+            Events published from the batch
+        invalid : int
+            Lines skipped from the batch
+        duplicates : int, optional
+            Events skipped from the batch because they were already published (the default is 0)
+        rejected : int, optional
+            Events from the batch the API rejected (the default is 0)
+        """
+        self.positions[os.path.abspath(batch.path)] = (batch.end_offset, batch.end_line)
+        self.published += published
+        self.invalid += invalid
+        self.duplicates += duplicates
+        self.rejected += rejected
+
+        if self.path is None:
+            return
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as checkpoint_file:
+            saved = {
+                "positions": self.positions,
+                "published": self.published,
+                "invalid": self.invalid,
+                "duplicates": self.duplicates,
+                "rejected": self.rejected,
+            }
+            json.dump(saved, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temp_path, self.path)
+
+
+def read_lines(path, offset=0, use_mmap=True):
+    """Reads the lines of a JSONL or gzip-compressed NDJSON input
+
+    Plain files are memory-mapped, unless `use_mmap` is False. Files ending in ``.gz`` are streamed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the input
+    offset : int, optional
+        Offset in the uncompressed bytes to start reading at (the default is 0)
+    use_mmap : bool, optional
+        Whether to memory-map plain files (the default is True)
+
+    Yields
+    ------
+    tuple
+        The offset just past the line, and the line
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as input_file:
+            input_file.seek(offset)
+            for line in input_file:
+                offset += len(line)
+                yield offset, line
+        return
+
+    with open(path, "rb") as input_file:
+        if not use_mmap or os.fstat(input_file.fileno()).st_size == 0:
+            # Empty files can't be mapped
+            input_file.seek(offset)
+            for line in input_file:
+                offset += len(line)
+                yield offset, line
+            return
+
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            mapped.seek(offset)
+            for line in iter(mapped.readline, b""):
+                offset += len(line)
+                yield offset, line
+
+
+def read_batches(inputs, checkpoint, batch_size=5000, use_mmap=True):
+    """Reads inputs in batches of lines, resuming each from the checkpoint
+
+    Parameters
+    ----------
+    inputs : list
+        Paths of the inputs, read in order
+    checkpoint : ReplayCheckpoint
+        How far each input has been replayed
+    batch_size : int, optional
+        Most lines in a batch. Batches never span inputs. (the default is 5000)
+    use_mmap : bool, optional
+        Whether to memory-map plain files (the default is True)
+
+    Yields
+    ------
+    ReplayBatch
+        The next batch of lines
+    """
+    for path in inputs:
+        offset, line_number = checkpoint.position(path)
+        lines = []
+        first_line = line_number
+        first_offset = offset
+
+        for offset, line in read_lines(path, offset, use_mmap):
+            lines.append(line)
+            line_number += 1
+            if len(lines) >= batch_size:
+                yield ReplayBatch(path, first_line, first_offset, line_number, offset, lines)
+                lines = []
+                first_line = line_number
+                first_offset = offset
+
+        if lines:
+            yield ReplayBatch(path, first_line, first_offset, line_number, offset, lines)
+
+
+def parse_records(line):
+    """Parses the events held by an input line
+
+    Parameters
+    ----------
+    line : bytes
+        An event, or a json log line whose ``context`` holds an event or a list of events
+
+    Returns
+    -------
+    list
+        The event records
+    """
+    parsed = json.loads(line)
+    if isinstance(parsed, dict) and "context" in parsed and "action" not in parsed:
+        parsed = parsed["context"]
+    return parsed if isinstance(parsed, list) else [parsed]
+
+
+def build_event(client, record, sessions, event_id):
+    """Builds an event from a record, keeping its actor, job and ID
+
+    Parameters
+    ----------
+    client : EventClient
+        Client to resolve the record's topic with
+    record : dict
+        The event record
+    sessions : dict
+        Sessions built so far, keyed by actor and job
+    event_id : str
+        ID to give the event if the record doesn't have one
+
+    Raises
+    ------
+    ValueError
+        If the record's topic can't be found
+    KeyError
+        If the record is missing a field
+
+    Returns
+    -------
+    Event
+        The event, not yet validated
+    """
+    topic = client.get_topic(record.get("category") or client.default_category, record["entity"], record["action"])
+
+    actor = record["actor"]
+    key = (actor["id"], actor["type"], record.get("jobId"))
+    session = sessions.get(key)
+    if session is None:
+        session = sessions[key] = EventSession(actor["id"], actor["type"], record.get("jobId"), client)
+
+    return Event(topic=topic, data=record["data"], session=session, event_id=record.get("eventId") or event_id)
+
+
+def _init_worker(topic_definitions, service_name):
+    global _worker_client
+    _worker_client = EventClient(None, service_name, topic_definitions, deduplicate=False)
+
+
+def validate_batch(path, first_line, first_offset, lines, client=None):
+    """Validates and encodes the events in a batch of lines
+
+    Events without an ``eventId`` get one derived from the input's absolute path and the line's offset,
+    so the same line always gets the same ID, and lines of different inputs never share one.
+
+    Parameters
+    ----------
+    path : str
+        The input the lines were read from
+    first_line : int
+        Number of lines in the input before the batch
+    first_offset : int
+        Offset of the batch's first line, in the input's uncompressed bytes
+    lines : list
+        The lines, as bytes
+    client : EventClient, optional
+        Client to resolve topics with (the default is None, which uses the worker process' client)
+
+    Returns
+    -------
+    tuple
+        The encoded events, and (line number, error) for each line that was skipped
+    """
+    client = client or _worker_client
+    path = os.path.abspath(path)
+    sessions = {}
+    encoded = []
+    errors = []
+
+    offset = first_offset
+    for line_number, line in enumerate(lines, first_line + 1):
+        line_offset = offset
+        offset += len(line)
+        if not line.strip():
+            continue
+
+        try:
+            events = [
+                build_event(client, record, sessions, uuid.uuid5(REPLAY_NAMESPACE, f"{path}:{line_offset}:{i}").hex)
+                for i, record in enumerate(parse_records(line))
+            ]
+            for event in events:
+                event.validate()
+        except KeyError as e:
+            errors.append((line_number, "Missing field " + str(e)))
+        except Exception as e:
+            errors.append((line_number, getattr(e, "message", str(e))))
+        else:
+            encoded.extend(event.encoded for event in events)
+
+    return encoded, errors
+
+
+def replay(
+    client, topic_definitions, inputs, checkpoint=None, workers=None, concurrency=4, batch_size=5000, use_mmap=True
+):
+    """Re-publishes the events in a list of inputs
+
+    Batches are validated in worker processes while earlier batches are sent, each in bulk chunks sent
+    `concurrency` at a time. The checkpoint advances once every chunk in a batch has been published.
+
+    Parameters
+    ----------
+    client : EventClient
+        Client to publish events with
+    topic_definitions : str
+        Path of the topic definitions, loaded by each worker process
+    inputs : list
+        Paths of JSONL or NDJSON.gz inputs, replayed in order
+    checkpoint : ReplayCheckpoint, optional
+        Progress to resume from and record to (the default is None, which starts from the beginning)
+    workers : int, optional
+        Number of worker processes validating events. 0 validates in this process.
+        (the default is None, which uses one per CPU)
+    concurrency : int, optional
+        Maximum number of bulk chunks sent at once (the default is 4)
+    batch_size : int, optional
+        Lines per batch, and so per checkpoint (the default is 5000)
+    use_mmap : bool, optional
+        Whether to memory-map plain inputs (the default is True)
+
+    Raises
+    ------
+    Exception
+        Whatever publishing a chunk raised. The checkpoint still holds the last fully replayed batch.
+
+    Returns
+    -------
+    ReplayCheckpoint
+        The checkpoint, with the totals replayed
+    """
+    checkpoint = checkpoint or ReplayCheckpoint()
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    processes = None
+    if workers > 0:
+        processes = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(topic_definitions, client.service_name)
+        )
+
+    def send_chunk(chunk):
+        # Events already acknowledged in this run are duplicates in the inputs, not new publishes
+        pending = client._unacknowledged(chunk)
+        return len(chunk) - len(pending), client._send_bulk_chunk(pending)[1]
+
+    def send(batch, encoded, errors):
+        for line_number, error in errors:
+            logger.warning("Skipping {0} line {1}: {2}".format(batch.path, line_number, error))
+
+        published = duplicates = 0
+        chunks = list(client._chunk_events(EncodedEvent(event) for event in encoded))
+        for chunk_duplicates, delivered in threads.map(send_chunk, chunks):
+            duplicates += chunk_duplicates
+            published += delivered
+
+        rejected = len(encoded) - duplicates - published
+        if rejected:
+            logger.warning("The API rejected {0} events from {1}".format(rejected, batch.path))
+        checkpoint.advance(batch, published, len(errors), duplicates, rejected)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as threads:
+        try:
+            for batch in read_batches(inputs, checkpoint, batch_size, use_mmap):
+                if processes is None:
+                    send(batch, *validate_batch(batch.path, batch.first_line, batch.first_offset, batch.lines, client))
+                    continue
+
+                future = processes.submit(validate_batch, batch.path, batch.first_line, batch.first_offset, batch.lines)
+                pending.append((batch, future))
+                # Only the lines of batches waiting to be validated are held in memory
+                batch.lines = None
+                if len(pending) > workers:
+                    batch, future = pending.popleft()
+                    send(batch, *future.result())
+
+            while pending:
+                batch, future = pending.popleft()
+                send(batch, *future.result())
+        finally:
+            if processes is not None:
+                for _, future in pending:
+                    future.cancel()
+                processes.shutdown()
+
+    return checkpoint
@@ -1,17 +1,112 @@
-import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import wait
 
 from kwargs_only import kwargs_only
 
+from .buffer import EventBuffer
 from .event import Event
-from .utils import EventsApiRetryingWrapper
+from .topic import Topic
 
-logger = logging.getLogger("bc.events")
 MAX_BULK_EVENTS = 250
+MAX_BULK_BYTES = 5 * 1024 * 1024
 BULK_EVENT_SINGLE_PUBLISH_THRESHOLD = 5
 
 
+class BulkPublishResult(object):
+    def __init__(self):
+        """Aggregate outcome of publishing events in bulk chunks
+
+        Attributes
+        ----------
+        responses : list
+            API responses for each chunk that was sent, in chunk order.
+            Contains None for chunks that weren't sent because no url is set or they were already
+            published, and for chunks whose remainder was spooled.
+        failures : list
+            (chunk index, chunk events, exception) for each chunk that could not be published
+        published : int
+            Number of events the API accepted
+        rejected : int
+            Number of events sent that the API didn't accept, including any that were spooled
+        skipped : int
+            Number of events not sent, because they were already published or no url is set
+        """
+        self.responses = []
+        self.failures = []
+        self.published = 0
+        self.rejected = 0
+        self.skipped = 0
+
+    @property
+    def failed(self):
+        """Number of events in chunks that could not be published"""
+        return sum(len(chunk) for _, chunk, _ in self.failures)
+
+    def __repr__(self):
+        return "BulkPublishResult(published=%r, rejected=%r, skipped=%r, failed=%r)" % (
+            self.published,
+            self.rejected,
+            self.skipped,
+            self.failed,
+        )
+
+    def add_chunk(self, chunk, outcome, keep_response=True):
+        """Counts a chunk that was sent without raising
+
+        Parameters
+        ----------
+        chunk : list
+            The chunk's events
+        outcome : tuple
+            What the client's `_send_bulk_chunk` returned: the response, and the number of
+            events published and rejected
+        keep_response : bool, optional
+            Add the response to `responses` (the default is True)
+        """
+        response, published, rejected = outcome
+        if keep_response:
+            self.responses.append(response)
+        self.published += published
+        self.rejected += rejected
+        self.skipped += len(chunk) - published - rejected
+
+
+class BulkPublishError(Exception):
+    def __init__(self, result):
+        """Raised when one or more chunks of a bulk publish fail, or a stream stops early
+
+        Parameters
+        ----------
+        result : BulkPublishResult
+            The aggregate outcome, including every chunk failure
+        """
+        total = result.failed + result.published + result.rejected + result.skipped
+        message = "{0} of {1} events failed to publish".format(result.failed, total)
+        if result.failures:
+            message += ": {0}".format(result.failures[0][2])
+        super().__init__(message)
+        self.result = result
+
+
 class EventSession(object):
-    def __init__(self, actor_id, actor_type, job_id, client, publish_immediately=False):
+    __slots__ = (
+        "actor_id",
+        "actor_type",
+        "job_id",
+        "client",
+        "publish_immediately",
+        "outbox",
+        "columnar",
+        "events",
+        "_publishers",
+    )
+
+    # The Event type this session's events are built as
+    event_class = Event
+
+    def __init__(self, actor_id, actor_type, job_id, client, publish_immediately=False, outbox=None, columnar=False):
         """Creates a new EventSession
 
         Parameters
@@ -30,6 +125,13 @@ class EventSession(object):
             Indicates whether events should be published as soon as `publish` is called,
             or if they should be queued and flushed.
             (the default is False, which requires a `flush` before events are truly published)
+        outbox : EventOutbox, optional
+            Outbox to write events to on `flush`, in the outbox connection's current transaction.
+            Its connection should belong to the session's unit of work, not be shared across threads.
+            (the default is None, which sends events on `flush`)
+        columnar : bool, optional
+            Queue events in a compact `EventBuffer` instead of a list of `Event` objects.
+            Useful for long-running sessions and backfills that queue many events. (the default is False)
         """
         self.actor_id = actor_id
         self.actor_type = actor_type
@@ -37,7 +139,10 @@ class EventSession(object):
         self.client = client
 
         self.publish_immediately = publish_immediately
-        self.events = []
+        self.outbox = outbox
+        self.columnar = columnar
+        self.events = EventBuffer(self) if columnar else []
+        self._publishers = {}
 
     def __repr__(self):
         return "EventSession(actor_id=%r, actor_type=%r, job_id=%r, client=%r, publish_immediately=%r)" % (
@@ -55,19 +160,55 @@ class EventSession(object):
         if the session's context is successful.
         If the context fails for any reason, and flush is not called,
         will not send events and don't have to worry about rolling them back.
+
+        If the session has an outbox, events are validated here and inserted into it
+        without committing, so they are committed along with the rest of the transaction.
+        If the client has a background dispatcher, events are validated here and
+        handed off to be sent from the dispatcher's worker thread.
+        If the client coalesces flushes, events are validated here and sent in a bulk request
+        shared with other sessions flushing at the same time.
         """
 
-        # If there are less than BULK_EVENT_SINGLE_POST_THRESHOLD events in the queue, publish individually
-        if len(self.events) <= BULK_EVENT_SINGLE_PUBLISH_THRESHOLD:
+        metrics = self.client.metrics
+        if metrics is None:
+            return self._flush()
+
+        start = time.perf_counter()
+        try:
+            self._flush()
+        finally:
+            metrics.observe("flush_seconds", time.perf_counter() - start)
+
+    def _flush(self):
+        if self.outbox is not None:
             for event in self.events:
-                event.publish()
-        else:
+                event.validate()
+            self.outbox.add(self.events, self.job_id)
+            return
+
+        if self.client.dispatcher is not None:
+            for event in self.events:
+                event.validate()
+            self.client.dispatcher.submit(self.events)
+            return
+
+        if self.client.coalescer is not None:
+            for event in self.events:
+                event.validate()
+            self.client.coalescer.publish(self.events)
+            return
+
+        # The client's publish policy picks single or bulk publishing, from the number of events
+        # and how each endpoint has been performing
+        if self.client.publish_policy.use_bulk(len(self.events), self.client):
             self.publish_bulk(self.events)
+        else:
+            self.publish_each(self.events)
 
     def rollback(self):
         """Rolls back any events in the queue for this session since the last flush."""
-        logger.warning("Rolling Back Session Events", extra={"context": {"events": self.events}})
-        self.events = []
+        self.client.event_logger.rolling_back(self.events)
+        self.events = EventBuffer(self) if self.columnar else []
 
     def _publish(self, topic, data):
         """Internal method for publishing data to a topic
@@ -80,12 +221,12 @@ class EventSession(object):
             The data payload for the event
         """
 
-        event = Event(topic=topic, data=data, session=self)
-
         if self.publish_immediately:
-            event.publish()
+            self.event_class(topic=topic, data=data, session=self).publish()
+        elif self.columnar:
+            self.events.add(topic, data)
         else:
-            self.events.append(event)
+            self.events.append(self.event_class(topic=topic, data=data, session=self))
 
     @kwargs_only
     def publish(self, action=None, entity=None, data=None, category=None):
@@ -113,27 +254,256 @@ class EventSession(object):
 
         category = category or self.client.default_category
         topic = self.client.get_topic(category, entity, action)
-        self._publish(topic, data)
+        return self._publish(topic, data)
 
-    def publish_bulk(self, events):
+    def publish_each(self, events, concurrency=None):
+        """Publish events one at a time
+
+        By default events are sent in order, and the first failure is raised right away. With a concurrency
+        above 1, up to that many events are sent in parallel from the client's thread pool, so they may
+        reach the API out of order, and every event is attempted before the first failure is raised.
+
+        Parameters
+        ----------
+        events : list
+            A list of events to publish
+        concurrency : int, optional
+            Maximum number of events in flight at once
+            (the default is None, which uses the client's `single_concurrency`)
+        """
+
+        concurrency = concurrency or self.client.single_concurrency
+        if concurrency <= 1 or len(events) <= 1 or not self.client.publish_url:
+            for event in events:
+                event.publish()
+            return
+
+        futures = self._submit(lambda event: event.publish(), events, concurrency)
+
+        for future in futures:
+            future.result()
+
+    def _submit(self, function, items, concurrency):
+        """Calls a function on each item from the client's thread pool, with up to `concurrency` calls in flight
+
+        Parameters
+        ----------
+        function : callable
+            Called with each item
+        items : iterable
+            The items to call it on
+        concurrency : int
+            Maximum number of calls in flight at once
+
+        Returns
+        -------
+        list
+            A finished future for each item, in order
+        """
+        executor = self.client._publish_executor(concurrency)
+        futures = []
+        for item in items:
+            if len(futures) >= concurrency:
+                # Every earlier call has been waited for already
+                wait([futures[-concurrency]])
+            futures.append(executor.submit(function, item))
+
+        wait(futures)
+        return futures
+
+    def publish_bulk(self, events, concurrency=None):
         """Publish all events
 
+        Events are packed into chunks by count and encoded size, up to the client's `max_bulk_events`
+        and `max_bulk_bytes`. Chunks are sent in order, stopping at the first failure. With a concurrency
+        above 1, chunks are sent in parallel and every chunk is attempted before any failure is raised.
+
         Parameters
         ----------
         events : list
             A list of events to publish
+        concurrency : int, optional
+            Maximum number of chunks in flight at once
+            (the default is None, which uses the client's `bulk_concurrency`)
+
+        Raises
+        ------
+        BulkPublishError
+            If any chunk fails. Its `result` holds the outcome of every chunk that was attempted.
+
+        Returns
+        -------
+        BulkPublishResult
+            The aggregate outcome of every chunk
+        """
+
+        concurrency = concurrency or self.client.bulk_concurrency
+        chunks = list(self.client._chunk_events(events))
+        result = BulkPublishResult()
+
+        if concurrency <= 1 or len(chunks) <= 1:
+            for index, chunk in enumerate(chunks):
+                try:
+                    result.add_chunk(chunk, self.client._send_bulk_chunk(chunk))
+                except Exception as e:
+                    # Chunks go out in order, so nothing after a failure is sent
+                    result.failures.append((index, chunk, e))
+                    raise BulkPublishError(result) from e
+            return result
+
+        futures = self._submit(self.client._send_bulk_chunk, chunks, concurrency)
+
+        for index, (chunk, future) in enumerate(zip(chunks, futures)):
+            exception = future.exception()
+            if exception is not None:
+                result.failures.append((index, chunk, exception))
+            else:
+                result.add_chunk(chunk, future.result())
+
+        if result.failures:
+            raise BulkPublishError(result)
+
+        return result
+
+    def _stream_events(self, items):
+        """Builds and validates events as they are read from an iterable
+
+        Parameters
+        ----------
+        items : iterable
+            `Event` objects, or (topic, data) pairs where topic is a `Topic` or a topic name
+
+        Raises
+        ------
+        ValueError
+            If a topic name doesn't match a topic
+        jsonschema.ValidationError
+            If an event doesn't validate
+
+        Yields
+        ------
+        Event
+            The next validated event
+        """
+        for item in items:
+            if isinstance(item, Event):
+                event = item
+            else:
+                topic, data = item
+                if not isinstance(topic, Topic):
+                    try:
+                        topic = self.client.topic_table[topic]
+                    except KeyError:
+                        raise ValueError("Topic not found: " + str(topic))
+                event = self.event_class(topic=topic, data=data, session=self)
+
+            event.validate()
+            yield event
+
+    def publish_stream(self, items, concurrency=None, max_in_flight=None):
+        """Validate and publish events in bulk as they are read from an iterable
+
+        Unlike `publish_bulk`, events are never held in a list. Each event is validated and encoded as it is
+        read, and chunks are sent as soon as they fill, so a backfill of any size only keeps `max_in_flight`
+        chunks in memory, plus the one being filled. Events aren't queued on the session, and
+        the result doesn't keep the API responses.
+
+        Parameters
+        ----------
+        items : iterable
+            An iterator or generator of `Event` objects, or (topic, data) pairs where topic is
+            a `Topic` or a topic name like ``"testing.TestCreated"``
+        concurrency : int, optional
+            Maximum number of chunks sent at once
+            (the default is None, which uses the client's `bulk_concurrency`)
+        max_in_flight : int, optional
+            Maximum number of chunks sent or waiting to be sent before reading more events
+            (the default is None, which uses `concurrency`)
+
+        Raises
+        ------
+        BulkPublishError
+            If any chunk fails, or reading stops early, e.g. because a topic name doesn't match a topic
+            or an event doesn't validate. Chunks read before that are still sent. Its `result` holds the
+            outcome of every chunk that was attempted, and a failure with no events for the read error.
+            Without concurrency, sending stops at the first failed chunk.
+
+        Returns
+        -------
+        BulkPublishResult
+            The number of events published, and any chunk failures
         """
 
-        all_event_data = [event.request_json for event in events]
+        concurrency = concurrency or self.client.bulk_concurrency
+        max_in_flight = max(max_in_flight or concurrency, 1)
+        result = BulkPublishResult()
+        read_chunks = 0
+        read_error = None
+
+        def read():
+            nonlocal read_chunks, read_error
+            try:
+                for chunk in self.client._chunk_events(self._stream_events(items)):
+                    read_chunks += 1
+                    yield chunk
+            except Exception as e:
+                read_error = e
+
+        if concurrency <= 1:
+            for index, chunk in enumerate(read()):
+                try:
+                    result.add_chunk(chunk, self.client._send_bulk_chunk(chunk), keep_response=False)
+                except Exception as e:
+                    result.failures.append((index, chunk, e))
+                    break
+        else:
+            self._send_stream(read(), result, concurrency, max_in_flight)
+
+        if read_error is not None:
+            result.failures.append((read_chunks, [], read_error))
+        if result.failures:
+            raise BulkPublishError(result) from result.failures[0][2]
 
-        # Publish up to MAX_BULK_EVENTS events at a time
-        for i in range(0, len(all_event_data), MAX_BULK_EVENTS):
-            event_data = all_event_data[i : i + MAX_BULK_EVENTS]
-            logger.info("Publishing {0} Events".format(len(event_data)), extra={"context": event_data})
+        return result
 
-            if self.client.publish_bulk_url:
-                bulk_api = EventsApiRetryingWrapper(self.client.publish_bulk_url, event_data)
-                bulk_api.invoke()
+    def _send_stream(self, chunks, result, concurrency, max_in_flight):
+        """Sends chunks from the client's thread pool as they are read, collecting their outcomes
+
+        Parameters
+        ----------
+        chunks : iterable
+            Chunks of events to send
+        result : BulkPublishResult
+            Where each chunk's outcome is counted
+        concurrency : int
+            Maximum number of chunks sent at once
+        max_in_flight : int
+            Maximum number of chunks sent or waiting to be sent before reading more
+        """
+
+        def collect(index, chunk, future):
+            exception = future.exception()
+            if exception is not None:
+                result.failures.append((index, chunk, exception))
+            else:
+                result.add_chunk(chunk, future.result(), keep_response=False)
+
+        # The client's pool is shared, so chunks waiting to be sent hold a thread without a request
+        sending = threading.Semaphore(concurrency)
+
+        def send(chunk):
+            with sending:
+                return self.client._send_bulk_chunk(chunk)
+
+        in_flight = deque()
+        executor = self.client._publish_executor(max_in_flight)
+        for index, chunk in enumerate(chunks):
+            if len(in_flight) >= max_in_flight:
+                collect(*in_flight.popleft())
+            in_flight.append((index, chunk, executor.submit(send, chunk)))
+
+        while in_flight:
+            collect(*in_flight.popleft())
 
     def __getattr__(self, attr_name):
         """Magic handler to allow shortcuts to the `publish` method
@@ -157,23 +527,22 @@ class EventSession(object):
             A wrapped call to `publish` that only accepts the event payload data
         """
 
-        def build_entity_action_pair(entity_parts, action):
-            entity = "".join([part.capitalize() for part in entity_parts])
-            return entity, action.capitalize()
+        # Private and special names are never shortcuts. This also keeps copy and pickle
+        # from recursing here before __init__ has run.
+        if attr_name.startswith("_"):
+            raise AttributeError(attr_name)
 
-        attr_parts = attr_name.split("_")
-
-        entity, action = build_entity_action_pair(attr_parts[:-1], attr_parts[-1])
         try:
-            topic = self.client.get_topic(self.client.default_category, entity, action)
-        except ValueError:
-            entity, action = build_entity_action_pair(attr_parts[1:], attr_parts[0])
-            try:
-                topic = self.client.get_topic(self.client.default_category, entity, action)
-            except ValueError:
-                raise AttributeError("Could not resolve convenience wrapper for: " + attr_name)
+            return self._publishers[attr_name]
+        except KeyError:
+            pass
+
+        topic = self.client.resolve_shortcut(attr_name)
+        if topic is None:
+            raise AttributeError("Could not resolve convenience wrapper for: " + attr_name)
 
         def publish_wrapper(data):
-            self._publish(topic, data)
+            return self._publish(topic, data)
 
+        self._publishers[attr_name] = publish_wrapper
         return publish_wrapper
@@ -0,0 +1,453 @@
+import logging
+import os
+import threading
+import uuid
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from .constants import SPOOL_FSYNC_ALWAYS, SPOOL_FSYNC_NEVER, SPOOL_FSYNC_SEGMENT
+from .event import EncodedEvent
+
+logger = logging.getLogger("bc.events")
+
+ACTIVE_SUFFIX = ".open"
+SEALED_SUFFIX = ".spool"
+LOCK_NAME = "spool.lock"
+
+# Spools in this process by token, so their active segments aren't mistaken for abandoned ones
+_live_spools = weakref.WeakValueDictionary()
+
+
+class EventSpool(object):
+    def __init__(
+        self, directory, segment_bytes=16 * 1024 * 1024, max_bytes=256 * 1024 * 1024, fsync=SPOOL_FSYNC_SEGMENT
+    ):
+        """Creates a new EventSpool
+
+        An append-only log of events that could not be delivered, stored as newline-delimited json
+        in numbered segment files. Events are appended to an active segment, which is sealed by an
+        atomic rename once it reaches `segment_bytes`. Only sealed segments are replayed, so a crash
+        can at most lose a partially written line from the active segment, which is trimmed on startup.
+
+        Several processes, like the forked workers of a server, may share a directory. Each appends to
+        its own active segment, and replay and recovery take a lock file in the directory so only one
+        process at a time sends or deletes segments.
+
+        Parameters
+        ----------
+        directory : str
+            Directory to store segments in. Created if it does not exist.
+        segment_bytes : int, optional
+            Size at which the active segment is sealed and a new one started (the default is 16 MiB)
+        max_bytes : int, optional
+            Maximum disk usage of the spool. When exceeded, the oldest sealed segments are deleted.
+            (the default is 256 MiB)
+        fsync : {'always', 'segment', 'never'}, optional
+            When to fsync. After every append, when a segment is sealed, or never. (the default is 'segment')
+        """
+        if fsync not in (SPOOL_FSYNC_ALWAYS, SPOOL_FSYNC_SEGMENT, SPOOL_FSYNC_NEVER):
+            raise ValueError("Unknown fsync policy: " + str(fsync))
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+
+        self.dropped = 0
+
+        self._lock = threading.RLock()
+        self._active = None
+        self._active_path = None
+        self._token = uuid.uuid4().hex[:8]
+        _live_spools[self._token] = self
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def __repr__(self):
+        return "EventSpool(directory=%r, segment_bytes=%r, max_bytes=%r, fsync=%r)" % (
+            self.directory,
+            self.segment_bytes,
+            self.max_bytes,
+            self.fsync,
+        )
+
+    def _segments(self, suffix):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(suffix))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _next_sequence(self):
+        names = [name for name in os.listdir(self.directory) if name.endswith((ACTIVE_SUFFIX, SEALED_SUFFIX))]
+        if not names:
+            return 0
+        # Segments are named {sequence}-{pid}, or just {sequence} by older versions
+        return max(int(name.split(".", 1)[0].split("-", 1)[0]) for name in names) + 1
+
+    def _fsync_directory(self):
+        if self.fsync == SPOOL_FSYNC_NEVER or not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def _directory_lock(self, blocking=True):
+        """Holds an exclusive lock on the directory, shared by every process using it
+
+        Yields
+        ------
+        bool
+            Whether the lock was acquired. Always True when `blocking`.
+        """
+        if fcntl is None:  # pragma: no cover
+            # Without flock there is no fork either, so only this process uses the directory
+            yield True
+            return
+
+        # Locks belong to the open file, so each holder opens its own, even threads of the same process
+        with open(os.path.join(self.directory, LOCK_NAME), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _abandoned(self, path):
+        """Whether an active segment was left behind by a spool that is no longer running"""
+        if path == self._active_path:
+            return False
+
+        # Segments are named {sequence}-{pid}-{token}, or {sequence}-{pid} or {sequence} by older versions
+        parts = os.path.basename(path)[: -len(ACTIVE_SUFFIX)].split("-")
+        if len(parts) < 2:
+            return True
+
+        pid = int(parts[1])
+        if pid == os.getpid():
+            # Either another spool in this process, or one from an earlier process that had the same pid
+            return len(parts) < 3 or parts[2] not in _live_spools
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # Running as another user
+            return False
+        return False
+
+    def _recover(self):
+        """Trims torn writes from active segments left behind by a crash and seals them
+
+        Active segments of spools that are still running are left alone, they are still being appended to.
+        If another process holds the directory lock, probably to replay, this does nothing, since replay
+        recovers abandoned segments too.
+        """
+        with self._directory_lock(blocking=False) as locked:
+            if locked:
+                self._recover_abandoned()
+
+    def _recover_abandoned(self):
+        with self._lock:
+            for path in self._segments(ACTIVE_SUFFIX):
+                if self._abandoned(path):
+                    self._recover_segment(path)
+            self._fsync_directory()
+
+    def _recover_segment(self, path):
+        try:
+            segment = open(path, "rb+")
+        except FileNotFoundError:
+            return
+
+        with segment:
+            contents = segment.read()
+            complete = contents.rfind(b"\n") + 1
+            if complete != len(contents):
+                logger.warning("Trimming {0} bytes of a partial write from {1}".format(len(contents) - complete, path))
+                segment.truncate(complete)
+                os.fsync(segment.fileno())
+
+        if complete:
+            os.rename(path, path[: -len(ACTIVE_SUFFIX)] + SEALED_SUFFIX)
+        else:
+            os.remove(path)
+
+    def _seal(self):
+        """Closes the active segment and atomically renames it so it can be replayed"""
+        if self._active is None:
+            return
+
+        self._active.flush()
+        if self.fsync != SPOOL_FSYNC_NEVER:
+            os.fsync(self._active.fileno())
+        self._active.close()
+
+        os.rename(self._active_path, self._active_path[: -len(ACTIVE_SUFFIX)] + SEALED_SUFFIX)
+        self._fsync_directory()
+
+        self._active = None
+        self._active_path = None
+
+    def _enforce_max_bytes(self, incoming_bytes):
+        sealed = self._segments(SEALED_SUFFIX)
+        usage = self.size() + incoming_bytes
+
+        while sealed and usage > self.max_bytes:
+            oldest = sealed.pop(0)
+            oldest_bytes = os.path.getsize(oldest)
+            with open(oldest, "rb") as segment:
+                self.dropped += sum(1 for _ in segment)
+            os.remove(oldest)
+            usage -= oldest_bytes
+            logger.warning("Event spool is full, deleted oldest segment {0}".format(oldest))
+
+    def size(self):
+        """Current disk usage of the spool in bytes
+
+        Returns
+        -------
+        int
+            Total size of every segment
+        """
+        with self._lock:
+            if self._active is not None:
+                self._active.flush()
+            paths = self._segments(ACTIVE_SUFFIX) + self._segments(SEALED_SUFFIX)
+            return sum(os.path.getsize(path) for path in paths)
+
+    def append(self, encoded_events):
+        """Appends events to the active segment
+
+        Parameters
+        ----------
+        encoded_events : list
+            The json encoding of each event, as bytes
+        """
+        if not encoded_events:
+            return
+
+        data = b"".join(encoded + b"\n" for encoded in encoded_events)
+
+        with self._lock:
+            self._enforce_max_bytes(len(data))
+
+            if self._active is None:
+                # The pid and token keep forked processes, and other spools in this one, sharing the directory
+                # from appending to the same segment
+                self._active_path = os.path.join(
+                    self.directory,
+                    "{0:020d}-{1}-{2}{3}".format(self._next_sequence(), os.getpid(), self._token, ACTIVE_SUFFIX),
+                )
+                self._active = open(self._active_path, "ab")
+
+            self._active.write(data)
+            self._active.flush()
+            if self.fsync == SPOOL_FSYNC_ALWAYS:
+                os.fsync(self._active.fileno())
+
+            if self._active.tell() >= self.segment_bytes:
+                self._seal()
+
+    def _after_fork(self):
+        """Lets go of the parent's active segment in a forked child, which starts its own"""
+        self._lock = threading.RLock()
+        if self._active is not None:
+            # Appends are flushed as they are written, so this only closes the child's copy of the file
+            self._active.close()
+        self._active = None
+        self._active_path = None
+
+    def close(self):
+        """Seals the active segment"""
+        with self._lock:
+            self._seal()
+
+    def replay(self, client):
+        """Sends every spooled event to the bulk API, oldest first
+
+        The active segment is sealed first, and active segments abandoned by processes that have exited are
+        recovered. Each segment is deleted once all of its events have been sent. Replay stops at the first
+        segment that fails, leaving it and everything after it in place. Delivery is at-least-once: events
+        from a segment that partially succeeded are sent again next time.
+
+        If another process sharing the directory is already replaying, this returns right away.
+
+        Parameters
+        ----------
+        client : EventClient
+            Client to send events with. Events are packed into the client's bulk request limits.
+
+        Returns
+        -------
+        int
+            The number of events sent
+        """
+        with self._directory_lock(blocking=False) as locked:
+            if not locked:
+                logger.debug("Another process is replaying {0}".format(self.directory))
+                return 0
+            return self._replay(client)
+
+    def _replay(self, client):
+        with self._lock:
+            self._seal()
+            self._recover_abandoned()
+        segments = self._segments(SEALED_SUFFIX)
+
+        sent = 0
+        for path in segments:
+            try:
+                with open(path, "rb") as segment:
+                    events = [EncodedEvent(line.rstrip(b"\n")) for line in segment if line.strip()]
+            except FileNotFoundError:
+                # Deleted to stay under max_bytes since we listed it
+                continue
+
+            try:
+                rejected = self._replay_events(client, events, path)
+            except Exception:
+                logger.warning("Unable to replay spooled events from {0}, will try again later".format(path))
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            sent += len(events) - rejected
+
+        if sent:
+            logger.info("Replayed {0} spooled Events".format(sent))
+        return sent
+
+    def _replay_events(self, client, events, path):
+        """Sends the events of one segment in bulk chunks
+
+        Records the API rejects for good are logged with their contents, since the segment is deleted
+        once this returns.
+
+        Parameters
+        ----------
+        client : EventClient
+            Client to send events with
+        events : list
+            The segment's events
+        path : str
+            The segment's path, for logging
+
+        Raises
+        ------
+        RuntimeError
+            If the API left records that can still be retried undelivered
+
+        Returns
+        -------
+        int
+            The number of events the API rejected for good
+        """
+        rejected = 0
+        for chunk in client._chunk_events(client._unacknowledged(events)):
+            if not client.publish_bulk_url:
+                continue
+
+            bulk_api = client._events_api(client.publish_bulk_url, [event.encoded for event in chunk])
+            try:
+                bulk_api.invoke()
+            finally:
+                client._acknowledge(chunk, bulk_api)
+
+            undelivered = bulk_api.undelivered()
+            if len(undelivered) > len(bulk_api.failed_records):
+                raise RuntimeError("{0} spooled Events were not delivered".format(len(undelivered)))
+
+            if bulk_api.failed_records:
+                rejected += len(bulk_api.failed_records)
+                logger.error(
+                    "The API rejected {0} spooled Events from {1}, dropping them".format(
+                        len(bulk_api.failed_records), path
+                    ),
+                    extra={
+                        "context": {
+                            "records": [record.decode("utf-8", "replace") for record in bulk_api.failed_records]
+                        }
+                    },
+                )
+                if client.metrics is not None:
+                    client.metrics.increment("events_dropped", len(bulk_api.failed_records), reason="rejected")
+        return rejected
+
+
+class SpoolReplayer(object):
+    def __init__(self, client, spool, interval=30.0):
+        """Creates a new SpoolReplayer
+
+        Periodically replays a spool from a worker thread, so spooled events drain once the API recovers.
+
+        Parameters
+        ----------
+        client : EventClient
+            Client to send events with
+        spool : EventSpool
+            The spool to drain
+        interval : float, optional
+            Seconds between replay attempts (the default is 30.0)
+        """
+        self.client = client
+        self.spool = spool
+        self.interval = interval
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "SpoolReplayer(client=%r, spool=%r, interval=%r)" % (self.client, self.spool, self.interval)
+
+    def start(self):
+        """Starts the worker thread if it is not already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="bc-events-spool-replayer", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        """Restarts the worker thread in a forked child, if it was running
+
+        Children share the parent's spool directory, whose lock lets only one of them replay at a time.
+        """
+        running = self._thread is not None and not self._stopped.is_set()
+
+        self._stopped = threading.Event()
+        self._thread = None
+        if running:
+            self.start()
+
+    def stop(self, timeout=5.0):
+        """Stops the worker thread
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for an in-progress replay to finish (the default is 5.0)
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.spool.replay(self.client)
+            except Exception:
+                logger.exception("Failed to replay spooled events")
@@ -1,10 +1,16 @@
-from .utils import build_topic_name
+import sys
+
+from .utils import build_topic_name, build_validator
 
 
 class Topic(object):
-    def __init__(self, category, entity, action, schema):
+    __slots__ = ("category", "entity", "action", "name", "schema", "check_schema", "_validator")
+
+    def __init__(self, category, entity, action, schema, check_schema=True):
         """Creates a new Topic
 
+        The topic's unique `name` is built from its category, entity and action once, and interned.
+
         Parameters
         ----------
         category : str
@@ -15,23 +21,33 @@ class Topic(object):
             Topic action
         schema : dict
             JSON schema to validate event payloads
+        check_schema : bool, optional
+            Check the schema against its meta-schema when building the validator.
+            Only skip this for schemas that were already checked. (the default is True)
         """
         self.category = category
         self.entity = entity
         self.action = action
+        self.name = sys.intern(build_topic_name(category, entity, action))
         self.schema = schema
+        self.check_schema = check_schema
+        self._validator = None
 
     @property
-    def name(self):
-        """Computed property to return this topic's name
+    def validator(self):
+        """Lazily built validator for this topic's schema
+
+        The validator is built on first use and reused for every event published to this topic.
 
         Returns
         -------
-        str
-            Unique name for this topic
+        jsonschema.IValidator
+            Validator bound to this topic's schema
         """
 
-        return build_topic_name(self.category, self.entity, self.action)
+        if self._validator is None:
+            self._validator = build_validator(self.schema, check_schema=self.check_schema)
+        return self._validator
 
     def __str__(self):
         return self.name
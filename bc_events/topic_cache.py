@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import yaml
+
+from .topic import Topic
+
+logger = logging.getLogger("bc.events")
+
+# Use libyaml's loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Bump when the cached format changes so stale caches are ignored
+CACHE_FORMAT = 2
+
+
+def parse_topic_definitions(content):
+    """Parses topic definitions yaml
+
+    Parameters
+    ----------
+    content : {str, bytes}
+        The yaml document
+
+    Returns
+    -------
+    dict
+        The parsed topic definitions
+    """
+    return yaml.load(content, Loader=YAML_LOADER)
+
+
+def build_topic_table(definitions, check_schemas=False):
+    """Builds a topic lookup table from parsed topic definitions
+
+    Parameters
+    ----------
+    definitions : dict
+        Parsed topic definitions
+    check_schemas : bool, optional
+        Compile every topic's validator now, raising if any schema is invalid,
+        instead of on first use. (the default is False)
+
+    Returns
+    -------
+    tuple
+        The default category, and a dict of topic name to `Topic`
+    """
+    default_category = definitions.get("DefaultCategory")
+    topic_table = {}
+
+    for topic_definition in definitions["Topics"]:
+        topic = Topic(
+            category=topic_definition.get("Category", default_category),
+            entity=topic_definition["Entity"],
+            action=topic_definition["Action"],
+            schema=topic_definition["Schema"],
+        )
+        if check_schemas:
+            topic.validator
+        topic_table[topic.name] = topic
+
+    return default_category, topic_table
+
+
+def get_cache_path(content, cache_dir):
+    """Gets the cache file for topic definitions, keyed by a hash of their content
+
+    Parameters
+    ----------
+    content : {str, bytes}
+        The topic definitions yaml
+    cache_dir : str
+        Directory holding cached topic tables
+
+    Returns
+    -------
+    str
+        Path of the cache file for this content
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    digest = hashlib.sha256(content).hexdigest()
+    return os.path.join(cache_dir, "topics-{0}-{1}.json".format(CACHE_FORMAT, digest))
+
+
+def build_topic_cache(content, cache_dir):
+    """Parses topic definitions, checks every schema, and writes the compiled topic table to the cache
+
+    The cache file is json, so loading it can't run code, and it is written atomically, so concurrent
+    workers never read a partial file.
+
+    Parameters
+    ----------
+    content : {str, bytes}
+        The topic definitions yaml
+    cache_dir : str
+        Directory holding cached topic tables
+
+    Returns
+    -------
+    tuple
+        The cache file path, the default category, and the topic table
+
+    Raises
+    ------
+    TypeError
+        If a schema holds values json can't represent, e.g. an unquoted yaml date
+    """
+    default_category, topic_table = build_topic_table(parse_topic_definitions(content), check_schemas=True)
+
+    cached = {
+        "default_category": default_category,
+        "topics": [(topic.category, topic.entity, topic.action, topic.schema) for topic in topic_table.values()],
+    }
+
+    cache_path = get_cache_path(content, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as cache_file:
+            json.dump(cached, cache_file, separators=(",", ":"))
+        os.replace(temp_path, cache_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+    return cache_path, default_category, topic_table
+
+
+def load_topic_table(content, cache_dir=None):
+    """Loads a topic table from topic definitions yaml, using a compiled cache when possible
+
+    Parameters
+    ----------
+    content : {str, bytes}
+        The topic definitions yaml
+    cache_dir : str, optional
+        Directory holding cached topic tables
+        (the default is None, which parses the yaml without caching)
+
+    Returns
+    -------
+    tuple
+        The default category, and a dict of topic name to `Topic`
+    """
+    if cache_dir is None:
+        return build_topic_table(parse_topic_definitions(content))
+
+    cache_path = get_cache_path(content, cache_dir)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            cached = json.load(cache_file)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning("Ignoring unreadable topic cache {0}".format(cache_path), exc_info=True)
+    else:
+        topic_table = {}
+        for category, entity, action, schema in cached["topics"]:
+            # Schemas were checked when the cache was built
+            topic = Topic(category=category, entity=entity, action=action, schema=schema, check_schema=False)
+            topic_table[topic.name] = topic
+        return cached["default_category"], topic_table
+
+    try:
+        _, default_category, topic_table = build_topic_cache(content, cache_dir)
+    except (OSError, TypeError):
+        logger.warning("Unable to write topic cache to {0}".format(cache_dir), exc_info=True)
+        default_category, topic_table = build_topic_table(parse_topic_definitions(content))
+    return default_category, topic_table
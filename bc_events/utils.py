@@ -1,9 +1,31 @@
+import json
 import logging
+import time
+import uuid
+from urllib.parse import urlsplit
 
 import requests
-from tenacity import Retrying, retry_if_exception_type, retry_if_result, stop_after_delay, wait_exponential
+from requests.adapters import HTTPAdapter
+from jsonschema.validators import validator_for
+from tenacity import (
+    Retrying,
+    retry_all,
+    retry_if_exception_type,
+    retry_if_result,
+    stop_after_delay,
+    wait_exponential,
+    wait_random_exponential,
+)
+
+from .limiter import RetryBudgetExhausted, is_throttled
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
 logger = logging.getLogger("bc.events")
+JSON_HEADERS = {"Content-Type": "application/json"}
 
 
 def build_topic_name(category, entity, action):
@@ -28,19 +50,287 @@ def build_topic_name(category, entity, action):
     return "{category}.{entity}{action}".format(category=category, entity=entity, action=action)
 
 
+def json_dumps(obj):
+    """Encodes an object as compact json bytes
+
+    Uses orjson when it is installed, and the standard library otherwise.
+
+    Parameters
+    ----------
+    obj : object
+        A json serializable object
+
+    Returns
+    -------
+    bytes
+        The utf-8 encoded json
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def new_event_id():
+    """Generates a unique event ID
+
+    Returns
+    -------
+    str
+        A random UUID, as 32 hex digits
+    """
+    return uuid.uuid4().hex
+
+
+def build_validator(schema, check_schema=True):
+    """Builds a reusable validator for a JSON schema
+
+    Does the same work as `jsonschema.validate`, but only once, so the result can be kept
+    around and used to validate many instances.
+
+    Parameters
+    ----------
+    schema : dict
+        JSON schema to build a validator for
+    check_schema : bool, optional
+        Validate the schema against its meta-schema first. Only skip this for schemas
+        that are already known to be valid. (the default is True)
+
+    Raises
+    ------
+    jsonschema.SchemaError
+        If the schema itself is invalid
+
+    Returns
+    -------
+    jsonschema.IValidator
+        A validator instance bound to the schema
+    """
+    validator_class = validator_for(schema)
+    if check_schema:
+        validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+def build_http_session(pool_size):
+    """Builds a pooled, keep-alive HTTP session
+
+    Connections are kept open and reused between requests, so publishes and retries
+    don't pay for a new TCP and TLS handshake every time. The underlying urllib3 pool is
+    thread-safe, so a single session can be shared by every thread using a client.
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of connections kept open per host
+
+    Returns
+    -------
+    requests.Session
+        A session with pooled adapters mounted for http and https
+    """
+    http_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    http_session.mount("https://", adapter)
+    http_session.mount("http://", adapter)
+    return http_session
+
+
+def chunk_events(events, max_events, max_bytes):
+    """Splits events into chunks that fit within a bulk request
+
+    Chunks are packed in order by both count and the size of each event's encoded json,
+    so small events share a request and large events don't push a request past the API's body limit.
+    An event larger than `max_bytes` on its own is sent in a chunk by itself.
+
+    Parameters
+    ----------
+    events : iterable
+        Events to chunk. Each must have an `encoded` attribute holding its json bytes.
+    max_events : int
+        Maximum number of events in a chunk
+    max_bytes : int
+        Maximum size in bytes of a chunk's json array
+
+    Yields
+    ------
+    list
+        The next chunk of events
+    """
+    chunk = []
+    chunk_bytes = 2  # The enclosing brackets of the json array
+
+    for event in events:
+        event_bytes = len(event.encoded) + 1  # Leave room for a separating comma
+        if chunk and (len(chunk) >= max_events or chunk_bytes + event_bytes > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 2
+
+        chunk.append(event)
+        chunk_bytes += event_bytes
+
+    if chunk:
+        yield chunk
+
+
 class EventsApiRetryingWrapper(object):
-    def __init__(self, url, payload, headers={}, delay=0.1, max_delay=0.5, max_time=2):
+    def __init__(
+        self,
+        url,
+        payload,
+        headers={},
+        delay=0.1,
+        max_delay=0.5,
+        max_time=2,
+        session=None,
+        metrics=None,
+        limiter=None,
+        compressor=None,
+        stats=None,
+    ):
         self.url = url
         self.payload = payload
         self.headers = headers
+        self.session = session
+        self.metrics = metrics
+        self.limiter = limiter
+        self.compressor = compressor
+        self.stats = stats
+        self._compressed = None
+        self.budget_exhausted = False
+        self.denied_attempt = None
+        self._decoded = None
+        self.delivered = False
+        self.failed_records = []
         self.response = None
         self.errors_we_can_retry = ["ProvisionedThroughputExceededException", "InternalFailureException"]
         self.delay = delay
         self.max_delay = max_delay
         self.max_time = max_time
 
+    def body(self):
+        """Builds the request body for the current payload
+
+        Pre-encoded payloads are sent as-is. A list of pre-encoded events is joined into a json array
+        without decoding them, so retrying a partial failure doesn't serialize the remaining events again.
+
+        Returns
+        -------
+        bytes
+            The json request body
+        """
+        payload = self.payload
+        if isinstance(payload, bytes):
+            return payload
+        if isinstance(payload, list) and payload and isinstance(payload[0], bytes):
+            return b"[" + b",".join(payload) + b"]"
+        return json_dumps(payload)
+
+    def request(self):
+        """Builds the request body and headers for the current payload
+
+        With a compressor, large bodies are compressed once per payload, so retrying the same payload
+        sends the same compressed body.
+
+        Returns
+        -------
+        tuple
+            The request body, and the headers to send with it
+        """
+        headers = dict(JSON_HEADERS, **self.headers)
+        if self.compressor is None:
+            return self.body(), headers
+
+        if self._compressed is None or self._compressed[0] is not self.payload:
+            self._compressed = (self.payload,) + self.compressor.compress(self.body())
+
+        _, data, encoding = self._compressed
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return data, headers
+
+    @property
+    def endpoint(self):
+        """Path of the url, used to label metrics"""
+        return urlsplit(self.url).path
+
+    def event_count(self):
+        """Number of events in the current payload"""
+        return len(self.payload) if isinstance(self.payload, list) else 1
+
+    def undelivered(self):
+        """Pre-encoded events that haven't been published yet
+
+        After partial failures the payload only holds the records that can still be retried, and
+        records that failed with an error that can't be retried are kept in `failed_records`.
+        Everything else in the original payload was published.
+
+        Returns
+        -------
+        list
+            The encoded events that failed for good, plus any left in the payload
+            unless the last response published all of them
+        """
+        if self.delivered:
+            return list(self.failed_records)
+        return self.failed_records + (self.payload if isinstance(self.payload, list) else [self.payload])
+
     def post(self):
-        return requests.post(self.url, json=self.payload, headers=self.headers)
+        http = self.session if self.session is not None else requests
+        data, headers = self.request()
+        self._decoded = None
+
+        if self.metrics is None and self.limiter is None:
+            return http.post(self.url, data=data, headers=headers)
+
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+        start = time.perf_counter()
+        response = None
+        try:
+            response = http.post(self.url, data=data, headers=headers)
+            return response
+        finally:
+            self.record_request(start, response)
+
+    def record_request(self, start, response):
+        """Records a request's latency, and its outcome with the limiter
+
+        Parameters
+        ----------
+        start : float
+            `time.perf_counter` when the request was sent
+        response : requests.Response
+            The response, or None if the request raised
+        """
+        if self.metrics is not None:
+            self.metrics.observe("http_seconds", time.perf_counter() - start, endpoint=self.endpoint)
+        if self.limiter is not None:
+            throttled = True
+            if response is not None:
+                try:
+                    throttled = is_throttled(response, self.response_json(response))
+                except ValueError:
+                    throttled = False
+            self.limiter.release(throttled=throttled)
+
+    def response_json(self, response):
+        """Decodes a response's json body, once per attempt
+
+        Parameters
+        ----------
+        response : requests.Response
+            An API response
+
+        Returns
+        -------
+        object
+            The decoded json body
+        """
+        if self._decoded is None or self._decoded[0] is not response:
+            self._decoded = (response, response.json())
+        return self._decoded[1]
 
     def extract_failed_record(self, pair):
         record, result = pair
@@ -48,7 +338,15 @@ class EventsApiRetryingWrapper(object):
             return record
 
     def retry_if_we_need_to(self, response):
-        response_json = response.json()
+        try:
+            response_json = self.response_json(response)
+        except ValueError:
+            response_json = None
+
+        if response_json is None or (response.status_code not in [400, 500] and not 200 <= response.status_code < 300):
+            # Not a response the API sends, like a proxy's error page, so nothing can be said to be delivered
+            logger.warning(f"Unexpected {response.status_code} response. Unable to retry this request.")
+            return False
 
         if response.status_code in [400, 500]:
             if response_json["errorType"] in self.errors_we_can_retry:
@@ -62,24 +360,152 @@ class EventsApiRetryingWrapper(object):
 
         if response_json.get("failedRecords", 0) == 0:
             # No failures, don't retry
+            self.delivered = True
             return False
 
         # There were partial failures, the payload to retry with should only contain failed records
-        self.payload = [
-            record
-            for record in map(self.extract_failed_record, zip(self.payload, response_json["records"]))
-            if record is not None
-        ]
+        records = list(zip(self.payload, response_json["records"]))
+        self.failed_records.extend(
+            record for record, result in records if result != "Success" and result not in self.errors_we_can_retry
+        )
+        self.payload = [record for record in map(self.extract_failed_record, records) if record is not None]
 
         logger.warning(f"Partial failures. Retrying {len(self.payload)} records.")
+        if self.metrics is not None:
+            self.metrics.increment("partial_failures", endpoint=self.endpoint)
         return True
 
+    def record_retry(self, retry_state):
+        """Counts a retry attempt and the events it will send again
+
+        Parameters
+        ----------
+        retry_state : tenacity.RetryCallState
+            State of the retrying call
+        """
+        if self.metrics is not None:
+            self.metrics.increment("retry_attempts", endpoint=self.endpoint)
+            self.metrics.increment("events_retried", self.event_count(), endpoint=self.endpoint)
+
+    def retry_budget_allows(self, retry_state):
+        """Spends a retry from the limiter's budget
+
+        Parameters
+        ----------
+        retry_state : tenacity.RetryCallState
+            State of the retrying call
+
+        Returns
+        -------
+        bool
+            True if the budget allows another attempt
+        """
+        if self.limiter.retry_budget.withdraw():
+            return True
+
+        logger.warning(f"Retry budget exhausted. Giving up on {self.event_count()} records.")
+        self.budget_exhausted = True
+        self.denied_attempt = retry_state.outcome
+        if self.metrics is not None:
+            self.metrics.increment("retries_denied", endpoint=self.endpoint)
+        return False
+
+    def retrying_options(self, retry):
+        """Builds the options for retrying a request
+
+        With a limiter, retries are drawn from its retry budget, and their waits are jittered
+        so callers throttled at the same time don't retry at the same time.
+
+        Parameters
+        ----------
+        retry : tenacity.retry_base
+            When a request should be retried
+
+        Returns
+        -------
+        dict
+            Keyword arguments for `tenacity.Retrying`
+        """
+        wait = wait_exponential(multiplier=self.delay, max=self.max_delay)
+        if self.limiter is not None:
+            self.limiter.retry_budget.deposit()
+            retry = retry_all(retry, self.retry_budget_allows)
+            wait = wait_random_exponential(multiplier=self.delay, max=self.max_delay)
+
+        return {
+            "retry": retry,
+            "stop": stop_after_delay(self.max_time),
+            "wait": wait,
+            "before_sleep": self.record_retry,
+        }
+
+    def record_outcome(self, total, start, response=None):
+        """Counts the events that were published and that failed, and records the endpoint's latency
+
+        Parameters
+        ----------
+        total : int
+            Number of events in the original payload
+        start : float
+            `time.perf_counter` when the first attempt was sent
+        response : requests.Response, optional
+            The final response (the default is None, which means the request raised)
+        """
+        if response is not None and response.status_code >= 400:
+            failed = total
+        else:
+            failed = len(self.undelivered())
+
+        if self.stats is not None:
+            self.stats.record(time.perf_counter() - start, success=not failed)
+
+        if self.metrics is not None:
+            if total > failed:
+                self.metrics.increment("events_published", total - failed, endpoint=self.endpoint)
+            if failed:
+                self.metrics.increment("events_failed", failed, endpoint=self.endpoint)
+
     def invoke(self):
         retryer = Retrying(
-            retry=retry_if_exception_type(requests.exceptions.Timeout)
-            | retry_if_exception_type(requests.exceptions.ConnectionError)
-            | retry_if_result(self.retry_if_we_need_to),
-            stop=stop_after_delay(self.max_time),
-            wait=wait_exponential(multiplier=self.delay, max=self.max_delay),
+            **self.retrying_options(
+                retry_if_exception_type(requests.exceptions.Timeout)
+                | retry_if_exception_type(requests.exceptions.ConnectionError)
+                | retry_if_result(self.retry_if_we_need_to)
+            )
         )
-        return retryer(self.post)
+        if self.metrics is None and self.stats is None:
+            return self.check_budget(retryer(self.post))
+
+        total = self.event_count()
+        start = time.perf_counter()
+        try:
+            response = retryer(self.post)
+        except Exception:
+            self.record_outcome(total, start)
+            raise
+        self.record_outcome(total, start, response)
+        return self.check_budget(response)
+
+    def check_budget(self, response):
+        """Raises if the retry budget gave up on a response that still needed retrying
+
+        Without this, the last failed response would be returned as if the request had succeeded.
+
+        Parameters
+        ----------
+        response : requests.Response
+            The final response
+
+        Raises
+        ------
+        RetryBudgetExhausted
+            If the budget denied a retry
+
+        Returns
+        -------
+        requests.Response
+            The response, if no retry was denied
+        """
+        if self.denied_attempt is not None and not self.denied_attempt.failed:
+            raise RetryBudgetExhausted(self.denied_attempt)
+        return response
@@ -0,0 +1,73 @@
+"""Memory used by a session's queued events: dict-backed events, slotted events, and the columnar EventBuffer.
+
+Run from the repository root::
+
+    python benchmarks/bench_memory.py
+"""
+import tracemalloc
+
+import yaml
+
+from bc_events import EventClient, EventSession
+from bc_events.constants import ACTOR_TYPE_SERVICE
+
+EVENTS = 100000
+
+
+class DictEvent(object):
+    """An event with the attributes `Event` has, stored in an instance __dict__ as before __slots__"""
+
+    def __init__(self, topic, data, session):
+        self.topic = topic
+        self.data = data
+        self.session = session
+        self._request_json = None
+        self._encoded = None
+
+
+def queued_bytes(queue_events):
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    queued = queue_events()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queued
+    return current - baseline
+
+
+def main():
+    with open("tests/test_events.yaml") as topic_file:
+        topic_definitions = yaml.safe_load(topic_file)
+
+    client = EventClient(None, "BcEventsBenchmarks", topic_definitions)
+    topic = client.get_topic("testing", "Test", "Created")
+    # Payloads are shared, so only the cost of queueing them is measured
+    data = {"id": "MyTestId", "url": "https://somewhere.com/tests/MyTestId"}
+
+    def dict_events():
+        session = EventSession("BcEventsBenchmarks", ACTOR_TYPE_SERVICE, "BENCHMARK_JOB_ID", client)
+        session.events = [DictEvent(topic, data, session) for _ in range(EVENTS)]
+        return session
+
+    def slotted_events():
+        session = EventSession("BcEventsBenchmarks", ACTOR_TYPE_SERVICE, "BENCHMARK_JOB_ID", client)
+        for _ in range(EVENTS):
+            session.created_test(data)
+        return session
+
+    def columnar_events():
+        session = EventSession("BcEventsBenchmarks", ACTOR_TYPE_SERVICE, "BENCHMARK_JOB_ID", client, columnar=True)
+        for _ in range(EVENTS):
+            session.created_test(data)
+        return session
+
+    for name, queue_events in (
+        ("__dict__ events", dict_events),
+        ("__slots__ events", slotted_events),
+        ("EventBuffer", columnar_events),
+    ):
+        print("{0:<18} {1:6.1f} bytes/event".format(name, queued_bytes(queue_events) / EVENTS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Bulk body serialization cost, re-encoding every attempt vs. joining cached event encodings.
+
+Run from the repository root::
+
+    python benchmarks/bench_serialization.py
+"""
+
+import json
+import timeit
+
+import yaml
+
+from bc_events import EventClient
+from bc_events.utils import EventsApiRetryingWrapper
+
+ITERATIONS = 200
+EVENTS = 250
+
+
+def main():
+    with open("tests/test_events.yaml") as topic_file:
+        topic_definitions = yaml.safe_load(topic_file)
+
+    client = EventClient(None, "BcEventsBenchmarks", topic_definitions)
+    session = client.service_session("BENCHMARK_JOB_ID")
+    for i in range(EVENTS):
+        session.created_test({"id": "MyTestId{0}".format(i), "url": "https://somewhere.com/tests/MyTestId"})
+
+    def reencoded():
+        # What requests.post(json=...) did on every attempt
+        json.dumps([event.request_json for event in session.events]).encode("utf-8")
+
+    def joined():
+        EventsApiRetryingWrapper(client.publish_bulk_url, [event.encoded for event in session.events]).body()
+
+    for name, func in (("json.dumps per attempt", reencoded), ("joined encodings", joined)):
+        seconds = min(timeit.repeat(func, number=ITERATIONS, repeat=5))
+        print("{0:<24} {1:8.1f} us/{2} event body".format(name, seconds / ITERATIONS * 1e6, EVENTS))
+
+
+if __name__ == "__main__":
+    main()
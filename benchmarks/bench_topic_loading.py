@@ -0,0 +1,64 @@
+"""EventClient startup cost for a large topic definitions file, with and without the compiled topic cache.
+
+Run from the repository root::
+
+    python benchmarks/bench_topic_loading.py
+"""
+import tempfile
+import timeit
+
+import yaml
+
+from bc_events import EventClient
+
+TOPICS = 500
+ITERATIONS = 5
+
+
+def build_definitions():
+    topics = []
+    for i in range(TOPICS):
+        topics.append(
+            {
+                "Action": "Created",
+                "Entity": "Entity" + "".join(chr(ord("a") + int(digit)) for digit in str(i)),
+                "Description": "A new thing was created",
+                "Schema": {
+                    "type": "object",
+                    "required": ["id", "url"],
+                    "properties": {
+                        "id": {"type": "string", "format": "uuid", "description": "Unique ID"},
+                        "url": {"type": "string", "format": "uri", "description": "HTTP path to fetch this from"},
+                        "tags": {"type": "array", "items": {"type": "string"}},
+                    },
+                },
+            }
+        )
+    return {"DefaultCategory": "benchmarks", "Topics": topics}
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        definitions_path = directory + "/topics.yaml"
+        with open(definitions_path, "w") as topic_file:
+            yaml.safe_dump(build_definitions(), topic_file)
+
+        cache_dir = directory + "/cache"
+
+        def uncached():
+            EventClient(None, "BcEventsBenchmarks", definitions_path)
+
+        def cached():
+            EventClient(None, "BcEventsBenchmarks", definitions_path, topic_cache_dir=cache_dir)
+
+        # Build the cache once, as `python -m bc_events build-cache` would at deploy time
+        cached()
+
+        print("libyaml loader available: {0}".format(hasattr(yaml, "CSafeLoader")))
+        for name, func in (("parse yaml", uncached), ("compiled cache", cached)):
+            seconds = min(timeit.repeat(func, number=ITERATIONS, repeat=3))
+            print("{0:<16} {1:8.2f} ms/client ({2} topics)".format(name, seconds / ITERATIONS * 1e3, TOPICS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Cost of topic lookups on the publish path, formatting a topic name vs. the (category, entity, action) index.
+
+Run from the repository root::
+
+    python benchmarks/bench_topic_lookup.py
+"""
+import timeit
+import tracemalloc
+
+import yaml
+
+from bc_events import EventClient
+from bc_events.utils import build_topic_name
+
+ITERATIONS = 100000
+
+
+def peak_allocated_bytes(func):
+    """Peak bytes allocated by a single call to func, beyond what was allocated before it"""
+    func()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - baseline
+
+
+def main():
+    with open("tests/test_events.yaml") as topic_file:
+        topic_definitions = yaml.safe_load(topic_file)
+
+    client = EventClient(None, "BcEventsBenchmarks", topic_definitions)
+    topic = client.get_topic("testing", "Test", "Created")
+
+    def formatted_lookup():
+        client.topic_table[build_topic_name("testing", "Test", "Created")]
+
+    def indexed_lookup():
+        client.get_topic("testing", "Test", "Created")
+
+    def formatted_name():
+        build_topic_name(topic.category, topic.entity, topic.action)
+
+    def cached_name():
+        topic.name
+
+    for name, func in (
+        ("formatted lookup", formatted_lookup),
+        ("get_topic", indexed_lookup),
+        ("formatted name", formatted_name),
+        ("Topic.name", cached_name),
+    ):
+        seconds = min(timeit.repeat(func, number=ITERATIONS, repeat=5))
+        print(
+            "{0:<18} {1:8.1f} ns/call {2:6d} bytes allocated/call".format(
+                name, seconds / ITERATIONS * 1e9, peak_allocated_bytes(func)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Per-event validation cost, before and after caching schema validators.
+
+Run from the repository root::
+
+    python benchmarks/bench_validation.py
+"""
+
+import timeit
+
+import jsonschema
+import yaml
+
+from bc_events import EventClient
+from bc_events.constants import EVENT_SCHEMA
+from bc_events.event import EVENT_VALIDATOR
+
+ITERATIONS = 2000
+
+
+def main():
+    with open("tests/test_events.yaml") as topic_file:
+        topic_definitions = yaml.safe_load(topic_file)
+
+    client = EventClient(None, "BcEventsBenchmarks", topic_definitions)
+    session = client.service_session("BENCHMARK_JOB_ID")
+    session.created_test({"id": "MyTestId", "url": "https://somewhere.com/tests/MyTestId"})
+    event = session.events[0]
+
+    def uncached():
+        jsonschema.validate(event.request_json, EVENT_SCHEMA)
+        jsonschema.validate(event.data, event.topic.schema)
+
+    def cached():
+        EVENT_VALIDATOR.validate(event.request_json)
+        event.topic.validator.validate(event.data)
+
+    for name, func in (("jsonschema.validate", uncached), ("cached validators", cached)):
+        seconds = min(timeit.repeat(func, number=ITERATIONS, repeat=5))
+        print("{0:<20} {1:8.2f} us/event".format(name, seconds / ITERATIONS * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""End to end benchmark suite, publishing to an in-process Events API emulator.
+
+Covers import time, topic loading, validation, flushing sessions of several sizes, bulk publishing
+and the retry paths. Results are written as json, so they can be kept and compared between releases.
+
+Run from the repository root::
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --quick --latency 0.002
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+import bc_events
+from bc_events import EventClient
+from bc_events.emulator import EventsApiEmulator
+from bench_topic_loading import build_definitions
+
+FLUSH_SIZES = (1, 5, 50, 250, 1000)
+BULK_SIZES = (1000, 10000, 100000)
+BULK_CONCURRENCY = (1, 4)
+
+
+def measure(func, repeat, setup=None):
+    """Times repeated calls to func
+
+    Parameters
+    ----------
+    func : callable
+        Called with the result of `setup`, if any
+    repeat : int
+        Number of timed calls
+    setup : callable, optional
+        Called before each call, outside of the timing
+
+    Returns
+    -------
+    dict
+        Summary statistics of the call times, in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+
+    times.sort()
+    return {
+        "repeat": repeat,
+        "min": times[0],
+        "mean": statistics.mean(times),
+        "median": statistics.median(times),
+        "p95": times[min(len(times) - 1, int(len(times) * 0.95))],
+    }
+
+
+def result(name, timings, events=None, **params):
+    entry = {"name": name, "params": params, "seconds": timings}
+    if events:
+        entry["events_per_second"] = events / timings["median"]
+    return entry
+
+
+def queued_session(client, events):
+    session = client.service_session("BENCHMARK_JOB_ID")
+    for i in range(events):
+        session.created_test({"id": "MyTestId{0}".format(i), "url": "https://somewhere.com/tests/MyTestId"})
+    return session
+
+
+def bench_import(repeat):
+    def run(code):
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+    baseline = measure(lambda: run("pass"), repeat)
+    imported = measure(lambda: run("import bc_events"), repeat)
+    imported["baseline_median"] = baseline["median"]
+    return [result("import", imported)]
+
+
+def bench_topic_loading(repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        definitions = build_definitions()
+        definitions_path = directory + "/topics.yaml"
+        with open(definitions_path, "w") as topic_file:
+            yaml.safe_dump(definitions, topic_file)
+
+        cache_dir = directory + "/cache"
+        EventClient(None, "BcEventsBenchmarks", definitions_path, topic_cache_dir=cache_dir)
+
+        topics = len(definitions["Topics"])
+        for name, kwargs in (("topic_loading.yaml", {}), ("topic_loading.cached", {"topic_cache_dir": cache_dir})):
+            timings = measure(lambda: EventClient(None, "BcEventsBenchmarks", definitions_path, **kwargs), repeat)
+            results.append(result(name, timings, topics=topics))
+    return results
+
+
+def bench_validate(client, repeat, events=1000):
+    session = queued_session(client, events)
+
+    def validate_all():
+        for event in session.events:
+            event.validate()
+
+    return [result("validate", measure(validate_all, repeat), events=events, events_in_call=events)]
+
+
+def bench_flush(client, repeat, sizes):
+    results = []
+    for size in sizes:
+        timings = measure(lambda session: session.flush(), repeat, setup=lambda: queued_session(client, size))
+        results.append(result("flush", timings, events=size, queue_size=size))
+    return results
+
+
+def bench_publish_bulk(client, repeat, sizes):
+    results = []
+    for size in sizes:
+        for concurrency in BULK_CONCURRENCY:
+            timings = measure(
+                lambda session: session.publish_bulk(session.events, concurrency=concurrency),
+                repeat,
+                setup=lambda: queued_session(client, size),
+            )
+            results.append(result("publish_bulk", timings, events=size, events_in_call=size, concurrency=concurrency))
+    return results
+
+
+def bench_retries(topic_definitions, repeat, latency):
+    results = []
+    cases = (
+        ("retry.single", {"failure_rate": 0.5}, 1),
+        ("retry.bulk_failure", {"failure_rate": 0.5}, 250),
+        ("retry.bulk_partial_failure", {"partial_failure_rate": 0.1}, 250),
+    )
+    for name, failures, size in cases:
+        with EventsApiEmulator(latency=latency, seed=0, **failures) as emulator:
+            client = EventClient(emulator.url, "BcEventsBenchmarks", topic_definitions)
+
+            def publish(session):
+                if size == 1:
+                    session.events[0].publish()
+                else:
+                    session.publish_bulk(session.events)
+
+            timings = measure(publish, repeat, setup=lambda: queued_session(client, size))
+            timings["requests"] = emulator.stats["requests"]
+            client.close()
+        results.append(result(name, timings, events=size, events_in_call=size, **failures))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="File to write json results to (the default is stdout)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the emulator waits per request")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--quick", action="store_true", help="Skip the largest bulk publish")
+    args = parser.parse_args(argv)
+
+    with open("tests/test_events.yaml") as topic_file:
+        topic_definitions = yaml.safe_load(topic_file)
+
+    bulk_sizes = BULK_SIZES[:-1] if args.quick else BULK_SIZES
+
+    results = []
+    results += bench_import(args.repeat)
+    results += bench_topic_loading(args.repeat)
+    with EventsApiEmulator(latency=args.latency) as emulator:
+        client = EventClient(emulator.url, "BcEventsBenchmarks", topic_definitions)
+        results += bench_validate(client, args.repeat)
+        results += bench_flush(client, args.repeat, FLUSH_SIZES)
+        results += bench_publish_bulk(client, min(args.repeat, 3), bulk_sizes)
+        client.close()
+    results += bench_retries(topic_definitions, min(args.repeat, 3), args.latency)
+
+    report = {
+        "version": bc_events.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": args.latency,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
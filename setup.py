@@ -39,6 +39,11 @@ setup(
     url="https://github.com/IntuitiveWebSolutions/bc-events",
     packages=["bc_events"],
     install_requires=get_requirements("requirements/base.txt"),
+    extras_require={
+        "async": ["aiohttp>=3.0.0,<4.0.0", "tenacity>=8.0.1,<10.0.0"],
+        "fast": ["orjson>=2.0.0"],
+        "zstd": ["zstandard>=0.10.0"],
+    },
     zip_safe=False,
     keywords="britecore events hub pub sub",
     classifiers=[
@@ -84,4 +84,5 @@ def post_mock(monkeypatch):
     post_mock = Mock()
     post_mock.return_value = namedtuple("Struct", ["json", "status_code"])(lambda: {}, 201)
     monkeypatch.setattr(requests, "post", post_mock)
+    monkeypatch.setattr(requests.Session, "post", post_mock)
     return post_mock
@@ -0,0 +1,221 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from bc_events.aio import AsyncEvent, AsyncEventClient, AsyncEventSession
+from bc_events.buffer import EventBuffer
+from bc_events.session import BulkPublishError
+
+
+class StubEventsApi(object):
+    """A local stand-in for the BriteEvents API that records what it receives"""
+
+    def __init__(self, responses=None):
+        self.requests = []
+        self.peers = set()
+        self.responses = responses or []
+
+    async def handle(self, request):
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.requests.append((request.path, request.headers.get("x-britecore-job-id"), await request.json()))
+
+        if self.responses:
+            body, status = self.responses.pop(0)
+            return web.json_response(body, status=status)
+
+        if request.path.startswith("/events/bulk"):
+            return web.json_response({"failedRecords": 0, "records": []}, status=201)
+        return web.json_response({"eventId": "some_id", "jobId": "some_job"}, status=201)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/events", self.handle)
+        app.router.add_post("/events/bulk/", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = "http://127.0.0.1:{0}".format(port)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.runner.cleanup()
+
+
+@pytest.fixture
+def run():
+    return asyncio.run
+
+
+def test_session_type(service_name, topic_definitions):
+    client = AsyncEventClient(None, service_name, topic_definitions)
+
+    assert isinstance(client.user_session("USER_ID", "JOB_ID"), AsyncEventSession)
+
+
+def test_magic_call_queues(run, service_name, topic_definitions, created_test_payload):
+    async def scenario():
+        async with AsyncEventClient(None, service_name, topic_definitions) as client:
+            session = client.user_session("USER_ID", "JOB_ID")
+            await session.created_test(created_test_payload)
+            await session.test_created(created_test_payload)
+            return session
+
+    session = run(scenario())
+
+    assert [event.data for event in session.events] == [created_test_payload] * 2
+
+
+def test_magic_call_incorrect(service_name, topic_definitions):
+    client = AsyncEventClient(None, service_name, topic_definitions)
+    session = client.user_session("USER_ID", "JOB_ID")
+
+    with pytest.raises(AttributeError, match="tested_create"):
+        session.tested_create
+
+
+def test_flush_single_events(run, service_name, topic_definitions, created_test_payload):
+    async def scenario():
+        async with StubEventsApi() as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions) as client:
+                session = client.user_session("USER_ID", "JOB_ID")
+                await session.publish(action="Created", entity="Test", data=created_test_payload)
+                await session.flush()
+                return api.requests
+
+    requests = run(scenario())
+
+    assert len(requests) == 1
+    path, job_id, payload = requests[0]
+    assert path == "/events"
+    assert job_id == "JOB_ID"
+    assert payload["data"] == created_test_payload
+
+
+def test_flush_bulk_reuses_connection(run, service_name, topic_definitions, created_test_payload):
+    async def scenario():
+        async with StubEventsApi() as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions, bulk_concurrency=2) as client:
+                session = client.service_session("JOB_ID")
+                for _ in range(600):
+                    await session.created_test(created_test_payload)
+                await session.flush()
+                return api.requests, api.peers
+
+    requests, peers = run(scenario())
+
+    assert [len(payload) for _, _, payload in requests] == [250, 250, 100]
+    assert all(path == "/events/bulk/" for path, _, _ in requests)
+    # Three chunks, two at a time, over at most two pooled connections
+    assert len(peers) <= 2
+
+
+@pytest.mark.parametrize("count", [2, 600])
+def test_flush_columnar_session(run, service_name, topic_definitions, created_test_payload, count):
+    async def scenario():
+        async with StubEventsApi() as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions) as client:
+                session = AsyncEventSession("USER_ID", "user", "JOB_ID", client, columnar=True)
+                for _ in range(count):
+                    await session.created_test(created_test_payload)
+                assert isinstance(session.events, EventBuffer)
+                assert isinstance(session.events[0], AsyncEvent)
+                await session.flush()
+                return api.requests
+
+    requests = run(scenario())
+
+    sent = sum(len(payload) if isinstance(payload, list) else 1 for _, _, payload in requests)
+    assert sent == count
+
+
+def test_publish_retries(run, service_name, topic_definitions, created_test_payload):
+    responses = [
+        ({"errorType": "ProvisionedThroughputExceededException"}, 400),
+        ({"errorType": "InternalFailureException"}, 500),
+    ]
+
+    async def scenario():
+        async with StubEventsApi(responses) as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions) as client:
+                session = client.user_session("USER_ID", "JOB_ID")
+                await session.created_test(created_test_payload)
+                await session.flush()
+                return api.requests
+
+    assert len(run(scenario())) == 3
+
+
+def test_publish_bulk_result(run, service_name, topic_definitions, created_test_payload):
+    responses = [({"errorType": "SomethingWeCantRetryException"}, 400)]
+
+    async def scenario():
+        async with StubEventsApi(responses) as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions) as client:
+                session = client.user_session("USER_ID", "JOB_ID")
+                await session.created_test(created_test_payload)
+                return await session.publish_bulk(session.events)
+
+    result = run(scenario())
+
+    assert result.published == 0
+    assert result.rejected == 1
+    assert result.responses[0].status_code == 400
+    assert result.responses[0].json() == {"errorType": "SomethingWeCantRetryException"}
+
+
+def test_flush_singles_concurrently(run, service_name, topic_definitions, created_test_payload):
+    async def scenario():
+        async with StubEventsApi() as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions, single_concurrency=2) as client:
+                session = client.user_session("USER_ID", "JOB_ID")
+                for _ in range(4):
+                    await session.created_test(created_test_payload)
+                await session.flush()
+                return api.requests, client.publish_stats.samples
+
+    requests, samples = run(scenario())
+
+    assert [path for path, _, _ in requests] == ["/events"] * 4
+    assert samples == 4
+
+
+def test_publish_stream(run, service_name, topic_definitions, created_test_payload):
+    async def items():
+        for _ in range(600):
+            yield ("testing.TestCreated", created_test_payload)
+
+    async def scenario():
+        async with StubEventsApi() as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions) as client:
+                session = client.service_session("JOB_ID")
+                result = await session.publish_stream(items(), concurrency=2)
+                return api.requests, result
+
+    requests, result = run(scenario())
+
+    assert result.published == 600
+    assert sorted(len(payload) for _, _, payload in requests) == [100, 250, 250]
+
+
+def test_publish_stream_keeps_partial_result(run, service_name, topic_definitions, created_test_payload):
+    async def items():
+        for _ in range(300):
+            yield ("testing.TestCreated", created_test_payload)
+        yield ("testing.TestExploded", created_test_payload)
+
+    async def scenario():
+        async with StubEventsApi() as api:
+            async with AsyncEventClient(api.url, service_name, topic_definitions) as client:
+                session = client.service_session("JOB_ID")
+                with pytest.raises(BulkPublishError, match="testing.TestExploded") as err:
+                    await session.publish_stream(items(), concurrency=2)
+                return api.requests, err.value
+
+    requests, error = run(scenario())
+
+    assert isinstance(error.__cause__, ValueError)
+    assert error.result.published == len(requests[0][2]) == 250
+    assert [(index, chunk) for index, chunk, _ in error.result.failures] == [(1, [])]
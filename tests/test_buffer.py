@@ -0,0 +1,74 @@
+import pytest
+
+from bc_events.buffer import EventBuffer
+
+
+@pytest.fixture
+def buffer(user_session, client, created_test_payload):
+    buffer = EventBuffer(user_session)
+    buffer.add(client.get_topic("testing", "Test", "Created"), created_test_payload)
+    buffer.add(client.get_topic("testing", "Test", "Deleted"), {"id": "MyTestId", "name": "Test"})
+    buffer.add(client.get_topic("testing", "Test", "Created"), created_test_payload)
+    return buffer
+
+
+def test_len(buffer):
+    assert len(buffer) == 3
+
+
+def test_topics_are_stored_once(buffer):
+    assert len(buffer._topics) == 2
+    assert list(buffer._topic_ids) == [0, 1, 0]
+
+
+def test_getitem(buffer, user_session, created_test_payload):
+    event = buffer[0]
+
+    assert str(event) == "testing.TestCreated"
+    assert event.data == created_test_payload
+    assert event.session is user_session
+
+    assert str(buffer[-2]) == "testing.TestDeleted"
+    assert [str(event) for event in buffer[1:]] == ["testing.TestDeleted", "testing.TestCreated"]
+
+    with pytest.raises(IndexError):
+        buffer[3]
+
+
+def test_iter(buffer):
+    assert [str(event) for event in buffer] == ["testing.TestCreated", "testing.TestDeleted", "testing.TestCreated"]
+
+
+def test_append(buffer):
+    buffer.append(buffer[1])
+
+    assert len(buffer) == 4
+    assert str(buffer[3]) == "testing.TestDeleted"
+
+
+def test_event_ids_are_stable(buffer):
+    assert buffer[0].event_id == buffer[0].event_id
+    assert len({event.event_id for event in buffer}) == 3
+
+    buffer.append(buffer[1])
+    assert buffer[3].event_id == buffer[1].event_id
+
+
+def test_event_ids_are_stored_as_bytes(buffer, client, created_test_payload):
+    assert len(buffer._event_ids) == 3 * 16
+    assert len(buffer[0].event_id) == 32
+
+    buffer.add(client.get_topic("testing", "Test", "Created"), created_test_payload, event_id="original-id")
+    assert buffer[3].event_id == "original-id"
+    assert buffer[2].event_id != buffer[3].event_id
+
+
+def test_reads_hand_back_the_same_events(buffer):
+    assert buffer._events == {}
+
+    encoded = buffer[0].encoded
+
+    assert buffer[0] is buffer[0]
+    assert next(iter(buffer)) is buffer[0]
+    assert buffer[:1][0].encoded is encoded
+    assert list(buffer._events) == [0]
@@ -1,5 +1,6 @@
 import pytest
 
+from bc_events import EventClient
 from bc_events.constants import ACTOR_TYPE_SERVICE, ACTOR_TYPE_THIRD_PARTY, ACTOR_TYPE_USER
 from bc_events.utils import build_topic_name
 
@@ -51,3 +52,34 @@ def test_get_topic_not_found(client):
     fake_topic_name = build_topic_name(fake_category, fake_entity, fake_action)
     with pytest.raises(ValueError, match=fake_topic_name):
         client.get_topic(fake_category, fake_entity, fake_action)
+
+
+def test_http_session_pool_size(api_url, service_name, topic_definitions):
+    client = EventClient(api_url, service_name, topic_definitions, pool_size=3)
+
+    adapter = client.http_session.get_adapter("https://fake-site.britecore.com")
+    assert adapter._pool_maxsize == 3
+
+    client.close()
+
+
+def test_events_api_uses_http_session(client):
+    events_api = client._events_api("https://fake-site.britecore.com/events", {})
+
+    assert events_api.session is client.http_session
+
+
+def test_background_dispatch(api_url, service_name, topic_definitions):
+    client = EventClient(api_url, service_name, topic_definitions, background_dispatch=True, max_batch_size=10)
+
+    assert client.dispatcher.max_batch_size == 10
+    assert client.dispatcher._thread.is_alive()
+
+    client.close(timeout=1)
+
+    assert not client.dispatcher._thread.is_alive()
+
+
+def test_topic_index(client):
+    for topic in client.topic_table.values():
+        assert client.topic_index[topic.category, topic.entity, topic.action] is topic
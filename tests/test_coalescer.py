@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from bc_events import EventClient
+from bc_events.coalescer import CoalescedEvent, FlushCoalescer
+
+
+@pytest.fixture
+def coalescing_client(service_name):
+    return EventClient(
+        "https://fake-site.britecore.com", service_name, "tests/test_events.yaml", coalesce=True, coalesce_linger=0.05
+    )
+
+
+def flush_concurrently(sessions):
+    errors = {}
+    barrier = threading.Barrier(len(sessions))
+
+    def flush(session):
+        barrier.wait()
+        try:
+            session.flush()
+        except Exception as e:
+            errors[session.job_id] = e
+
+    threads = [threading.Thread(target=flush, args=(session,)) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_flushes_share_bulk_requests(coalescing_client, post_mock, created_test_payload):
+    sessions = [coalescing_client.user_session("USER_{0}".format(i), "JOB_{0}".format(i)) for i in range(8)]
+    for session in sessions:
+        session.created_test(created_test_payload)
+        session.created_test(created_test_payload)
+
+    assert flush_concurrently(sessions) == {}
+
+    records = []
+    for call in post_mock.call_args_list:
+        assert call[0][0] == coalescing_client.publish_bulk_url
+        records += json.loads(call[1]["data"])
+
+    assert post_mock.call_count < len(sessions)
+    assert len(records) == 16
+    for i in range(8):
+        session_records = [record for record in records if record["jobId"] == "JOB_{0}".format(i)]
+        assert len(session_records) == 2
+        assert all(record["actor"] == {"id": "USER_{0}".format(i), "type": "user"} for record in session_records)
+
+
+def test_full_batch_skips_linger(service_name, post_mock, created_test_payload):
+    client = EventClient(
+        "https://fake-site.britecore.com",
+        service_name,
+        "tests/test_events.yaml",
+        coalesce=True,
+        coalesce_linger=30,
+        max_bulk_events=3,
+    )
+    sessions = [client.service_session("JOB_{0}".format(i)) for i in range(3)]
+    for session in sessions:
+        session.created_test(created_test_payload)
+
+    assert flush_concurrently(sessions) == {}
+    assert post_mock.call_count == 1
+
+
+def test_failures_only_raise_in_their_flushes(coalescing_client, created_test_payload):
+    session = coalescing_client.service_session("JOB_ID")
+    for _ in range(4):
+        session.created_test(created_test_payload)
+    events = list(session.events)
+
+    client = Mock(_chunk_events=lambda events: [events[:2], events[2:]])
+    error = RuntimeError("chunk failed")
+    client._publish_bulk_chunk.side_effect = [None, error]
+    coalescer = FlushCoalescer(client, linger=30, max_batch_size=4)
+
+    errors = {}
+
+    def publish(name, events):
+        try:
+            coalescer.publish(events)
+        except Exception as e:
+            errors[name] = e
+
+    first = threading.Thread(target=publish, args=("first", events[:2]))
+    first.start()
+    deadline = time.monotonic() + 5
+    while coalescer._batch is None:
+        if time.monotonic() > deadline or not first.is_alive():
+            pytest.fail("The first flush never started a batch")
+        time.sleep(0.001)
+    publish("second", events[2:])
+    first.join()
+
+    assert errors == {"second": error}
+
+
+def test_empty_flush(coalescing_client, post_mock):
+    coalescing_client.service_session("JOB_ID").flush()
+    post_mock.assert_not_called()
+
+
+def test_validates_before_sending(coalescing_client, post_mock):
+    session = coalescing_client.service_session("JOB_ID")
+    session.created_test({"bad": "payload"})
+
+    with pytest.raises(Exception, match="'id' is a required property"):
+        session.flush()
+    post_mock.assert_not_called()
+
+
+def test_only_shared_requests_carry_job_ids(client, coalescing_client, post_mock, created_test_payload):
+    session = client.user_session("USER_ID", "JOB_ID")
+    for _ in range(10):
+        session.created_test(created_test_payload)
+    session.publish_bulk(session.events)
+
+    coalesced_session = coalescing_client.service_session(None)
+    coalesced_session.created_test(created_test_payload)
+    coalesced_session.flush()
+
+    for call in post_mock.call_args_list:
+        assert all("jobId" not in record for record in json.loads(call[1]["data"]))
+
+
+def test_coalesced_event(coalescing_client, created_test_payload):
+    session = coalescing_client.user_session("USER_ID", "JOB_ID")
+    session.created_test(created_test_payload)
+    event = session.events[0]
+
+    coalesced = CoalescedEvent(event)
+
+    assert coalesced.event_id == event.event_id
+    assert str(coalesced) == str(event)
+    assert json.loads(coalesced.encoded) == dict(event.request_json, jobId="JOB_ID")
+    assert "jobId" not in event.request_json
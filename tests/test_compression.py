@@ -0,0 +1,81 @@
+import gzip
+
+import pytest
+import zstandard
+
+from bc_events import EventClient
+from bc_events.compression import BodyCompressor, decompress
+from bc_events.emulator import EventsApiEmulator
+from bc_events.utils import EventsApiRetryingWrapper
+
+BODY = b'{"data":"' + b"x" * 2000 + b'"}'
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_round_trip(encoding):
+    compressed, content_encoding = BodyCompressor(encoding).compress(BODY)
+
+    assert content_encoding == encoding
+    assert len(compressed) < len(BODY)
+    assert decompress(compressed, content_encoding) == BODY
+
+
+def test_threshold():
+    assert BodyCompressor(threshold=len(BODY) + 1).compress(BODY) == (BODY, None)
+
+
+def test_levels():
+    assert BodyCompressor("gzip").level == 6
+    assert BodyCompressor("zstd").level == 3
+
+    compressed, _ = BodyCompressor("gzip", level=1).compress(BODY)
+    assert gzip.decompress(compressed) == BODY
+    compressed, _ = BodyCompressor("zstd", level=19).compress(BODY)
+    assert zstandard.ZstdDecompressor().decompress(compressed) == BODY
+
+
+def test_unsupported():
+    with pytest.raises(ValueError):
+        BodyCompressor("brotli")
+    with pytest.raises(ValueError):
+        decompress(BODY, "brotli")
+    assert decompress(BODY, None) == BODY
+
+
+def test_compressed_once_per_payload():
+    wrapper = EventsApiRetryingWrapper("https://some_url.com/events/bulk/", [BODY] * 2, compressor=BodyCompressor())
+
+    data, headers = wrapper.request()
+    assert headers["Content-Encoding"] == "gzip"
+    assert wrapper.request()[0] is data
+
+    wrapper.payload = [BODY]
+    assert decompress(wrapper.request()[0], "gzip") == b"[" + BODY + b"]"
+
+
+def test_uncompressed_request():
+    data, headers = EventsApiRetryingWrapper("https://some_url.com/events", BODY).request()
+    assert data is BODY
+    assert "Content-Encoding" not in headers
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_publish_compressed(encoding, service_name, created_test_payload):
+    with EventsApiEmulator() as emulator:
+        client = EventClient(
+            emulator.url, service_name, "tests/test_events.yaml", compression=encoding, compression_threshold=256
+        )
+        session = client.service_session("JOB_ID")
+        session.created_test(created_test_payload)
+        for _ in range(50):
+            session.created_test(created_test_payload)
+        session.flush()
+
+        session = client.service_session("JOB_ID")
+        session.created_test(created_test_payload)
+        session.flush()
+        client.close()
+
+    assert emulator.stats["events"] == 52
+    assert emulator.stats["requests"] == 2
+    assert emulator.stats["compressed"] == 1
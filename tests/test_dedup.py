@@ -0,0 +1,168 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from tenacity import RetryError, stop_after_attempt
+
+from bc_events import EventClient
+from bc_events.dedup import AckCache
+from bc_events.emulator import EventsApiEmulator
+from bc_events.event import EncodedEvent
+from bc_events.session import BulkPublishError
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def retry_once(self, retry):
+    return {"retry": retry, "stop": stop_after_attempt(1)}
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with patch("bc_events.dedup.time.monotonic", clock):
+        yield clock
+
+
+@pytest.fixture
+def emulator():
+    with EventsApiEmulator(seed=0) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def emulated_client(emulator, service_name):
+    client = EventClient(emulator.url, service_name, "tests/test_events.yaml")
+    yield client
+    client.close()
+
+
+def test_ack_cache_expires(clock):
+    cache = AckCache(ttl=10.0)
+    cache.add(["a", None])
+
+    assert "a" in cache
+    assert None not in cache
+
+    clock.now += 10
+    assert "a" not in cache
+
+    cache.add(["b"])
+    assert len(cache) == 1
+
+
+def test_ack_cache_is_bounded(clock):
+    cache = AckCache(max_size=2)
+    cache.add(["a", "b"])
+    cache.add(["c"])
+
+    assert "a" not in cache
+    assert "b" in cache and "c" in cache
+    assert len(cache) == 2
+
+    # Acknowledging an ID again makes it the newest
+    cache.add(["b", "d"])
+    assert "b" in cache and "d" in cache and "c" not in cache
+
+
+def test_encoded_event_id():
+    assert EncodedEvent(b'{"eventId": "abc"}').event_id == "abc"
+    assert EncodedEvent(b"{}").event_id is None
+
+
+def test_reflushing_skips_published_events(emulator, emulated_client, created_test_payload):
+    session = emulated_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(10):
+        session.created_test(created_test_payload)
+    session.flush()
+    session.created_test(created_test_payload)
+    session.flush()
+
+    assert emulator.stats["requests"] == 2
+    assert emulator.stats["events"] == 11
+    assert emulator.stats["duplicates"] == 0
+
+
+def test_partially_published_events_are_acknowledged(emulator, emulated_client, created_test_payload):
+    emulator.partial_failure_rate = 0.5
+    session = emulated_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(20):
+        session.created_test(created_test_payload)
+
+    # Give up after the first attempt, leaving the failed records unpublished
+    with patch("bc_events.utils.EventsApiRetryingWrapper.retrying_options", retry_once):
+        with pytest.raises(BulkPublishError) as err:
+            session.flush()
+    assert isinstance(err.value.__cause__, RetryError)
+
+    acknowledged = [event for event in session.events if event.event_id in emulated_client.ack_cache]
+    assert len(acknowledged) == emulator.stats["events"]
+    assert 0 < len(acknowledged) < 20
+
+
+def test_deduplicate_disabled(emulator, service_name, created_test_payload):
+    client = EventClient(emulator.url, service_name, "tests/test_events.yaml", deduplicate=False)
+    session = client.service_session("JOB_ID")
+    session.created_test(created_test_payload)
+    session.flush()
+    session.flush()
+    client.close()
+
+    assert client.ack_cache is None
+    assert emulator.stats["requests"] == 2
+    # The emulator still recognizes the resubmitted event
+    assert emulator.stats["events"] == 1
+    assert emulator.stats["duplicates"] == 1
+
+
+def test_lost_responses_are_not_published_twice(emulator, emulated_client, created_test_payload):
+    emulator.lost_response_rate = 0.5
+    session = emulated_client.service_session("JOB_ID")
+    for _ in range(10):
+        session.created_test(created_test_payload)
+        session.flush()
+        session.rollback()
+
+    assert emulator.stats["lost_responses"] > 0
+    assert emulator.stats["duplicates"] == emulator.stats["lost_responses"]
+    assert emulator.stats["events"] == 10
+
+
+def test_permanently_failed_records_are_not_acknowledged(emulated_client, created_test_payload, monkeypatch):
+    session = emulated_client.service_session("JOB_ID")
+    for _ in range(3):
+        session.created_test(created_test_payload)
+    events = list(session.events)
+
+    responses = iter(
+        [
+            {"failedRecords": 2, "records": ["Success", "ValidationException", "InternalFailureException"]},
+            {"failedRecords": 0, "records": ["Success"]},
+        ]
+    )
+    post = Mock(side_effect=lambda *args, **kwargs: Mock(status_code=200, json=Mock(return_value=next(responses))))
+    monkeypatch.setattr("requests.Session.post", post)
+
+    emulated_client._publish_bulk_chunk(events)
+
+    assert post.call_count == 2
+    assert [event.event_id in emulated_client.ack_cache for event in events] == [True, False, True]
+
+
+@pytest.mark.parametrize("status_code", [403, 413, 429, 502])
+def test_unexpected_responses_are_not_acknowledged(emulated_client, created_test_payload, monkeypatch, status_code):
+    session = emulated_client.service_session("JOB_ID")
+    session.created_test(created_test_payload)
+    events = list(session.events)
+
+    response = Mock(status_code=status_code, json=Mock(side_effect=ValueError("No JSON object could be decoded")))
+    monkeypatch.setattr("requests.Session.post", Mock(return_value=response))
+
+    emulated_client._publish_bulk_chunk(events)
+
+    assert events[0].event_id not in emulated_client.ack_cache
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from bc_events.constants import BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_RAISE
+from bc_events.dispatcher import BackgroundDispatcher
+
+
+@pytest.fixture
+def dispatcher(client):
+    dispatcher = BackgroundDispatcher(client, max_queue_size=10, max_batch_size=4, linger=0.01)
+    yield dispatcher
+    dispatcher.shutdown(timeout=1)
+
+
+def test_unknown_backpressure(client):
+    with pytest.raises(ValueError, match="nope"):
+        BackgroundDispatcher(client, backpressure="nope")
+
+
+def test_sends_batches(dispatcher, events_api_wrapper_invoke_mock):
+    session = Mock(job_id="JOB_ID")
+    dispatcher.submit([Mock(encoded=b"{}", session=session) for _ in range(10)])
+    dispatcher.start()
+
+    assert dispatcher.shutdown(timeout=1) == 0
+    assert len(dispatcher) == 0
+
+    if dispatcher.client.publish_bulk_url:
+        # 10 events in batches of at most 4
+        assert events_api_wrapper_invoke_mock.call_count == 3
+
+
+def test_sends_partial_batch_after_linger(dispatcher, events_api_wrapper_invoke_mock):
+    dispatcher.start()
+    dispatcher.submit([Mock(encoded=b"{}")])
+
+    time.sleep(0.2)
+
+    assert len(dispatcher) == 0
+    if dispatcher.client.publish_bulk_url:
+        events_api_wrapper_invoke_mock.assert_called_once()
+
+
+def test_backpressure_raise(client):
+    dispatcher = BackgroundDispatcher(client, max_queue_size=2, backpressure=BACKPRESSURE_RAISE)
+
+    with pytest.raises(queue.Full):
+        dispatcher.submit([Mock(), Mock(), Mock()])
+
+    assert len(dispatcher) == 2
+
+
+def test_backpressure_drop_oldest(client):
+    dispatcher = BackgroundDispatcher(client, max_queue_size=2, backpressure=BACKPRESSURE_DROP_OLDEST)
+    events = [Mock(), Mock(), Mock()]
+
+    dispatcher.submit(events)
+
+    assert dispatcher.dropped == 1
+    assert list(dispatcher._queue) == events[1:]
+
+
+def test_submit_after_shutdown(dispatcher):
+    dispatcher.shutdown(timeout=0)
+
+    with pytest.raises(RuntimeError, match="shut down"):
+        dispatcher.submit([Mock()])
+
+
+def test_shutdown_deadline(client, monkeypatch):
+    dispatcher = BackgroundDispatcher(client, max_batch_size=1)
+    monkeypatch.setattr(dispatcher, "_send", lambda batch: time.sleep(0.1))
+
+    dispatcher.submit([Mock() for _ in range(10)])
+    dispatcher.start()
+
+    assert dispatcher.shutdown(timeout=0.05) > 0
+
+
+def test_failed_batches_are_counted(dispatcher, monkeypatch):
+    monkeypatch.setattr(dispatcher, "_send", Mock(side_effect=Exception("API down")))
+
+    dispatcher.submit([Mock(), Mock()])
+    dispatcher.start()
+    dispatcher.shutdown(timeout=1)
+
+    assert dispatcher.failed == 2
+
+
+def test_sends_each_jobs_id(dispatcher, monkeypatch):
+    sent = []
+    monkeypatch.setattr(
+        dispatcher.client, "_send_bulk_chunk", lambda chunk, headers={}: sent.append((headers, len(chunk)))
+    )
+    sessions = [Mock(job_id="JOB_1"), Mock(job_id="JOB_2"), Mock(job_id=None)]
+
+    dispatcher._send([Mock(encoded=b"{}", session=sessions[i % 3]) for i in range(7)])
+
+    assert sent == [({"x-britecore-job-id": "JOB_1"}, 3), ({"x-britecore-job-id": "JOB_2"}, 2), ({}, 2)]
+
+
+def test_close_leaves_connections_open_while_still_sending(client, monkeypatch):
+    dispatcher = BackgroundDispatcher(client, max_batch_size=1)
+    sending = threading.Event()
+    finish = threading.Event()
+
+    def send(batch):
+        sending.set()
+        finish.wait(1)
+
+    monkeypatch.setattr(dispatcher, "_send", send)
+    monkeypatch.setattr(client, "dispatcher", dispatcher)
+    monkeypatch.setattr(client.http_session, "close", Mock())
+
+    dispatcher.submit([Mock()])
+    dispatcher.start()
+    sending.wait(1)
+    client.close(timeout=0.01)
+
+    assert dispatcher.is_alive()
+    client.http_session.close.assert_not_called()
+
+    finish.set()
+    dispatcher._thread.join(1)
+    client.close(timeout=0.01)
+    client.http_session.close.assert_called_once()
@@ -0,0 +1,116 @@
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from bc_events import EventClient
+from bc_events.emulator import (
+    INTERNAL_FAILURE,
+    LATENCY_DISTRIBUTIONS,
+    THROUGHPUT_EXCEEDED,
+    EventsApiEmulator,
+    main,
+)
+
+
+@pytest.fixture
+def emulator():
+    with EventsApiEmulator(seed=0) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def emulated_client(emulator, service_name):
+    client = EventClient(emulator.url, service_name, "tests/test_events.yaml")
+    yield client
+    client.close()
+
+
+def test_unknown_latency_distribution():
+    with pytest.raises(ValueError):
+        EventsApiEmulator(latency_distribution="bimodal")
+
+
+def test_publish(emulator, emulated_client, created_test_payload):
+    session = emulated_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(10):
+        session.created_test(created_test_payload)
+    session.created_test(created_test_payload)
+    session.flush()
+
+    assert emulator.stats["requests"] == 1
+    assert emulator.stats["events"] == 11
+    assert requests.get(emulator.url + "/stats").json() == emulator.stats
+
+
+def test_single_request_failure(emulator):
+    emulator.failure_rate = 1.0
+    assert emulator.respond("/events", {}) == (500, {"errorType": INTERNAL_FAILURE, "errorMessage": "Injected failure"})
+    assert emulator.stats["failed"] == 1
+
+
+def test_partial_failures(emulator):
+    emulator.partial_failure_rate = 0.5
+    status, response = emulator.respond("/events/bulk/", [{}] * 100)
+
+    assert status == 200
+    assert 0 < response["failedRecords"] < 100
+    assert response["failedRecords"] == response["records"].count(INTERNAL_FAILURE)
+    assert emulator.stats["events"] == 100 - response["failedRecords"]
+
+
+def test_throughput_cap():
+    emulator = EventsApiEmulator(max_events_per_second=5)
+
+    _, response = emulator.respond("/events/bulk/", [{}] * 8)
+    assert response["records"] == ["Success"] * 5 + [THROUGHPUT_EXCEEDED] * 3
+
+    status, response = emulator.respond("/events", {})
+    assert status == 400
+    assert response["errorType"] == THROUGHPUT_EXCEEDED
+    assert emulator.stats["throttled"] == 4
+
+
+def test_client_retries_partial_failures(emulator, emulated_client, created_test_payload):
+    emulator.partial_failure_rate = 0.2
+    session = emulated_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(50):
+        session.created_test(created_test_payload)
+    session.flush()
+
+    assert emulator.stats["events"] == 50
+    assert emulator.stats["requests"] > 1
+
+
+def test_client_retries_dropped_connections(emulator, emulated_client, created_test_payload):
+    drops = iter([True, False])
+    with patch.object(emulator, "should_drop", lambda: next(drops)):
+        session = emulated_client.user_session("USER_ID", "JOB_ID")
+        session.created_test(created_test_payload)
+        session.flush()
+
+    assert emulator.stats["events"] == 1
+
+
+@pytest.mark.parametrize("distribution", LATENCY_DISTRIBUTIONS)
+def test_sample_latency(distribution):
+    emulator = EventsApiEmulator(latency=0.01, latency_distribution=distribution, seed=0)
+    samples = [emulator.sample_latency() for _ in range(2000)]
+
+    assert all(sample >= 0 for sample in samples)
+    assert sum(samples) / len(samples) == pytest.approx(0.01, rel=0.2)
+
+
+def test_main(capsys):
+    emulators = []
+
+    def serve_forever(emulator):
+        emulators.append(emulator)
+        raise KeyboardInterrupt
+
+    with patch.object(EventsApiEmulator, "serve_forever", serve_forever):
+        assert main(["--port", "0", "--partial-failure-rate", "0.1", "--latency-distribution", "exponential"]) == 0
+
+    assert emulators[0].partial_failure_rate == 0.1
+    assert emulators[0].latency_distribution == "exponential"
+    assert capsys.readouterr().out.startswith("Emulating the Events API at http://127.0.0.1:")
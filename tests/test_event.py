@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from jsonschema import ValidationError
 
@@ -13,7 +15,9 @@ def test_publish(event, job_id, post_mock):
     event.publish()
     if event.session.client.api_url:
         post_mock.assert_called_once_with(
-            event.session.client.publish_url, json=event.request_json, headers={"x-britecore-job-id": job_id}
+            event.session.client.publish_url,
+            data=event.encoded,
+            headers={"Content-Type": "application/json", "x-britecore-job-id": job_id},
         )
     else:
         post_mock.assert_not_called()
@@ -37,3 +41,35 @@ def test_json_validation_failure(event):
 
     with pytest.raises(ValidationError, match="5 is not of type 'string") as err:
         event.publish()
+
+
+def test_encoded(event):
+    assert json.loads(event.encoded.decode("utf-8")) == event.request_json
+    assert event.encoded is event.encoded
+
+
+def test_request_json_is_cached(event):
+    assert event.request_json is event.request_json
+
+
+def test_event_has_no_instance_dict(event):
+    assert not hasattr(event, "__dict__")
+    assert not hasattr(event.topic, "__dict__")
+
+
+def test_request_json_leaves_job_id_to_the_header(event, user_id):
+    assert "jobId" not in event.request_json
+    assert event.request_json["actor"] == {"id": user_id, "type": "user"}
+
+
+def test_request_json_carries_event_id(event):
+    assert len(event.event_id) == 32
+    assert event.request_json["eventId"] == event.event_id
+    event.validate()
+
+
+def test_event_ids_are_unique(user_session, created_test_payload):
+    user_session.created_test(created_test_payload)
+    user_session.created_test(created_test_payload)
+
+    assert user_session.events[0].event_id != user_session.events[1].event_id
@@ -0,0 +1,102 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from bc_events import EventClient
+from bc_events.emulator import EventsApiEmulator
+from bc_events.limiter import AdaptiveRateLimiter
+from bc_events.metrics import InProcessMetrics
+from bc_events.spool import ACTIVE_SUFFIX, EventSpool
+
+
+@pytest.fixture
+def fork_client(service_name, topic_definitions, tmpdir):
+    client = EventClient(
+        "https://fake-site.britecore.com",
+        service_name,
+        topic_definitions,
+        background_dispatch=True,
+        spool=EventSpool(str(tmpdir.join("spool"))),
+        metrics=InProcessMetrics(),
+        limiter=AdaptiveRateLimiter(),
+    )
+    yield client
+    client.close(timeout=0)
+
+
+def test_check_fork_without_fork(fork_client):
+    http_session = fork_client.http_session
+    fork_client._check_fork()
+    assert fork_client.http_session is http_session
+
+
+def test_after_fork(fork_client):
+    http_session = fork_client.http_session
+    topic_table = fork_client.topic_table
+    validator = fork_client.get_topic("testing", "Test", "Created").validator
+    dispatcher_thread = fork_client.dispatcher._thread
+    replayer_thread = fork_client.spool_replayer._thread
+
+    fork_client.dispatcher._queue.append("parent event")
+    fork_client.metrics.increment("events_published")
+    fork_client.limiter.in_flight = 3
+    fork_client.spool.append([b"{}"])
+    parent_segment = fork_client.spool._active
+
+    with patch("bc_events.client.os.getpid", return_value=os.getpid() + 1):
+        fork_client.service_session("JOB_ID")
+
+    assert fork_client.http_session is not http_session
+    assert fork_client.topic_table is topic_table
+    assert fork_client.get_topic("testing", "Test", "Created").validator is validator
+
+    assert len(fork_client.dispatcher) == 0
+    assert fork_client.dispatcher._thread is not dispatcher_thread
+    assert fork_client.dispatcher._thread.is_alive()
+    assert fork_client.spool_replayer._thread is not replayer_thread
+    assert fork_client.spool_replayer._thread.is_alive()
+
+    assert fork_client.metrics.counter("events_published") == 0
+    assert fork_client.limiter.in_flight == 0
+    assert parent_segment.closed
+    assert fork_client.spool._active is None
+
+
+def test_spool_segments_are_named_by_pid_and_spool(tmpdir):
+    spool = EventSpool(str(tmpdir))
+    spool.append([b"{}"])
+
+    assert os.path.basename(spool._active_path) == "{0:020d}-{1}-{2}{3}".format(
+        0, os.getpid(), spool._token, ACTIVE_SUFFIX
+    )
+    spool.close()
+
+    spool.append([b"{}"])
+    assert os.path.basename(spool._active_path).startswith("{0:020d}-".format(1))
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_publish_from_forked_child(service_name, created_test_payload):
+    with EventsApiEmulator() as emulator:
+        client = EventClient(emulator.url, service_name, "tests/test_events.yaml", background_dispatch=True)
+        client.service_session("JOB_ID").created_test(created_test_payload)
+        parent_http_session = client.http_session
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                session = client.service_session("JOB_ID")
+                session.created_test(created_test_payload)
+                session.flush()
+                if client.close(timeout=5) is None and client.http_session is not parent_http_session:
+                    status = 0
+            finally:
+                os._exit(status)
+
+        _, status = os.waitpid(pid, 0)
+        client.close()
+
+        assert os.WEXITSTATUS(status) == 0
+        assert emulator.stats["events"] == 1
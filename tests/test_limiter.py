@@ -0,0 +1,217 @@
+import threading
+from collections import namedtuple
+from unittest.mock import Mock, patch
+
+import pytest
+
+from bc_events import EventClient
+from bc_events.emulator import EventsApiEmulator
+from bc_events.limiter import (
+    THROTTLING_ERROR,
+    AdaptiveRateLimiter,
+    RetryBudget,
+    RetryBudgetExhausted,
+    is_throttled,
+)
+from bc_events.metrics import InProcessMetrics
+from bc_events.spool import EventSpool
+from bc_events.utils import EventsApiRetryingWrapper
+
+
+def create_sample_response(response, status_code):
+    return namedtuple("Struct", ["json", "status_code"])(lambda: response, status_code)
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = Clock()
+    with patch("bc_events.limiter.time.monotonic", clock):
+        yield clock
+
+
+def test_retry_budget(clock):
+    budget = RetryBudget(ratio=0.5, min_retries_per_second=1.0)
+
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    clock.now += 1
+    assert budget.withdraw()
+
+
+def test_retry_budget_max_balance(clock):
+    budget = RetryBudget(ratio=1.0, min_retries_per_second=0.0, max_balance=2.0)
+    for _ in range(10):
+        budget.deposit()
+
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+
+def test_concurrency_limit(clock):
+    limiter = AdaptiveRateLimiter(rate=100.0, concurrency=2)
+    clock.now += 1
+
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() > 0
+    assert limiter.in_flight == 2
+
+    limiter.release()
+    assert limiter.try_acquire() == 0
+
+
+def test_token_bucket(clock):
+    limiter = AdaptiveRateLimiter(rate=10.0, concurrency=64)
+    clock.now += 1
+
+    for _ in range(10):
+        assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == pytest.approx(0.1)
+
+    clock.now += 0.1
+    assert limiter.try_acquire() == 0
+
+
+def test_aimd(clock):
+    limiter = AdaptiveRateLimiter(rate=40.0, concurrency=8, cooldown=0.5)
+
+    for _ in range(3):
+        limiter.in_flight += 1
+        limiter.release(throttled=True)
+
+    # Throttles within the cooldown are only counted once
+    assert limiter.rate == 20.0
+    assert limiter.concurrency == 4.0
+    assert limiter.throttled == 3
+
+    clock.now += 0.5
+    limiter.in_flight += 1
+    limiter.release(throttled=True)
+    assert limiter.rate == 10.0
+
+    for _ in range(10):
+        limiter.in_flight += 1
+        limiter.release()
+    assert 10.0 < limiter.rate < 20.0
+    assert limiter.concurrency > 2.0
+
+
+def test_aimd_bounds(clock):
+    limiter = AdaptiveRateLimiter(rate=2.0, min_rate=1.0, max_rate=2.5, concurrency=1, max_concurrency=2, cooldown=0)
+
+    for _ in range(5):
+        limiter.in_flight += 1
+        limiter.release(throttled=True)
+    assert limiter.rate == 1.0
+    assert limiter.concurrency == 1.0
+
+    for _ in range(100):
+        limiter.in_flight += 1
+        limiter.release()
+    assert limiter.rate == 2.5
+    assert limiter.concurrency == 2
+
+
+def test_acquire_waits_for_release():
+    limiter = AdaptiveRateLimiter(rate=1000.0, concurrency=1)
+    limiter.acquire()
+
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    thread.start()
+
+    assert not acquired.wait(0.05)
+    limiter.release()
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_is_throttled():
+    assert is_throttled(create_sample_response({"errorType": THROTTLING_ERROR}, 400))
+    assert not is_throttled(create_sample_response({"errorType": "InternalFailureException"}, 500))
+    assert is_throttled(create_sample_response({"failedRecords": 1, "records": ["Success", THROTTLING_ERROR]}, 200))
+    assert not is_throttled(create_sample_response({"failedRecords": 0, "records": ["Success"]}, 200))
+    assert not is_throttled(create_sample_response({}, 201))
+
+
+def test_retry_budget_stops_retries(post_mock):
+    post_mock.return_value = create_sample_response({"errorType": THROTTLING_ERROR}, 400)
+    metrics = InProcessMetrics()
+    limiter = AdaptiveRateLimiter(retry_budget=RetryBudget(ratio=0.0, min_retries_per_second=0.0))
+    wrapper = EventsApiRetryingWrapper("https://some_url.com/events", b"{}", metrics=metrics, limiter=limiter)
+
+    with pytest.raises(RetryBudgetExhausted) as err:
+        wrapper.invoke()
+
+    assert err.value.last_attempt.result().status_code == 400
+    assert post_mock.call_count == 1
+    assert metrics.counter("retries_denied", endpoint="/events") == 1
+    assert metrics.counter("events_failed", endpoint="/events") == 1
+    assert limiter.in_flight == 0
+    assert limiter.throttled == 1
+
+
+def test_denied_retries_are_spooled(tmpdir, service_name, created_test_payload):
+    limiter = AdaptiveRateLimiter(retry_budget=RetryBudget(ratio=0.0, min_retries_per_second=0.0))
+    spool = EventSpool(str(tmpdir.join("spool")))
+    with EventsApiEmulator(partial_failure_rate=1.0) as emulator:
+        client = EventClient(
+            emulator.url, service_name, "tests/test_events.yaml", limiter=limiter, spool=spool, spool_replay_interval=60
+        )
+        session = client.service_session("JOB_ID")
+        for _ in range(10):
+            session.created_test(created_test_payload)
+        session.flush()
+        client.close()
+
+    assert emulator.stats["requests"] == 1
+    assert spool.size() == sum(len(event.encoded) + 1 for event in session.events)
+
+
+def test_denied_retries_raise_without_spool(post_mock, service_name, created_test_payload):
+    post_mock.return_value = create_sample_response({"errorType": "InternalFailureException"}, 500)
+    limiter = AdaptiveRateLimiter(retry_budget=RetryBudget(ratio=0.0, min_retries_per_second=0.0))
+    client = EventClient("https://some_url.com", service_name, "tests/test_events.yaml", limiter=limiter)
+    session = client.service_session("JOB_ID")
+    session.created_test(created_test_payload)
+
+    with pytest.raises(RetryBudgetExhausted):
+        session.flush()
+
+
+def test_response_json_is_decoded_once(post_mock):
+    response_json = Mock(return_value={"failedRecords": 0, "records": ["Success"]})
+    post_mock.return_value = namedtuple("Struct", ["json", "status_code"])(response_json, 200)
+    wrapper = EventsApiRetryingWrapper("https://some_url.com/events/bulk/", [b"{}"], limiter=AdaptiveRateLimiter())
+
+    wrapper.invoke()
+
+    assert response_json.call_count == 1
+
+
+def test_client_backs_off_when_throttled(service_name, created_test_payload):
+    limiter = AdaptiveRateLimiter(rate=1000.0, concurrency=4)
+    with EventsApiEmulator(max_events_per_second=200) as emulator:
+        client = EventClient(emulator.url, service_name, "tests/test_events.yaml", limiter=limiter)
+        session = client.service_session("JOB_ID")
+        for _ in range(300):
+            session.created_test(created_test_payload)
+        session.flush()
+        client.close()
+
+    assert limiter.throttled >= 1
+    assert limiter.rate < 1000.0
+    assert emulator.stats["events"] == 300
@@ -0,0 +1,85 @@
+import logging
+from unittest.mock import Mock
+
+import pytest
+
+from bc_events.logs import EventLogger, LazyContext, ResolveContextFilter, summarize
+
+
+@pytest.fixture
+def event(user_session, created_test_payload):
+    user_session.created_test(created_test_payload)
+    return user_session.events[0]
+
+
+def test_lazy_context_builds_once():
+    build = Mock(return_value={"built": True})
+    context = LazyContext(build)
+
+    build.assert_not_called()
+    assert context.resolve() == {"built": True}
+    assert str(context) == "{'built': True}"
+    build.assert_called_once()
+
+
+def test_resolve_context_filter():
+    record = logging.LogRecord("bc.events", logging.INFO, __file__, 1, "message", None, None)
+    record.context = LazyContext(lambda: {"built": True})
+
+    assert ResolveContextFilter().filter(record)
+    assert record.context == {"built": True}
+
+
+def test_publishing_event(event, caplog):
+    caplog.set_level(logging.INFO, logger="bc.events")
+
+    EventLogger().publishing_event(event)
+
+    record = caplog.records[-1]
+    assert record.getMessage() == "Publishing event testing.TestCreated"
+    assert record.context == event.request_json
+
+
+def test_publishing_events_summary(event, caplog):
+    caplog.set_level(logging.INFO, logger="bc.events")
+
+    EventLogger(log_payloads=False).publishing_events([event] * 3)
+
+    record = caplog.records[-1]
+    assert record.getMessage() == "Publishing 3 Events"
+    assert record.context == {"count": 3, "topics": {"testing.TestCreated": 3}}
+
+
+def test_lazy_context(event, caplog):
+    caplog.set_level(logging.INFO, logger="bc.events")
+
+    EventLogger(lazy_context=True).publishing_event(event)
+
+    context = caplog.records[-1].context
+    assert isinstance(context, LazyContext)
+    assert context.resolve() == event.request_json
+
+
+def test_disabled_level_builds_nothing(caplog):
+    caplog.set_level(logging.WARNING, logger="bc.events")
+    event = Mock()
+
+    EventLogger().publishing_events([event])
+
+    assert caplog.records == []
+    assert event.mock_calls == []
+
+
+def test_sampling(event, caplog, monkeypatch):
+    caplog.set_level(logging.INFO, logger="bc.events")
+    monkeypatch.setattr("random.random", Mock(side_effect=[0.05, 0.5]))
+    event_logger = EventLogger(sample_rate=0.1)
+
+    event_logger.publishing_event(event)
+    event_logger.publishing_event(event)
+
+    assert len(caplog.records) == 1
+
+
+def test_summarize(event):
+    assert summarize([event, event]) == {"count": 2, "topics": {"testing.TestCreated": 2}}
@@ -0,0 +1,148 @@
+from collections import namedtuple
+from unittest.mock import Mock
+
+import pytest
+
+from bc_events import EventClient
+from bc_events.metrics import Histogram, InProcessMetrics, PrometheusTextExporter, format_labels
+from bc_events.utils import EventsApiRetryingWrapper
+
+
+def create_sample_response(response, status_code):
+    return namedtuple("Struct", ["json", "status_code"])(lambda: response, status_code)
+
+
+@pytest.fixture
+def metrics():
+    return InProcessMetrics(buckets=(0.1, 1.0))
+
+
+@pytest.fixture
+def metrics_client(service_name, metrics):
+    return EventClient("https://fake-site.britecore.com", service_name, "tests/test_events.yaml", metrics=metrics)
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+    assert histogram.cumulative_counts() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+
+
+def test_counters_and_histograms(metrics):
+    metrics.increment("events_published", 3, endpoint="/events")
+    metrics.increment("events_published", endpoint="/events")
+    metrics.observe("http_seconds", 0.5, endpoint="/events")
+
+    assert metrics.counter("events_published", endpoint="/events") == 4
+    assert metrics.counter("events_published", endpoint="/events/bulk/") == 0
+    assert metrics.histogram("http_seconds", endpoint="/events").count == 1
+    assert metrics.histogram("http_seconds") is None
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == [{"name": "events_published", "labels": {"endpoint": "/events"}, "value": 4}]
+    assert snapshot["histograms"][0]["buckets"] == [(0.1, 0), (1.0, 1), (float("inf"), 1)]
+
+    metrics.reset()
+    assert metrics.snapshot() == {"counters": [], "histograms": []}
+
+
+def test_prometheus_text(metrics):
+    metrics.increment("events_failed", 2, endpoint="/events")
+    metrics.observe("flush_seconds", 0.05)
+
+    assert PrometheusTextExporter(metrics).render() == (
+        "# TYPE bc_events_events_failed_total counter\n"
+        'bc_events_events_failed_total{endpoint="/events"} 2\n'
+        "# TYPE bc_events_flush_seconds histogram\n"
+        'bc_events_flush_seconds_bucket{le="0.1"} 1\n'
+        'bc_events_flush_seconds_bucket{le="1.0"} 1\n'
+        'bc_events_flush_seconds_bucket{le="+Inf"} 1\n'
+        "bc_events_flush_seconds_sum 0.05\n"
+        "bc_events_flush_seconds_count 1\n"
+    )
+
+
+def test_format_labels():
+    assert format_labels({}) == ""
+    assert format_labels({"topic": 'a"b\\c', "endpoint": "/events"}) == '{endpoint="/events",topic="a\\"b\\\\c"}'
+
+
+def test_client_without_metrics(client):
+    assert client.metrics is None
+    assert client._events_api("https://some_url.com/events", b"{}").metrics is None
+
+
+def test_flush_records_metrics(metrics_client, metrics, post_mock, created_test_payload):
+    session = metrics_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(10):
+        session.created_test(created_test_payload)
+    session.flush()
+
+    assert metrics.counter("events_published", endpoint="/events/bulk/") == 10
+    assert metrics.histogram("serialization_seconds", topic="testing.TestCreated").count == 10
+    assert metrics.histogram("http_seconds", endpoint="/events/bulk/").count == 1
+    assert metrics.histogram("flush_seconds").count == 1
+
+
+def test_single_publish_records_metrics(metrics_client, metrics, post_mock, created_test_payload):
+    session = metrics_client.user_session("USER_ID", "JOB_ID")
+    session.created_test(created_test_payload)
+    session.created_test(created_test_payload)
+    session.flush()
+
+    assert metrics.counter("events_published", endpoint="/events") == 2
+    assert metrics.histogram("validation_seconds", topic="testing.TestCreated").count == 2
+    assert metrics.histogram("http_seconds", endpoint="/events").count == 2
+
+
+def test_partial_failure_metrics(metrics, post_mock):
+    post_mock.side_effect = [
+        create_sample_response({"failedRecords": 1, "records": ["Success", "InternalFailureException"]}, 200),
+        create_sample_response({"failedRecords": 0}, 200),
+    ]
+    wrapper = EventsApiRetryingWrapper(
+        "https://some_url.com/events/bulk/", [b"{}", b"{}"], delay=0.01, max_delay=0.01, metrics=metrics
+    )
+    wrapper.invoke()
+
+    assert metrics.counter("partial_failures", endpoint="/events/bulk/") == 1
+    assert metrics.counter("retry_attempts", endpoint="/events/bulk/") == 1
+    assert metrics.counter("events_retried", endpoint="/events/bulk/") == 1
+    assert metrics.counter("events_published", endpoint="/events/bulk/") == 2
+    assert metrics.histogram("http_seconds", endpoint="/events/bulk/").count == 2
+
+
+def test_failure_metrics(metrics, post_mock):
+    post_mock.return_value = create_sample_response({"errorType": "InternalFailureException"}, 500)
+    wrapper = EventsApiRetryingWrapper(
+        "https://some_url.com/events", b"{}", delay=0.01, max_delay=0.01, max_time=0.05, metrics=metrics
+    )
+
+    with pytest.raises(Exception):
+        wrapper.invoke()
+
+    assert metrics.counter("events_failed", endpoint="/events") == 1
+    assert metrics.counter("events_published", endpoint="/events") == 0
+    assert metrics.counter("retry_attempts", endpoint="/events") >= 1
+
+
+def test_unretryable_response_counts_as_failed(metrics, post_mock):
+    post_mock.return_value = create_sample_response({"errorType": "UnsupportedError"}, 400)
+    wrapper = EventsApiRetryingWrapper("https://some_url.com/events/bulk/", [b"{}", b"{}"], metrics=metrics)
+    wrapper.invoke()
+
+    assert metrics.counter("events_failed", endpoint="/events/bulk/") == 2
+
+
+def test_custom_recorder(service_name, post_mock, created_test_payload):
+    recorder = Mock()
+    client = EventClient("https://fake-site.britecore.com", service_name, "tests/test_events.yaml", metrics=recorder)
+    client.user_session("USER_ID", "JOB_ID").created_test(created_test_payload)
+
+    recorder.increment.assert_not_called()
+    client.user_session("USER_ID", "JOB_ID").flush()
+    assert {call[0][0] for call in recorder.observe.call_args_list} == {"flush_seconds"}
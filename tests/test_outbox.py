@@ -0,0 +1,174 @@
+import sqlite3
+from unittest.mock import Mock
+
+import pytest
+
+from bc_events import EventClient
+from bc_events.outbox import STATUS_FAILED, STATUS_PENDING, STATUS_SENT, EventOutbox, OutboxRelay
+from bc_events.utils import EventsApiRetryingWrapper
+
+
+@pytest.fixture
+def connection(tmpdir):
+    connection = sqlite3.connect(str(tmpdir.join("outbox.db")))
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def outbox(connection):
+    outbox = EventOutbox(connection)
+    outbox.create_table()
+    return outbox
+
+
+@pytest.fixture
+def outbox_client(service_name, topic_definitions):
+    return EventClient("https://fake-site.britecore.com", service_name, topic_definitions)
+
+
+def count_rows(connection, status=None):
+    if status is None:
+        return connection.execute("SELECT COUNT(*) FROM bc_events_outbox").fetchone()[0]
+    return connection.execute("SELECT COUNT(*) FROM bc_events_outbox WHERE status = ?", (status,)).fetchone()[0]
+
+
+def test_unsupported_paramstyle(connection):
+    with pytest.raises(ValueError, match="named"):
+        EventOutbox(connection, paramstyle="named")
+
+
+def test_index_created(connection, outbox):
+    indexes = connection.execute("PRAGMA index_list(bc_events_outbox)").fetchall()
+
+    assert "bc_events_outbox_status_created_at" in [index[1] for index in indexes]
+
+
+def test_flush_writes_to_outbox_in_transaction(
+    connection, outbox, outbox_client, created_test_payload, events_api_wrapper_invoke_mock
+):
+    session = outbox_client.user_session("USER_ID", "JOB_ID", outbox=outbox)
+    session.created_test(created_test_payload)
+    session.flush()
+    connection.commit()
+
+    assert count_rows(connection) == 1
+    assert connection.execute("SELECT job_id, payload FROM bc_events_outbox").fetchone() == (
+        "JOB_ID",
+        session.events[0].encoded,
+    )
+    events_api_wrapper_invoke_mock.assert_not_called()
+
+
+def test_flush_rolled_back_with_transaction(connection, outbox, outbox_client, created_test_payload):
+    session = outbox_client.user_session("USER_ID", "JOB_ID", outbox=outbox)
+    session.created_test(created_test_payload)
+    session.flush()
+    connection.rollback()
+
+    assert count_rows(connection) == 0
+
+
+def test_relay_delivers_in_bulk(connection, outbox, outbox_client, created_test_payload, post_mock):
+    outbox_client.max_bulk_events = 250
+    session = outbox_client.service_session("JOB_ID", outbox=outbox)
+    for _ in range(600):
+        session.created_test(created_test_payload)
+    session.flush()
+    connection.commit()
+
+    relay = OutboxRelay(outbox_client, outbox, batch_size=1000)
+
+    assert relay.relay_once() == 600
+    assert post_mock.call_count == 3
+    assert all(call[1]["headers"]["x-britecore-job-id"] == "JOB_ID" for call in post_mock.call_args_list)
+    assert count_rows(connection) == 0
+    assert relay.relay_once() == 0
+
+
+def test_relay_marks_sent(connection, outbox, outbox_client, created_test_payload, post_mock):
+    session = outbox_client.service_session("JOB_ID", outbox=outbox)
+    session.created_test(created_test_payload)
+    session.flush()
+    connection.commit()
+
+    OutboxRelay(outbox_client, outbox, delete_sent=False).relay_once()
+
+    assert count_rows(connection, STATUS_SENT) == 1
+
+
+def test_relay_failure_leaves_rows_pending(connection, outbox, outbox_client, created_test_payload, monkeypatch):
+    outbox_client.max_bulk_events = 2
+    session = outbox_client.service_session("JOB_ID", outbox=outbox)
+    for _ in range(5):
+        session.created_test(created_test_payload)
+    session.flush()
+    connection.commit()
+
+    responses = [{"failedRecords": 0, "records": ["Success", "Success"]}]
+
+    def invoke(self):
+        if not responses:
+            raise Exception("API down")
+        return self.retry_if_we_need_to(Mock(status_code=201, json=Mock(return_value=responses.pop())))
+
+    monkeypatch.setattr(EventsApiRetryingWrapper, "invoke", invoke)
+
+    assert OutboxRelay(outbox_client, outbox).relay_once() == 2
+    assert count_rows(connection) == 3
+
+
+def test_relay_sends_each_jobs_id(connection, outbox, outbox_client, created_test_payload, post_mock):
+    for job_id in ("JOB_1", "JOB_2", None):
+        session = outbox_client.service_session(job_id, outbox=outbox)
+        session.created_test(created_test_payload)
+        session.flush()
+    connection.commit()
+
+    assert OutboxRelay(outbox_client, outbox).relay_once() == 3
+    assert [call[1]["headers"].get("x-britecore-job-id") for call in post_mock.call_args_list] == [
+        "JOB_1",
+        "JOB_2",
+        None,
+    ]
+
+
+def test_relay_marks_rejected_rows_failed(connection, outbox, outbox_client, created_test_payload, monkeypatch):
+    session = outbox_client.service_session("JOB_ID", outbox=outbox)
+    for _ in range(3):
+        session.created_test(created_test_payload)
+    session.flush()
+    connection.commit()
+
+    responses = iter(
+        [
+            {"failedRecords": 1, "records": ["Success", "ValidationException", "Success"]},
+            {"failedRecords": 0, "records": []},
+        ]
+    )
+    post = Mock(side_effect=lambda *args, **kwargs: Mock(status_code=201, json=Mock(return_value=next(responses))))
+    monkeypatch.setattr("requests.Session.post", post)
+
+    assert OutboxRelay(outbox_client, outbox).relay_once() == 2
+    assert count_rows(connection) == 1
+    assert count_rows(connection, STATUS_FAILED) == 1
+    assert count_rows(connection, STATUS_PENDING) == 0
+
+
+def test_relay_leaves_unsent_records_pending(connection, outbox, outbox_client, created_test_payload, monkeypatch):
+    session = outbox_client.service_session("JOB_ID", outbox=outbox)
+    for _ in range(2):
+        session.created_test(created_test_payload)
+    session.flush()
+    connection.commit()
+
+    post = Mock(return_value=Mock(status_code=502, json=Mock(side_effect=ValueError("Bad Gateway"))))
+    monkeypatch.setattr("requests.Session.post", post)
+
+    assert OutboxRelay(outbox_client, outbox).relay_once() == 0
+    assert count_rows(connection, STATUS_PENDING) == 2
+
+
+def test_sessions_take_their_own_outbox(outbox, outbox_client):
+    assert outbox_client.service_session("JOB_ID", outbox=outbox).outbox is outbox
+    assert outbox_client.user_session("USER_ID", "JOB_ID").outbox is None
@@ -0,0 +1,225 @@
+import threading
+import time
+
+import pytest
+
+from bc_events import EventClient
+from bc_events.policy import AdaptivePublishPolicy, EndpointStats, ThresholdPublishPolicy, expected_latency
+
+
+def record_samples(stats, count, seconds, success=True):
+    for _ in range(count):
+        stats.record(seconds, success)
+
+
+@pytest.fixture
+def http_client(service_name):
+    return EventClient("https://fake-site.britecore.com", service_name, "tests/test_events.yaml")
+
+
+def test_endpoint_stats_ewma():
+    stats = EndpointStats(alpha=0.5)
+    assert stats.latency is None
+
+    stats.record(1.0, True)
+    assert stats.latency == 1.0
+    assert stats.success_rate == 1.0
+
+    stats.record(3.0, False)
+    assert stats.latency == 2.0
+    assert stats.success_rate == 0.5
+    assert stats.samples == 2
+
+
+def test_expected_latency_scales_by_success_rate():
+    stats = EndpointStats(alpha=0.5)
+    stats.record(1.0, True)
+    stats.record(1.0, False)
+
+    assert expected_latency(stats) == 2.0
+
+
+def test_threshold_policy(http_client):
+    policy = ThresholdPublishPolicy(threshold=3)
+
+    assert not policy.use_bulk(3, http_client)
+    assert policy.use_bulk(4, http_client)
+
+
+def test_adaptive_policy_falls_back_without_samples(http_client):
+    policy = AdaptivePublishPolicy(threshold=5, min_samples=2, explore_rate=0)
+    record_samples(http_client.publish_stats, 2, 0.001)
+
+    assert not policy.use_bulk(5, http_client)
+    assert policy.use_bulk(6, http_client)
+
+
+def test_adaptive_policy_prefers_faster_endpoint(http_client):
+    policy = AdaptivePublishPolicy(threshold=5, min_samples=2, explore_rate=0)
+    http_client.single_concurrency = 4
+    record_samples(http_client.publish_stats, 2, 0.01)
+    record_samples(http_client.publish_bulk_stats, 2, 0.1)
+
+    # Two rounds of four singles beat one slow bulk request
+    assert not policy.use_bulk(8, http_client)
+    assert policy.use_bulk(100, http_client)
+
+    # Bulk requests that keep failing are avoided
+    record_samples(http_client.publish_bulk_stats, 20, 0.01, success=False)
+    assert not policy.use_bulk(20, http_client)
+
+
+def test_adaptive_policy_explores_the_other_endpoint(http_client):
+    policy = AdaptivePublishPolicy(threshold=5, min_samples=2, explore_rate=0.5)
+    http_client.single_concurrency = 4
+
+    # Falling back, every other flush samples the endpoint with fewer measurements
+    record_samples(http_client.publish_stats, 2, 0.01)
+    assert [policy.use_bulk(1, http_client) for _ in range(4)] == [False, True, False, True]
+
+    # Once adapting, every other flush uses the endpoint expected to be slower
+    record_samples(http_client.publish_bulk_stats, 2, 0.1)
+    assert [policy.use_bulk(8, http_client) for _ in range(4)] == [False, True, False, True]
+    # Large flushes never explore
+    assert [policy.use_bulk(10000, http_client) for _ in range(4)] == [True] * 4
+
+
+def test_threshold_policy_is_the_default(http_client):
+    assert isinstance(http_client.publish_policy, ThresholdPublishPolicy)
+    assert not isinstance(http_client.publish_policy, AdaptivePublishPolicy)
+
+
+def test_concurrency_is_not_capped_by_client_defaults(http_client, monkeypatch):
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def publish_bulk_chunk(chunk):
+        with lock:
+            in_flight.append(chunk)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.remove(chunk)
+        return None, len(chunk), 0
+
+    monkeypatch.setattr(http_client, "_send_bulk_chunk", publish_bulk_chunk)
+    http_client.max_bulk_events = 1
+    session = http_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(8):
+        session.created_test({"id": "MyTestId", "url": "https://somewhere.com/tests/MyTestId"})
+
+    session.publish_bulk(session.events, concurrency=4)
+
+    assert max(peak) == 4
+
+
+def test_invoke_records_endpoint_stats(http_client, post_mock):
+    session = http_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(3):
+        session.created_test({"id": "MyTestId", "url": "https://somewhere.com/tests/MyTestId"})
+    session.flush()
+
+    assert http_client.publish_stats.samples == 3
+    assert http_client.publish_stats.success_rate == 1.0
+    assert http_client.publish_bulk_stats.samples == 0
+
+
+def test_flush_publishes_singles_concurrently(http_client, monkeypatch):
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def publish(event):
+        with lock:
+            in_flight.append(event)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.remove(event)
+
+    monkeypatch.setattr("bc_events.event.Event.publish", publish)
+    http_client.single_concurrency = 3
+    session = http_client.user_session("USER_ID", "JOB_ID")
+    for _ in range(5):
+        session.created_test({"id": "MyTestId", "url": "https://somewhere.com/tests/MyTestId"})
+    session.flush()
+
+    assert len(peak) == 5
+    assert max(peak) == 3
+
+
+def test_publish_each_raises_first_failure(http_client, monkeypatch):
+    published = []
+
+    def publish(event):
+        published.append(event)
+        if event.data["id"] == "1":
+            raise ValueError("failed")
+
+    monkeypatch.setattr("bc_events.event.Event.publish", publish)
+    http_client.single_concurrency = 2
+    session = http_client.user_session("USER_ID", "JOB_ID")
+    for i in range(4):
+        session.created_test({"id": str(i), "url": "https://somewhere.com/tests/MyTestId"})
+
+    with pytest.raises(ValueError, match="failed"):
+        session.publish_each(session.events)
+    assert len(published) == 4
+
+
+def test_publish_each_in_order_by_default(http_client, monkeypatch):
+    published = []
+
+    def publish(event):
+        published.append(event.data["id"])
+        if event.data["id"] == "2":
+            raise ValueError("failed")
+
+    monkeypatch.setattr("bc_events.event.Event.publish", publish)
+    session = http_client.user_session("USER_ID", "JOB_ID")
+    for i in range(4):
+        session.created_test({"id": str(i), "url": "https://somewhere.com/tests/MyTestId"})
+
+    with pytest.raises(ValueError, match="failed"):
+        session.publish_each(session.events)
+    assert published == ["0", "1", "2"]
+    assert http_client._executor is None
+
+
+def test_concurrent_flushes_share_the_clients_executor(http_client, monkeypatch):
+    monkeypatch.setattr("bc_events.event.Event.publish", lambda event: None)
+    http_client.single_concurrency = 3
+    session = http_client.user_session("USER_ID", "JOB_ID")
+
+    executors = []
+    for _ in range(2):
+        for _ in range(3):
+            session.created_test({"id": "MyTestId", "url": "https://somewhere.com/tests/MyTestId"})
+        session.publish_each(session.events)
+        session.rollback()
+        executors.append(http_client._executor)
+
+    assert executors[0] is not None
+    assert executors[0] is executors[1]
+
+    http_client.close()
+    assert http_client._executor is None
+
+
+def test_custom_policy_and_paths(service_name, post_mock):
+    client = EventClient(
+        "https://fake-site.britecore.com",
+        service_name,
+        "tests/test_events.yaml",
+        publish_policy=ThresholdPublishPolicy(threshold=0),
+        events_path="/v2/events",
+        bulk_events_path="/v2/events/bulk",
+    )
+    session = client.user_session("USER_ID", "JOB_ID")
+    session.created_test({"id": "MyTestId", "url": "https://somewhere.com/tests/MyTestId"})
+    post_mock.return_value = post_mock.return_value._replace(json=lambda: {"failedRecords": 0, "records": []})
+    session.flush()
+
+    assert post_mock.call_args[0][-1] == "https://fake-site.britecore.com/v2/events/bulk"
+    assert client.publish_url == "https://fake-site.britecore.com/v2/events"
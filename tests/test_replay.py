@@ -0,0 +1,171 @@
+import gzip
+import json
+import uuid
+
+import pytest
+
+from bc_events import EventClient
+from bc_events.__main__ import main
+from bc_events.emulator import EventsApiEmulator
+from bc_events.replay import ReplayCheckpoint, parse_records, read_batches, replay
+
+TOPIC_DEFINITIONS_PATH = "tests/test_events.yaml"
+
+
+def build_record(i, **overrides):
+    record = {
+        "category": "testing",
+        "entity": "Test",
+        "action": "Created",
+        "data": {"id": str(uuid.UUID(int=i)), "url": "https://somewhere.com/tests/{0}".format(i)},
+        "actor": {"id": "USER_ID", "type": "user"},
+        "jobId": "JOB_ID",
+    }
+    record.update(overrides)
+    return record
+
+
+def write_jsonl(path, records):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(str(path), "wt") as input_file:
+        for record in records:
+            input_file.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+    return str(path)
+
+
+@pytest.fixture
+def emulator():
+    with EventsApiEmulator(seed=0) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def emulated_client(emulator, service_name):
+    client = EventClient(emulator.url, service_name, TOPIC_DEFINITIONS_PATH)
+    yield client
+    client.close()
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_read_batches(tmpdir, use_mmap):
+    path = write_jsonl(tmpdir.join("events.jsonl"), [build_record(i) for i in range(5)])
+    checkpoint = ReplayCheckpoint()
+
+    batches = list(read_batches([path], checkpoint, batch_size=2, use_mmap=use_mmap))
+    assert [len(batch.lines) for batch in batches] == [2, 2, 1]
+    assert [batch.end_line for batch in batches] == [2, 4, 5]
+
+    checkpoint.advance(batches[0], 2, 0)
+    resumed = list(read_batches([path], checkpoint, batch_size=10, use_mmap=use_mmap))
+    assert resumed[0].first_line == 2
+    assert resumed[0].lines == batches[1].lines + batches[2].lines
+
+
+def test_parse_records_from_logs():
+    record = build_record(1)
+
+    assert parse_records(json.dumps(record)) == [record]
+    assert parse_records(json.dumps({"message": "Publishing event", "context": record})) == [record]
+    assert parse_records(json.dumps({"message": "Publishing 2 Events", "context": [record] * 2})) == [record] * 2
+
+
+def test_replay(tmpdir, emulator, emulated_client):
+    records = [build_record(i) for i in range(300)]
+    records[10] = build_record(10, eventId="original-id")
+    records[20] = "not json"
+    records[30] = build_record(30, action="Exploded")
+    records[40] = build_record(40, data={"id": "missing-url"})
+    del records[50]["actor"]
+    jsonl = write_jsonl(tmpdir.join("events.jsonl"), records[:150])
+    ndjson = write_jsonl(tmpdir.join("events.ndjson.gz"), records[150:])
+
+    checkpoint = replay(emulated_client, TOPIC_DEFINITIONS_PATH, [jsonl, ndjson], workers=0, batch_size=40)
+
+    assert checkpoint.published == 296
+    assert checkpoint.invalid == 4
+    assert emulator.stats["events"] == 296
+    assert "original-id" in emulated_client.ack_cache
+
+
+def test_replay_inputs_with_the_same_name(tmpdir, emulator, emulated_client):
+    first = write_jsonl(tmpdir.mkdir("day1").join("events.jsonl"), [build_record(1)])
+    second = write_jsonl(tmpdir.mkdir("day2").join("events.jsonl"), [build_record(2)])
+
+    checkpoint = replay(emulated_client, TOPIC_DEFINITIONS_PATH, [first, second], workers=0)
+
+    assert checkpoint.published == 2
+    assert emulator.stats["events"] == 2
+
+
+def test_replay_counts_only_delivered_events(tmpdir, emulator, emulated_client):
+    record = build_record(1, eventId="repeated-id")
+    path = write_jsonl(tmpdir.join("events.jsonl"), [record, build_record(2), record])
+
+    checkpoint = replay(emulated_client, TOPIC_DEFINITIONS_PATH, [path], workers=0, batch_size=1)
+
+    assert checkpoint.published == 2
+    assert checkpoint.duplicates == 1
+
+    emulator.respond = lambda path, payload: (
+        200,
+        {"failedRecords": len(payload), "records": ["ValidationException"] * len(payload)},
+    )
+    path = write_jsonl(tmpdir.join("rejected.jsonl"), [build_record(3)])
+
+    checkpoint = replay(emulated_client, TOPIC_DEFINITIONS_PATH, [path], workers=0)
+
+    assert checkpoint.published == 0
+    assert checkpoint.rejected == 1
+
+
+def test_replay_resumes(tmpdir, emulator, emulated_client, monkeypatch):
+    path = write_jsonl(tmpdir.join("events.jsonl"), [build_record(i) for i in range(100)])
+    checkpoint_path = str(tmpdir.join("checkpoint.json"))
+
+    send_chunk = emulated_client._send_bulk_chunk
+    sent = []
+
+    def fail_third_batch(chunk):
+        sent.append(chunk)
+        if len(sent) == 3:
+            raise Exception("API unavailable")
+        return send_chunk(chunk)
+
+    monkeypatch.setattr(emulated_client, "_send_bulk_chunk", fail_third_batch)
+    with pytest.raises(Exception, match="API unavailable"):
+        replay(emulated_client, TOPIC_DEFINITIONS_PATH, [path], ReplayCheckpoint(checkpoint_path), 0, batch_size=30)
+
+    assert ReplayCheckpoint(checkpoint_path).published == 60
+
+    # A new process, without the acknowledged events cached
+    client = EventClient(emulator.url, "BcEventsUnitTests", TOPIC_DEFINITIONS_PATH)
+    checkpoint = replay(client, TOPIC_DEFINITIONS_PATH, [path], ReplayCheckpoint(checkpoint_path), 0, batch_size=30)
+    client.close()
+
+    assert checkpoint.published == 100
+    assert emulator.stats["events"] == 100
+    assert emulator.stats["duplicates"] == 0
+
+
+def test_replay_with_worker_processes(tmpdir, emulator, emulated_client):
+    path = write_jsonl(tmpdir.join("events.jsonl"), [build_record(i) for i in range(100)] + ["{}"])
+
+    checkpoint = replay(emulated_client, TOPIC_DEFINITIONS_PATH, [path], workers=2, batch_size=20)
+
+    assert checkpoint.published == 100
+    assert checkpoint.invalid == 1
+    assert emulator.stats["events"] == 100
+
+
+def test_replay_command(tmpdir, emulator, capsys):
+    path = write_jsonl(tmpdir.join("events.jsonl"), [build_record(i) for i in range(10)])
+    checkpoint_path = str(tmpdir.join("checkpoint.json"))
+    argv = ["replay", TOPIC_DEFINITIONS_PATH, path, "--api-url", emulator.url, "--checkpoint", checkpoint_path]
+
+    assert not main(argv + ["--workers", "0"])
+    assert "Replayed 10 events, skipped 0 invalid lines and 0 duplicate events" in capsys.readouterr().out
+
+    # Everything was already replayed
+    assert not main(argv + ["--workers", "0"])
+    assert emulator.stats["events"] == 10
+    assert emulator.stats["requests"] == 1
@@ -1,9 +1,14 @@
+import threading
+import time
 from unittest.mock import Mock
 
 import pytest
+from jsonschema import ValidationError
 
-from bc_events import EventSession
+from bc_events import BulkPublishError, EventSession
+from bc_events.buffer import EventBuffer
 from bc_events.constants import ACTOR_TYPE_SERVICE
+from bc_events.event import Event
 
 
 @pytest.fixture
@@ -77,7 +82,7 @@ def test_flush_few_events(user_session):
 
 
 def test_flush_max_events(user_session, events_api_wrapper_invoke_mock):
-    mock = Mock()
+    mock = Mock(encoded=b"{}")
     user_session.events = [mock] * 250
 
     user_session.flush()
@@ -86,7 +91,7 @@ def test_flush_max_events(user_session, events_api_wrapper_invoke_mock):
 
 
 def test_flush_more_than_max_events(user_session, events_api_wrapper_invoke_mock):
-    user_session.events = [Mock()] * (250 * 2 + 100)
+    user_session.events = [Mock(encoded=b"{}")] * (250 * 2 + 100)
 
     user_session.flush()
 
@@ -103,3 +108,233 @@ def test_rollback(user_session):
     user_session.rollback()
 
     assert len(user_session.events) == 0
+
+
+def test_flush_background_dispatch(user_session):
+    fake_event = Mock()
+    user_session.events = [fake_event]
+    user_session.client.dispatcher = Mock()
+
+    user_session.flush()
+
+    fake_event.validate.assert_called_once()
+    fake_event.publish.assert_not_called()
+    user_session.client.dispatcher.submit.assert_called_once_with([fake_event])
+
+
+def sent_or_skipped(session, result):
+    """Events that were published, or skipped because the session's client has no url"""
+    return result.published if session.client.publish_bulk_url else result.skipped
+
+
+def test_publish_bulk_result(user_session, post_mock):
+    result = user_session.publish_bulk([Mock(encoded=b"{}") for _ in range(250 + 10)])
+
+    assert sent_or_skipped(user_session, result) == 260
+    assert result.rejected == 0
+    assert result.failed == 0
+    assert len(result.responses) == 2
+
+
+def test_publish_bulk_result_counts_only_accepted_events(user_session, monkeypatch):
+    events = [Mock(encoded=b"{}") for _ in range(3)]
+    monkeypatch.setattr(user_session.client, "_send_bulk_chunk", Mock(return_value=(None, 1, 1)))
+
+    result = user_session.publish_bulk(events)
+
+    assert (result.published, result.rejected, result.skipped) == (1, 1, 1)
+
+
+def test_publish_bulk_failure_raises_with_result(user_session, monkeypatch):
+    events = [Mock(encoded=b"{}") for _ in range(600)]
+    error = ConnectionError("API down")
+    send = Mock(side_effect=[(None, 250, 0), error])
+    monkeypatch.setattr(user_session.client, "_send_bulk_chunk", send)
+
+    with pytest.raises(BulkPublishError, match="250 of 500 events failed") as err:
+        user_session.publish_bulk(events)
+
+    assert err.value.__cause__ is error
+    assert err.value.result.published == 250
+    assert [index for index, _, _ in err.value.result.failures] == [1]
+    assert send.call_count == 2
+
+
+def test_publish_bulk_concurrently(user_session, post_mock):
+    result = user_session.publish_bulk([Mock(encoded=b"{}") for _ in range(250 * 4)], concurrency=4)
+
+    assert sent_or_skipped(user_session, result) == 1000
+    assert post_mock.call_count == 4 or user_session.client.publish_bulk_url is None
+
+
+def test_publish_bulk_concurrently_collects_failures(user_session, monkeypatch):
+    events = [Mock(encoded=b"{}") for _ in range(600)]
+
+    def publish_chunk(event_data):
+        if event_data[0] is events[250]:
+            raise Exception("chunk failed")
+        return None, len(event_data), 0
+
+    publish_chunk_mock = Mock(side_effect=publish_chunk)
+    monkeypatch.setattr(user_session.client, "_send_bulk_chunk", publish_chunk_mock)
+
+    with pytest.raises(BulkPublishError, match="250 of 600 events failed") as err:
+        user_session.publish_bulk(events, concurrency=3)
+
+    result = err.value.result
+    assert publish_chunk_mock.call_count == 3
+    assert result.published == 350
+    assert [index for index, _, _ in result.failures] == [1]
+
+
+def test_publish_bulk_by_size(user_session, post_mock):
+    user_session.client.max_bulk_bytes = 100
+    events = [Mock(encoded=b"x" * 30) for _ in range(10)]
+
+    result = user_session.publish_bulk(events)
+
+    # Three 30 byte events (plus commas and brackets) fit in 100 bytes
+    assert sent_or_skipped(user_session, result) == 10
+    assert len(result.responses) == 4
+
+
+def test_magic_call_memoized(user_session, client):
+    publisher = user_session.created_test
+
+    assert user_session.created_test is publisher
+    assert client.resolve_shortcut("created_test") is client.get_topic("testing", "Test", "Created")
+
+
+def test_magic_call_incorrect_not_memoized(user_session, client):
+    with pytest.raises(AttributeError):
+        user_session.tested_create
+
+    assert not hasattr(user_session, "deleted_nothing")
+    assert client.resolve_shortcut("tested_create") is None
+    assert "tested_create" not in client._shortcuts
+    assert "deleted_nothing" not in client._shortcuts
+
+
+def test_private_names_are_not_shortcuts(user_session):
+    with pytest.raises(AttributeError):
+        user_session._created_test
+
+
+def test_columnar_session(client, job_id, created_test_payload, post_mock):
+    session = EventSession("USER_ID", ACTOR_TYPE_SERVICE, job_id, client, columnar=True)
+    for _ in range(10):
+        session.created_test(created_test_payload)
+
+    assert isinstance(session.events, EventBuffer)
+    assert len(session.events) == 10
+    assert session.events[0].data == created_test_payload
+
+    result = session.publish_bulk(session.events)
+    assert sent_or_skipped(session, result) == 10
+
+    session.rollback()
+    assert isinstance(session.events, EventBuffer)
+    assert len(session.events) == 0
+
+
+def test_session_has_no_instance_dict(user_session):
+    assert not hasattr(user_session, "__dict__")
+
+
+def test_publish_stream(user_session, created_test_payload, monkeypatch):
+    chunks = []
+    monkeypatch.setattr(
+        user_session.client, "_send_bulk_chunk", lambda chunk: chunks.append(chunk) or (None, len(chunk), 0)
+    )
+    topic = user_session.client.get_topic("testing", "Test", "Created")
+
+    def items():
+        for i in range(300):
+            yield ("testing.TestCreated", created_test_payload) if i % 2 else (topic, created_test_payload)
+        yield Event(topic=topic, data=created_test_payload, session=user_session)
+
+    result = user_session.publish_stream(items())
+
+    assert result.published == 301
+    assert [len(chunk) for chunk in chunks] == [250, 51]
+    assert all(str(event) == "testing.TestCreated" for event in chunks[1])
+    assert len(user_session.events) == 0
+
+
+def test_publish_stream_bounds_chunks_in_flight(user_session, created_test_payload, monkeypatch):
+    read = []
+    sent = []
+    lock = threading.Lock()
+
+    def items():
+        for i in range(250 * 8):
+            read.append(i)
+            yield ("testing.TestCreated", created_test_payload)
+
+    def publish_chunk(chunk):
+        with lock:
+            # Only the chunks in flight, the one being filled and the event that closed it are read but not sent
+            assert len(read) - len(sent) <= 250 * (3 + 1) + 1
+        time.sleep(0.001)
+        with lock:
+            sent.extend(chunk)
+        return None, len(chunk), 0
+
+    monkeypatch.setattr(user_session.client, "_send_bulk_chunk", publish_chunk)
+    result = user_session.publish_stream(items(), concurrency=2, max_in_flight=3)
+
+    assert result.published == 250 * 8
+    assert len(sent) == 250 * 8
+
+
+def test_publish_stream_collects_failures(user_session, created_test_payload, monkeypatch):
+    def publish_chunk(chunk):
+        if chunk[0].data["id"] == "250":
+            raise Exception("chunk failed")
+        return None, len(chunk), 0
+
+    monkeypatch.setattr(user_session.client, "_send_bulk_chunk", publish_chunk)
+    items = (("testing.TestCreated", dict(created_test_payload, id=str(i))) for i in range(600))
+
+    with pytest.raises(BulkPublishError, match="250 of 600 events failed") as err:
+        user_session.publish_stream(items, concurrency=3)
+
+    assert [index for index, _, _ in err.value.result.failures] == [1]
+
+
+def test_publish_stream_validates(user_session, created_test_payload):
+    with pytest.raises(BulkPublishError, match="testing.TestExploded") as err:
+        user_session.publish_stream([("testing.TestExploded", created_test_payload)])
+    assert isinstance(err.value.__cause__, ValueError)
+
+    with pytest.raises(BulkPublishError) as err:
+        user_session.publish_stream([("testing.TestCreated", {"id": "MyTestId"})])
+    assert isinstance(err.value.__cause__, ValidationError)
+    assert err.value.result.failures == [(0, [], err.value.__cause__)]
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_publish_stream_keeps_partial_result(user_session, created_test_payload, monkeypatch, concurrency):
+    def publish_chunk(chunk):
+        if chunk[0].data["id"] == "250":
+            raise Exception("chunk failed")
+        return None, len(chunk), 0
+
+    monkeypatch.setattr(user_session.client, "_send_bulk_chunk", publish_chunk)
+
+    def items():
+        for i in range(750):
+            yield ("testing.TestCreated", dict(created_test_payload, id=str(i)))
+        yield ("testing.TestCreated", {"id": "MyTestId"})
+
+    with pytest.raises(BulkPublishError) as err:
+        user_session.publish_stream(items(), concurrency=concurrency)
+
+    result = err.value.result
+    failures = [(index, len(chunk), type(e)) for index, chunk, e in result.failures]
+    if concurrency == 1:
+        assert failures == [(1, 250, Exception)]
+    else:
+        assert failures == [(1, 250, Exception), (2, 0, ValidationError)]
+    assert result.published == 250
+    assert str(err.value.__cause__) == "chunk failed"
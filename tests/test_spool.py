@@ -0,0 +1,216 @@
+import fcntl
+import os
+import subprocess
+import sys
+import threading
+from unittest.mock import Mock
+
+import pytest
+import requests
+
+from bc_events import EventClient
+from bc_events.constants import SPOOL_FSYNC_ALWAYS
+from bc_events.spool import ACTIVE_SUFFIX, LOCK_NAME, SEALED_SUFFIX, EventSpool
+from bc_events.utils import EventsApiRetryingWrapper
+
+encoded_events = [b'{"id":"1"}', b'{"id":"2"}', b'{"id":"3"}']
+
+
+@pytest.fixture
+def spool(tmpdir):
+    return EventSpool(str(tmpdir.join("spool")), segment_bytes=1024)
+
+
+def segment_names(spool, suffix):
+    return sorted(name for name in os.listdir(spool.directory) if name.endswith(suffix))
+
+
+def test_unknown_fsync_policy(tmpdir):
+    with pytest.raises(ValueError, match="nope"):
+        EventSpool(str(tmpdir), fsync="nope")
+
+
+def test_append(spool):
+    spool.append(encoded_events)
+
+    assert len(segment_names(spool, ACTIVE_SUFFIX)) == 1
+    assert spool.size() == sum(len(encoded) + 1 for encoded in encoded_events)
+
+
+def test_append_fsync_always(tmpdir):
+    spool = EventSpool(str(tmpdir), fsync=SPOOL_FSYNC_ALWAYS)
+    spool.append(encoded_events)
+
+    assert spool.size() > 0
+
+
+def test_rotation(spool):
+    for _ in range(100):
+        spool.append(encoded_events)
+
+    assert len(segment_names(spool, SEALED_SUFFIX)) >= 3
+    assert len(segment_names(spool, ACTIVE_SUFFIX)) <= 1
+
+
+def test_max_bytes_drops_oldest_segments(tmpdir):
+    spool = EventSpool(str(tmpdir), segment_bytes=100, max_bytes=300)
+
+    for _ in range(50):
+        spool.append(encoded_events)
+
+    assert spool.size() <= 300
+    assert spool.dropped > 0
+
+
+def test_recover_trims_partial_write(tmpdir):
+    directory = str(tmpdir)
+    with open(os.path.join(directory, "{0:020d}{1}".format(0, ACTIVE_SUFFIX)), "wb") as segment:
+        segment.write(b'{"id":"1"}\n{"id":')
+
+    spool = EventSpool(directory)
+
+    assert segment_names(spool, ACTIVE_SUFFIX) == []
+    with open(os.path.join(directory, segment_names(spool, SEALED_SUFFIX)[0]), "rb") as segment:
+        assert segment.read() == b'{"id":"1"}\n'
+
+
+def test_recover_leaves_live_processes_segments(tmpdir):
+    directory = str(tmpdir)
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    live_path = os.path.join(directory, "{0:020d}-{1}{2}".format(0, os.getppid(), ACTIVE_SUFFIX))
+    dead_path = os.path.join(directory, "{0:020d}-{1}{2}".format(1, exited.pid, ACTIVE_SUFFIX))
+    for path in (live_path, dead_path):
+        with open(path, "wb") as segment:
+            segment.write(b'{"id":"1"}\n')
+
+    spool = EventSpool(directory)
+
+    assert segment_names(spool, ACTIVE_SUFFIX) == [os.path.basename(live_path)]
+    assert segment_names(spool, SEALED_SUFFIX) == ["{0:020d}-{1}{2}".format(1, exited.pid, SEALED_SUFFIX)]
+
+
+def test_recover_leaves_other_spools_in_this_process_alone(tmpdir):
+    directory = str(tmpdir)
+    first = EventSpool(directory)
+    first.append(encoded_events)
+
+    second = EventSpool(directory)
+    second.replay(Mock(publish_bulk_url=None))
+
+    assert segment_names(first, ACTIVE_SUFFIX) == [os.path.basename(first._active_path)]
+
+
+def test_startup_does_not_wait_for_another_process_to_replay(tmpdir):
+    directory = str(tmpdir)
+    EventSpool(directory)
+    started = []
+
+    with open(os.path.join(directory, LOCK_NAME), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        thread = threading.Thread(target=lambda: started.append(EventSpool(directory)))
+        thread.start()
+        thread.join(5)
+
+    assert len(started) == 1
+
+
+def test_replay_skips_while_another_process_replays(spool, service_name, topic_definitions, post_mock):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions)
+    spool.append(encoded_events)
+
+    with open(os.path.join(spool.directory, LOCK_NAME), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        assert spool.replay(client) == 0
+
+    post_mock.assert_not_called()
+    assert spool.replay(client) == 3
+
+
+def test_replay(spool, service_name, topic_definitions, post_mock):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions, max_bulk_events=2)
+    spool.append(encoded_events)
+
+    assert spool.replay(client) == 3
+    assert spool.size() == 0
+    # Three events, at most two per bulk request
+    assert post_mock.call_count == 2
+
+
+def test_replay_logs_and_drops_rejected_records(spool, service_name, topic_definitions, monkeypatch, caplog):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions)
+    responses = iter(
+        [
+            {"failedRecords": 1, "records": ["Success", "ValidationException", "Success"]},
+            {"failedRecords": 0, "records": []},
+        ]
+    )
+    post = Mock(side_effect=lambda *args, **kwargs: Mock(status_code=201, json=Mock(return_value=next(responses))))
+    monkeypatch.setattr("requests.Session.post", post)
+    spool.append(encoded_events)
+
+    assert spool.replay(client) == 2
+    assert spool.size() == 0
+    rejected = [record for record in caplog.records if "rejected" in record.getMessage()]
+    assert rejected[0].context == {"records": ['{"id":"2"}']}
+
+
+def test_replay_keeps_segments_with_undelivered_records(spool, service_name, topic_definitions, monkeypatch):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions)
+    response = Mock(status_code=502, json=Mock(side_effect=ValueError("Bad Gateway")))
+    monkeypatch.setattr("requests.Session.post", Mock(return_value=response))
+    spool.append(encoded_events)
+
+    assert spool.replay(client) == 0
+    assert len(segment_names(spool, SEALED_SUFFIX)) == 1
+
+
+def test_client_does_not_spool_programming_errors(spool, service_name, topic_definitions, monkeypatch):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions, spool=spool)
+    monkeypatch.setattr(EventsApiRetryingWrapper, "invoke", Mock(side_effect=TypeError("bug")))
+
+    with pytest.raises(TypeError, match="bug"):
+        client._publish_bulk_chunk([Mock(encoded=encoded, event_id=None) for encoded in encoded_events])
+    assert spool.size() == 0
+
+
+def test_replay_stops_on_failure(spool, service_name, topic_definitions, monkeypatch):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions)
+    monkeypatch.setattr(EventsApiRetryingWrapper, "invoke", Mock(side_effect=Exception("API down")))
+    spool.append(encoded_events)
+
+    assert spool.replay(client) == 0
+    assert len(segment_names(spool, SEALED_SUFFIX)) == 1
+
+
+def test_client_spools_undeliverable_events(spool, service_name, topic_definitions, created_test_payload, monkeypatch):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions, spool=spool)
+    monkeypatch.setattr(
+        EventsApiRetryingWrapper, "invoke", Mock(side_effect=requests.exceptions.ConnectionError("API down"))
+    )
+
+    session = client.service_session("JOB_ID")
+    session.created_test(created_test_payload)
+    session.flush()
+    client.close(timeout=1)
+
+    segments = segment_names(spool, SEALED_SUFFIX)
+    with open(os.path.join(spool.directory, segments[0]), "rb") as segment:
+        assert segment.read() == session.events[0].encoded + b"\n"
+
+
+def test_client_spools_bulk_remainder(spool, service_name, topic_definitions, monkeypatch):
+    client = EventClient("https://fake-site.britecore.com", service_name, topic_definitions, spool=spool)
+
+    def invoke(events_api):
+        # The first record made it, the rest never did
+        events_api.payload = events_api.payload[1:]
+        raise requests.exceptions.ConnectionError("API down")
+
+    monkeypatch.setattr(EventsApiRetryingWrapper, "invoke", invoke)
+
+    client._publish_bulk_chunk([Mock(encoded=encoded) for encoded in encoded_events])
+    client.close(timeout=1)
+
+    with open(os.path.join(spool.directory, segment_names(spool, SEALED_SUFFIX)[0]), "rb") as segment:
+        assert segment.read().splitlines() == encoded_events[1:]
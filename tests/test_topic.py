@@ -0,0 +1,30 @@
+import sys
+
+import pytest
+from jsonschema import ValidationError
+
+from bc_events.topic import Topic
+
+
+@pytest.fixture
+def topic():
+    return Topic(category="testing", entity="Test", action="Created", schema={"type": "object", "required": ["id"]})
+
+
+def test_name(topic):
+    assert topic.name == "testing.TestCreated"
+
+
+def test_validator_is_cached(topic):
+    assert topic.validator is topic.validator
+
+
+def test_validator_validates_schema(topic):
+    topic.validator.validate({"id": "MyTestId"})
+
+    with pytest.raises(ValidationError, match="'id' is a required property"):
+        topic.validator.validate({})
+
+
+def test_name_is_interned(topic):
+    assert topic.name is sys.intern("testing." + "TestCreated")
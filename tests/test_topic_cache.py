@@ -0,0 +1,108 @@
+import json
+import os
+import pickle
+from unittest.mock import Mock
+
+import pytest
+from jsonschema import SchemaError
+
+from bc_events import EventClient, topic_cache
+from bc_events.__main__ import main
+from bc_events.topic_cache import build_topic_cache, get_cache_path, load_topic_table
+
+TOPIC_DEFINITIONS_PATH = "tests/test_events.yaml"
+
+
+@pytest.fixture
+def content():
+    with open(TOPIC_DEFINITIONS_PATH, "rb") as topic_file:
+        return topic_file.read()
+
+
+@pytest.fixture
+def cache_dir(tmpdir):
+    return str(tmpdir.join("topic-cache"))
+
+
+def test_load_without_cache(content):
+    default_category, topic_table = load_topic_table(content)
+
+    assert default_category == "testing"
+    assert len(topic_table) == 3
+
+
+def test_load_builds_then_reuses_cache(content, cache_dir, monkeypatch):
+    _, built_table = load_topic_table(content, cache_dir)
+
+    assert os.path.exists(get_cache_path(content, cache_dir))
+
+    parse_mock = Mock()
+    monkeypatch.setattr(topic_cache, "parse_topic_definitions", parse_mock)
+    default_category, cached_table = load_topic_table(content, cache_dir)
+
+    parse_mock.assert_not_called()
+    assert default_category == "testing"
+    assert sorted(cached_table) == sorted(built_table)
+    for name, topic in cached_table.items():
+        assert topic.schema == built_table[name].schema
+        assert topic.check_schema is False
+
+
+def test_cache_keyed_by_content(content, cache_dir):
+    assert get_cache_path(content, cache_dir) == get_cache_path(content.decode("utf-8"), cache_dir)
+    assert get_cache_path(content, cache_dir) != get_cache_path(content + b"\n", cache_dir)
+
+
+@pytest.mark.parametrize("cached", [b"not json", pickle.dumps({"default_category": None, "topics": []})])
+def test_unreadable_cache_is_rebuilt(content, cache_dir, cached):
+    os.makedirs(cache_dir)
+    with open(get_cache_path(content, cache_dir), "wb") as cache_file:
+        cache_file.write(cached)
+
+    _, topic_table = load_topic_table(content, cache_dir)
+
+    assert len(topic_table) == 3
+
+
+def test_cache_is_json(content, cache_dir):
+    cache_path, default_category, topic_table = build_topic_cache(content, cache_dir)
+
+    with open(cache_path, encoding="utf-8") as cache_file:
+        cached = json.load(cache_file)
+
+    assert cached["default_category"] == default_category
+    assert [tuple(topic) for topic in cached["topics"]] == [
+        (topic.category, topic.entity, topic.action, topic.schema) for topic in topic_table.values()
+    ]
+
+
+def test_schemas_json_cant_hold_are_not_cached(cache_dir):
+    content = b"Topics:\n  - {Category: testing, Entity: Test, Action: Created, Schema: {default: 2018-09-07}}\n"
+
+    _, topic_table = load_topic_table(content, cache_dir)
+
+    assert list(topic_table) == ["testing.TestCreated"]
+    assert not os.path.exists(get_cache_path(content, cache_dir))
+
+
+def test_build_cache_checks_schemas(cache_dir):
+    content = b"Topics:\n  - {Category: testing, Entity: Test, Action: Created, Schema: {type: 5}}\n"
+
+    with pytest.raises(SchemaError):
+        build_topic_cache(content, cache_dir)
+
+    assert not os.path.exists(get_cache_path(content, cache_dir))
+
+
+def test_client_uses_cache(cache_dir, content):
+    client = EventClient(None, "BcEventsUnitTests", TOPIC_DEFINITIONS_PATH, topic_cache_dir=cache_dir)
+
+    assert len(client.topic_table) == 3
+    assert os.path.exists(get_cache_path(content, cache_dir))
+
+
+def test_build_cache_command(cache_dir, content, capsys):
+    main(["build-cache", TOPIC_DEFINITIONS_PATH, "--cache-dir", cache_dir])
+
+    assert os.path.exists(get_cache_path(content, cache_dir))
+    assert "Cached 3 topics" in capsys.readouterr().out
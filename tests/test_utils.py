@@ -1,10 +1,12 @@
+import json
 from collections import namedtuple
 from unittest.mock import Mock
 
 import pytest
 import requests
+from jsonschema import SchemaError, ValidationError
 
-from bc_events.utils import EventsApiRetryingWrapper
+from bc_events.utils import JSON_HEADERS, EventsApiRetryingWrapper, build_validator, chunk_events, json_dumps
 
 single_event = {
     "action": "Create",
@@ -37,7 +39,7 @@ def create_sample_response(response, status_code):
 
 @pytest.fixture(
     params=[
-        ("https://some_url.com/events/", single_event, {"x-britecore-job-id", "1234567"}),
+        ("https://some_url.com/events/", single_event, {"x-britecore-job-id": "1234567"}),
         ("https://some_url.com/events/bulk/", bulk_events, {}),
     ]
 )
@@ -181,3 +183,70 @@ def test_invoke_without_events_retries(events_api_wrapper, monkeypatch):
 
     events_api_wrapper.invoke()
     assert requests_mock.call_count == 1
+
+
+def test_build_validator():
+    validator = build_validator({"type": "object", "required": ["message"]})
+
+    validator.validate({"message": "hello"})
+    with pytest.raises(ValidationError):
+        validator.validate({})
+
+
+def test_build_validator_invalid_schema():
+    with pytest.raises(SchemaError):
+        build_validator({"type": 5})
+
+
+def test_post_uses_session(events_api_wrapper):
+    session_mock = Mock()
+    events_api_wrapper.session = session_mock
+
+    events_api_wrapper.post()
+
+    session_mock.post.assert_called_once_with(
+        events_api_wrapper.url,
+        data=json_dumps(events_api_wrapper.payload),
+        headers=dict(JSON_HEADERS, **events_api_wrapper.headers),
+    )
+
+
+def test_chunk_events_by_count():
+    events = [Mock(encoded=b"{}") for _ in range(7)]
+
+    chunks = list(chunk_events(events, max_events=3, max_bytes=1024))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert sum(chunks, []) == events
+
+
+def test_chunk_events_by_size():
+    events = [Mock(encoded=b"x" * size) for size in [10, 10, 80, 10, 500]]
+
+    chunks = list(chunk_events(events, max_events=250, max_bytes=100))
+
+    # An event too large to share a chunk is sent on its own
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_body_joins_encoded_events():
+    events_api = EventsApiRetryingWrapper("https://some_url.com/events/bulk/", [b'{"a":1}', b'{"b":2}'])
+
+    assert events_api.body() == b'[{"a":1},{"b":2}]'
+
+
+def test_body_after_partial_failure_keeps_encoding():
+    fragments = [b'{"a":1}', b'{"b":2}', b'{"c":3}']
+    events_api = EventsApiRetryingWrapper("https://some_url.com/events/bulk/", fragments)
+
+    sample_response = create_sample_response(
+        {"failedRecords": 1, "records": ["Success", "InternalFailureException", "Success"]}, 201
+    )
+    events_api.retry_if_we_need_to(sample_response)
+
+    assert events_api.payload == [fragments[1]]
+    assert events_api.body() == b'[{"b":2}]'
+
+
+def test_json_dumps():
+    assert json.loads(json_dumps(single_event).decode("utf-8")) == single_event